@@ -0,0 +1,222 @@
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Callable
+
+import numpy as np
+
+from src.agents.additional_alerting_system.alert_store import AlertStore
+from src.agents.navigation_manager.route_planner import RoutePlanner
+from src.agents.road_condition_reporter.road_condition_delta import CONDITION_MULTIPLIERS
+from src.agents.vehicle_navigator.vehicle_simulator import VehicleSimulator
+from src.city_generator import CITY_LAYOUTS, generate_city, write_city
+from src.codec import CODECS, configure_codec
+from src.compact_graph import CompactGraph
+from src.landmarks import LandmarkRouter
+from src.regions import BoundaryRouter, RegionMap
+from src.simulation.fleet import FleetSimulator, passable_mask
+from src.utils import load_graph, load_lights, shortest_path
+
+
+def measure(operation: Callable[[int], object], repeat: int) -> list[float]:
+    """
+    Latencies in seconds of operation(i) for i in range(repeat)
+    """
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(name: str, nodes: int, samples: list[float], items: int = 1) -> dict:
+    """
+    Throughput in items per second (an operation may handle many items, e.g. vehicles in a tick)
+    and latency percentiles in milliseconds
+    """
+    ms = np.asarray(samples) * 1000
+    return {
+        "benchmark": name,
+        "nodes": nodes,
+        "runs": len(samples),
+        "throughput": items * len(samples) / max(sum(samples), 1e-12),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def run_benchmarks(
+    nodes: int, layout: str, queries: int, vehicles: int, landmarks: int, seed: int, regions: int = 0
+) -> list[dict]:
+    rng = random.Random(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        graph_path = os.path.join(directory, "graph.json")
+        lights_path = os.path.join(directory, "traffic_lights.json")
+        write_city(*generate_city(nodes, layout, seed=seed), graph_path, lights_path)
+
+        results.append(summarize("load_graph", nodes, measure(lambda _: load_graph(graph_path), 3)))
+        graph = load_graph(graph_path)
+        lights = load_lights(lights_path)
+        results.append(summarize("to_compact_graph", nodes, measure(lambda _: CompactGraph.from_networkx(graph), 3)))
+        compact = CompactGraph.from_networkx(graph)
+
+    names = list(graph.nodes)
+    pairs = [tuple(rng.sample(names, 2)) for _ in range(queries)]
+    results.append(
+        summarize("route_networkx", nodes, measure(lambda i: shortest_path(graph, *pairs[i]), queries))
+    )
+    results.append(
+        summarize("route_compact_dijkstra", nodes, measure(lambda i: compact.shortest_path(*pairs[i]), queries))
+    )
+    if landmarks:
+        routers = []
+        results.append(
+            summarize("alt_build", nodes, measure(lambda _: routers.append(LandmarkRouter(compact, landmarks)), 1))
+        )
+        router = routers[0]
+        results.append(summarize("route_alt", nodes, measure(lambda i: router.shortest_path(*pairs[i]), queries)))
+    if regions > 1:
+        region_maps = []
+        results.append(
+            summarize("partition", nodes, measure(lambda _: region_maps.append(RegionMap.partition(compact, regions)), 1))
+        )
+        boundary_routers = []
+        results.append(
+            summarize(
+                "boundary_build", nodes, measure(lambda _: boundary_routers.append(BoundaryRouter(compact, region_maps[0])), 1)
+            )
+        )
+        boundary_router = boundary_routers[0]
+        results.append(
+            summarize("route_stitched", nodes, measure(lambda i: boundary_router.shortest_path(*pairs[i]), queries))
+        )
+
+    # deltas as sent by the road condition reporter, a few busy edges every period
+    planner = RoutePlanner(compact.copy(), landmarks=landmarks)
+    planner.apply_road_condition_snapshot(compact.copy(), 0)
+    edge_ids = compact.edge_id.tolist()
+    conditions = list(CONDITION_MULTIPLIERS)
+    deltas = [
+        [(edge_id, condition, CONDITION_MULTIPLIERS[condition]) for edge_id, condition in
+         zip(rng.sample(edge_ids, min(10, len(edge_ids))), rng.choices(conditions, k=10))]
+        for _ in range(queries)
+    ]
+    results.append(
+        summarize(
+            "road_condition_delta",
+            nodes,
+            measure(lambda i: planner.apply_road_condition_delta(i + 1, deltas[i]), queries),
+            items=10,
+        )
+    )
+    routes = {vehicle_id: compact.shortest_path(*pairs[vehicle_id % queries]) for vehicle_id in range(10)}
+
+    def build_alerts(_):
+        # all alerts from scratch, as a snapshot for a receiver that missed a version
+        rebuilt = AlertStore(compact)
+        rebuilt.set_routes({str(vehicle_id): route for vehicle_id, route in routes.items()})
+        rebuilt.snapshot()
+
+    results.append(summarize("alert_store_build", nodes, measure(build_alerts, queries), items=10))
+    # the alerting agent keeps alerts in a store and sends only diffs, here one route changes per period
+    store = AlertStore(compact)
+    store.set_routes({str(vehicle_id): route for vehicle_id, route in routes.items()})
+    store.take_diff()
+
+    detours = [compact.shortest_path(*pairs[(vehicle_id + 10) % queries]) for vehicle_id in range(10)]
+
+    def change_route(i):
+        store.update_route(str(i % 10), detours[i % 10] if i % 20 < 10 else routes[i % 10])
+        store.take_diff()
+
+    results.append(summarize("alert_store_diff", nodes, measure(change_route, queries)))
+
+    # simulator ticks, routes are reused from a pool, computing one per vehicle would dominate the setup
+    pool = [compact.shortest_path(*pair) for pair in pairs]
+    pool = [route for route in pool if len(route) > 2] or [compact.shortest_path(*pairs[0])]
+    fleet = FleetSimulator(compact)
+    fleet.add_vehicles([pool[i % len(pool)] for i in range(vehicles)])
+    passable = passable_mask({id_: ptl.get_traffic_light() for id_, ptl in lights.items()})
+    results.append(
+        summarize("fleet_tick", nodes, measure(lambda _: fleet.tick(0.1, passable), 100), items=vehicles)
+    )
+    simulators = []
+    for i in range(min(vehicles, 1000)):
+        simulator = VehicleSimulator(compact, pool[i % len(pool)][0], pool[i % len(pool)][-1])
+        simulator.plan = pool[i % len(pool)]
+        simulators.append(simulator)
+
+    def step_all(_):
+        for simulator in simulators:
+            simulator.step_sync(0.1, lambda id_: lights[id_].get_traffic_light() if id_ in lights else None)
+
+    results.append(summarize("vehicle_simulator_tick", nodes, measure(step_all, 20), items=len(simulators)))
+
+    # encode + decode of the most frequent message (positions) and of routes, which grow with the city
+    position = {
+        "node1": pool[0][0],
+        "node2": pool[0][1],
+        "vehicle_id": 1,
+        "isEmergency": False,
+        "position_on_edge": 1.5,
+        "speed": 3,
+        "waiting": False,
+        "reported_at": 1700000000.0,
+    }
+    for name in CODECS:
+        codec = configure_codec(name, names)
+        results.append(
+            summarize(
+                f"codec_{name}_position",
+                nodes,
+                measure(lambda _: codec.decode("send_vehicle_position", codec.encode("send_vehicle_position", position)), 1000),
+            )
+        )
+        results.append(
+            summarize(
+                f"codec_{name}_route",
+                nodes,
+                measure(lambda i: codec.decode("route_response", codec.encode("route_response", {"route": pool[i % len(pool)]})), 100),
+            )
+        )
+    configure_codec("json")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times routing, road condition updates, alerts and ticks on synthetic cities")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated numbers of intersections")
+    parser.add_argument("--layout", choices=CITY_LAYOUTS, default="planar")
+    parser.add_argument("--queries", type=int, default=20, help="route queries (and other operations) per size")
+    parser.add_argument("--vehicles", type=int, default=100000, help="vehicles in the fleet tick benchmark")
+    parser.add_argument("--landmarks", type=int, default=8, help="ALT landmarks, 0 skips the ALT benchmarks")
+    parser.add_argument(
+        "--regions", type=int, default=0, help="regions of the stitched routing benchmarks, 0 skips them"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write results to this file, to compare runs")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = []
+    print(f"{'benchmark':<24}{'nodes':>8}{'runs':>6}{'ops/s':>14}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for size in map(int, args.sizes.split(",")):
+        for result in run_benchmarks(
+            size, args.layout, args.queries, args.vehicles, args.landmarks, args.seed, args.regions
+        ):
+            results.append(result)
+            print(
+                f"{result['benchmark']:<24}{result['nodes']:>8}{result['runs']:>6}{result['throughput']:>14.1f}"
+                f"{result['p50_ms']:>10.3f}{result['p90_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['max_ms']:>10.3f}"
+            )
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,21 @@
+import argparse
+
+from src.city_generator import CITY_LAYOUTS, generate_city, write_city
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a synthetic city in the format of data/graph.json")
+    parser.add_argument("nodes", type=int, help="number of intersections")
+    parser.add_argument("--layout", choices=CITY_LAYOUTS, default="grid")
+    parser.add_argument("--light-ratio", type=float, default=0.5, help="share of streets with a traffic light")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--graph", default="data/city_graph.json")
+    parser.add_argument("--lights", default="data/city_traffic_lights.json")
+    args = parser.parse_args()
+
+    graph, traffic_lights = generate_city(args.nodes, args.layout, args.light_ratio, seed=args.seed)
+    write_city(graph, traffic_lights, args.graph, args.lights)
+    print(
+        f"{len(graph['nodes'])} nodes, {len(graph['edges'])} edges, {len(traffic_lights['lights'])} lights "
+        f"-> {args.graph}, {args.lights}"
+    )
@@ -1,73 +1,174 @@
 import asyncio
+import logging
+from functools import partial
 import spade
 import networkx as nx
 import random
 from src.agents.road_condition_reporter.road_condition_reporter import RoadConditionReporter
 from src.agents.traffic_light_controller.traffic_light_controller import TrafficLightControllerAgent
+from src.agents.traffic_light_controller.traffic_light_bank_controller import TrafficLightBankControllerAgent
+from src.agents.traffic_light_controller.messages import traffic_light_controller_jid, traffic_light_district
 from src.agents.traffic_light_controller.physical_traffic_light import PhysicalTrafficLight
 from src.agents.navigation_manager.navigation_manager import NavigatorManagerAgent
 from src.agents.vehicle_navigator.vehicle_simulator import VehicleSimulator
 from src.agents.vehicle_navigator.vehicle_navigator import VehicleNavigator
 from src.agents.additional_alerting_system.additional_alerting_agent import AdditionalAlertingAgent
 from src.agents.visualization.visualization_agent import VisualizerAgent
-from src.utils import load_graph, load_lights
+from src.agents.telemetry_aggregator.telemetry_aggregator import TelemetryAggregatorAgent, telemetry_consumers
+from src.agents.telemetry_aggregator.telemetry_buffer import TelemetryBuffer
+from src.utils import load_graph, load_lights, RoadGraph
+from src.compact_graph import CompactGraph
+from src.codec import configure_codec
+from src.regions import RegionMap, navigation_manager_jid
+from src.launcher import AgentLauncher
+from src.metrics import MetricsExporter
 
-from src.config import SERVER_ADDRESS, PASSWORD
+from src.config import (
+    SERVER_ADDRESS,
+    PASSWORD,
+    COMPACT_GRAPH,
+    LIGHTS_PER_CONTROLLER,
+    VISUALIZER_RECORDING,
+    MESSAGE_CODEC,
+    TELEMETRY_BATCHING,
+    DEAD_RECKONING,
+    NAVIGATION_REGIONS,
+    ROUTE_WORKERS,
+    INSTRUMENTATION,
+    METRICS_FILE,
+    METRICS_EXPORT_PERIOD,
+)
 
 
 async def main():
+    graph: nx.Graph = load_graph("data/graph.json")
+    # node names are interned by index, every agent has to use the same table before sending anything
+    configure_codec(MESSAGE_CODEC, graph.nodes)
+
+    # every process partitions the same graph the same way, so all agents agree on the shard of an edge
+    regions = RegionMap.partition(graph, NAVIGATION_REGIONS) if NAVIGATION_REGIONS > 1 else None
+    managers = regions.manager_jids() if regions is not None else [navigation_manager_jid()]
+
+    def light_managers(ids) -> list[str]:
+        # states of a light go only to the shards owning an edge with it
+        if regions is None:
+            return managers
+        return sorted({jid for id_ in ids for jid in regions.light_manager_jids(id_)})
+
     ptls: dict[int, PhysicalTrafficLight] = load_lights("data/traffic_lights.json")
+    # agents are created by the launcher, a failed start is retried with a fresh instance
     traffic_lights_agents = []
-    for id_, ptl in ptls.items():
-        traffic_lights_agents.append(
-            TrafficLightControllerAgent(f"traffic_light_controller_{id_}@{SERVER_ADDRESS}", PASSWORD, ptl)
-        )
-    for ag in traffic_lights_agents:
-        await ag.start(auto_register=True)
+    if LIGHTS_PER_CONTROLLER:
+        districts: dict[int, dict[int, PhysicalTrafficLight]] = {}
+        for id_, ptl in ptls.items():
+            districts.setdefault(traffic_light_district(id_), {})[id_] = ptl
+        for district_lights in districts.values():
+            traffic_lights_agents.append(
+                partial(
+                    TrafficLightBankControllerAgent,
+                    traffic_light_controller_jid(next(iter(district_lights))),
+                    PASSWORD,
+                    district_lights,
+                    managers=light_managers(district_lights),
+                )
+            )
+    else:
+        for id_, ptl in ptls.items():
+            traffic_lights_agents.append(
+                partial(TrafficLightControllerAgent, traffic_light_controller_jid(id_), PASSWORD, ptl, managers=light_managers([id_]))
+            )
 
-    graph: nx.Graph = load_graph("data/graph.json")
+    # reporter and visualizer work on networkx, routing and simulation can use the compact graph
+    routing_graph: RoadGraph = CompactGraph.from_networkx(graph) if COMPACT_GRAPH else graph
+
+    # shards keep their own graph copy (costs raised by their emergency routes), like in separate processes
+    manager_agents = [
+        partial(
+            NavigatorManagerAgent,
+            jid=jid,
+            password=PASSWORD,
+            graph=routing_graph if regions is None else routing_graph.copy(),
+            traffic_lights=ptls,
+            regions=regions,
+            route_workers=ROUTE_WORKERS,
+        )
+        for jid in managers
+    ]
 
-    manager_agent = NavigatorManagerAgent(jid=f"navigation_manager@{SERVER_ADDRESS}", password=PASSWORD, graph=graph)
-    await manager_agent.start(auto_register=True)
+    # the reporter owns its copy, the manager learns about conditions only through messages
+    # a recording visualizer keeps edge conditions in its frames, so it gets the deltas too
+    road_condition_reporter = partial(
+        RoadConditionReporter,
+        f"road_condition_reporter@{SERVER_ADDRESS}",
+        PASSWORD,
+        graph.copy(),
+        observers=[f"visualizer@{SERVER_ADDRESS}"] if VISUALIZER_RECORDING else [],
+        managers=managers,
+    )
 
-    road_condition_reporter = RoadConditionReporter(f"road_condition_reporter@{SERVER_ADDRESS}", PASSWORD, graph)
-    await road_condition_reporter.start(auto_register=True)
+    consumers = telemetry_consumers(managers)
+    telemetry = TelemetryBuffer(consumer for consumer, *_ in consumers) if TELEMETRY_BATCHING else None
 
     vehicle_navigators = []
     for i in range(4):
         start_node: str = random.choice(list(graph.nodes))
         finish_node: str = random.choice(list(graph.nodes))
-        vehicle_simulator = VehicleSimulator(graph, start_node, finish_node)
+        vehicle_simulator = VehicleSimulator(routing_graph, start_node, finish_node)
         # create vehicle navigator agent for emergency vehicle with id 4
         isEmergency = i == 3
-        vehicle_simulator_for_emergency = VehicleSimulator(graph, random.choice(['A', 'B', 'C']), random.choice(['H', 'I', 'J']))
-        vehicle_navigator_agent = VehicleNavigator(
+        vehicle_simulator_for_emergency = VehicleSimulator(routing_graph, random.choice(['A', 'B', 'C']), random.choice(['H', 'I', 'J']))
+        vehicle_navigator_agent = partial(
+            VehicleNavigator,
             jid=f"vehicle_navigator_{i}@{SERVER_ADDRESS}",
             password=PASSWORD,
             simulator=vehicle_simulator_for_emergency if isEmergency else vehicle_simulator,
-            target_node=finish_node,
+            target_node=vehicle_simulator_for_emergency.finish_node if isEmergency else finish_node,
             vehicle_id=i,
             verify_security=False,
-            isEmergency=isEmergency
+            isEmergency=isEmergency,
+            telemetry=telemetry,
+            dead_reckoning=DEAD_RECKONING,
+            regions=regions,
         )
         vehicle_navigators.append(vehicle_navigator_agent)
     
-    additional_alerting_agent = AdditionalAlertingAgent(f"additional_alerting_agent@{SERVER_ADDRESS}", PASSWORD, graph)
-    await additional_alerting_agent.start(auto_register=True)
+    additional_alerting_agent = partial(
+        AdditionalAlertingAgent, f"additional_alerting_agent@{SERVER_ADDRESS}", PASSWORD, routing_graph, managers=managers
+    )
+
+    visualizer_agent = partial(VisualizerAgent, f"visualizer@{SERVER_ADDRESS}", PASSWORD, graph, recording=VISUALIZER_RECORDING)
+
+    services = [road_condition_reporter, additional_alerting_agent, visualizer_agent]
+    if telemetry is not None:
+        services.append(
+            partial(TelemetryAggregatorAgent, f"telemetry_aggregator@{SERVER_ADDRESS}", PASSWORD, telemetry, consumers=consumers)
+        )
+
+    # agents start phase by phase (registering their accounts):
+    # controllers before the managers collecting their states, managers before everyone talking to them
+    # metrics of all agents are written periodically instead of logging every message
+    exporter = (
+        MetricsExporter(METRICS_FILE, METRICS_EXPORT_PERIOD) if INSTRUMENTATION and METRICS_FILE is not None else None
+    )
+    if exporter is not None:
+        exporter.start()
+
+    launcher = AgentLauncher()
+    traffic_lights_agents = await launcher.start("traffic lights", traffic_lights_agents)
+    manager_agents = await launcher.start("navigation managers", manager_agents)
+    services = await launcher.start("services", services)
+    vehicle_navigators = await launcher.start("vehicles", vehicle_navigators)
+    logging.info(f"[MAIN] Started {len(traffic_lights_agents) + len(manager_agents) + len(services) + len(vehicle_navigators)} agents: {launcher.report()}")
 
-    visualizer_agent = VisualizerAgent(f"visualizer@{SERVER_ADDRESS}", PASSWORD, graph)
-    await visualizer_agent.start(auto_register=True)
-    
-    for agent in vehicle_navigators:
-        await agent.start(auto_register=True)
     vehicle_navigator_finish_coros = [
         spade.wait_until_finished(vehicle_navigator_agent)
         for vehicle_navigator_agent in vehicle_navigators
     ]
     await asyncio.gather(*vehicle_navigator_finish_coros)
-    for ag in traffic_lights_agents:
-        await ag.stop()
-    await manager_agent.stop()
+    await launcher.stop_all()
+    logging.info(f"[MAIN] Stopped all agents: {launcher.report()}")
+    if exporter is not None:
+        await exporter.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import networkx as nx
+
+from src.agents.visualization.recording import read_trajectory
+from src.agents.visualization.renderer import FleetRenderer
+
+# set in every worker by init_worker, the road layer is drawn once per worker
+renderer: FleetRenderer = None
+output_directory: str = None
+
+
+def recorded_graph(header: dict) -> nx.Graph:
+    graph = nx.Graph()
+    graph.add_nodes_from(header["nodes"])
+    for u, v, id_, traffic_light_id in header["edges"]:
+        graph.add_edge(u, v, id=id_, traffic_light_id=traffic_light_id)
+    return graph
+
+
+def init_worker(header: dict, layout: dict, directory: str):
+    global renderer, output_directory
+    renderer = FleetRenderer(recorded_graph(header), layout, blit=False)
+    output_directory = directory
+
+
+def render_frame(task) -> str:
+    index, (time_, vehicles, traffic_lights, conditions) = task
+    renderer.set_road_state(traffic_lights, conditions)
+    renderer.set_vehicles(vehicles)
+    renderer.ax.set_title(f"t = {time_:.1f} s")
+    path = os.path.join(output_directory, f"frame_{index:06d}.png")
+    renderer.fig.savefig(path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders a recorded trajectory file to a PNG sequence")
+    parser.add_argument("recording", help="trajectory file written by the visualizer or simulate.py --record")
+    parser.add_argument("--out", default="frames", help="directory for the PNG files")
+    parser.add_argument("--every", type=int, default=1, help="render every n-th frame")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    header, frames = read_trajectory(args.recording)
+    # same layout as the live visualizer, computed once and shared by all workers
+    layout = {node: tuple(xy) for node, xy in nx.spring_layout(recorded_graph(header), seed=0).items()}
+    tasks = enumerate(itertools.islice(frames, 0, None, args.every))
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(header, layout, args.out)) as pool:
+        rendered = sum(1 for _ in pool.imap_unordered(render_frame, tasks, chunksize=16))
+    plt.close("all")
+    print(f"Rendered {rendered} frames to {args.out} in {time.perf_counter() - start:.1f} s")
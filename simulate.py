@@ -0,0 +1,64 @@
+import argparse
+import logging
+import random
+import time
+
+from src.agents.vehicle_navigator.vehicle_simulator import VehicleSimulator
+from src.agents.visualization.recording import BackgroundRecorder, TrajectoryWriter
+from src.compact_graph import CompactGraph
+from src.simulation.engine import HeadlessSimulation
+from src.utils import load_graph, load_lights
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless simulation in virtual time (no XMPP server needed)")
+    parser.add_argument("--graph", default="data/graph.json")
+    parser.add_argument("--lights", default="data/traffic_lights.json")
+    parser.add_argument("--vehicles", type=int, default=4, help="number of normal vehicles")
+    parser.add_argument("--emergency", type=int, default=1, help="number of emergency vehicles")
+    parser.add_argument("--horizon", type=float, default=3600, help="simulated seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compact", action="store_true", help="use CompactGraph for routing and simulation")
+    parser.add_argument(
+        "--fleet", action="store_true", help="advance all vehicles with one vectorized tick (implies --compact)"
+    )
+    parser.add_argument(
+        "--no-green-wave", action="store_true", help="preempt lights on position updates instead of green waves"
+    )
+    parser.add_argument("--record", help="write a trajectory file, render it with render_recording.py")
+    parser.add_argument("--frame-period", type=float, default=0.1, help="simulated seconds between recorded frames")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+    graph = load_graph(args.graph)
+    routing_graph = CompactGraph.from_networkx(graph) if args.compact or args.fleet else graph
+    simulation = HeadlessSimulation(
+        routing_graph,
+        load_lights(args.lights),
+        record_trajectories=False,
+        green_wave=not args.no_green_wave,
+        fleet=args.fleet,
+    )
+
+    nodes = list(graph.nodes)
+    for i in range(args.vehicles + args.emergency):
+        start_node, finish_node = random.sample(nodes, 2)
+        simulator = VehicleSimulator(routing_graph, start_node, finish_node)
+        simulation.add_vehicle(i, simulator, finish_node, isEmergency=i >= args.vehicles)
+
+    recorder = None
+    if args.record:
+        recorder = BackgroundRecorder(TrajectoryWriter(args.record, graph))
+        simulation.record_frames(recorder, args.frame_period)
+
+    wall_start = time.perf_counter()
+    summary = simulation.run(args.horizon)
+    wall = time.perf_counter() - wall_start
+    if recorder is not None:
+        recorder.close()
+    print(f"Simulated {summary['time']:.1f} s in {wall:.3f} s ({summary['time'] / max(wall, 1e-9):.0f}x real time)")
+    for vehicle_id, vehicle in summary["vehicles"].items():
+        kind = "emergency" if vehicle["isEmergency"] else "normal"
+        print(f"vehicle {vehicle_id} ({kind}) route {vehicle['route']} travel time {vehicle['travel_time']} waited {vehicle['waited']}")
+    print(f"route cache: {summary['route_cache']}")
@@ -3,53 +3,131 @@ import logging
 
 logging.getLogger().setLevel(logging.INFO)
 from src.agents.road_condition_reporter.road_condition_protocols import RoadConditionProtocols
-from spade.agent import Agent
+from src.metrics import InstrumentedAgent
 from spade.template import Template
 from spade.behaviour import OneShotBehaviour
 from spade.behaviour import PeriodicBehaviour
 from spade.message import Message
-from ...config import SERVER_ADDRESS
-import json
-import networkx as nx
+from src.codec import get_body, set_body
+from src.regions import navigation_manager_jid
+from typing import Optional
+from src.utils import RoadGraph
+from .alert_store import AlertStore
 
-class AdditionalAlertingAgent(Agent):
-    def __init__(self, jid, password, graph: nx.Graph, verify_security=False):
+
+class AdditionalAlertingAgent(InstrumentedAgent):
+    def __init__(self, jid, password, graph: RoadGraph, verify_security=False, managers: Optional[list[str]] = None):
         super().__init__(jid, password, verify_security)
         self.graph = graph
-        self.routes = {}
+        # alerts of current emergency routes, updated only when a route changes
+        self.alerts = AlertStore(graph)
+        # navigation managers (shards) publishing emergency routes, each one versions its routes on its own
+        self.managers: list[str] = [navigation_manager_jid()] if managers is None else managers
+        # manager JID -> version of the last applied emergency routes update from it
+        self.routes_versions: dict[str, Optional[int]] = {jid: None for jid in self.managers}
+
+    @staticmethod
+    def route_key(manager: str, vehicle_id) -> str:
+        """
+        Routes are kept per manager, a vehicle handed over between shards is removed by one and added by the other
+        """
+        return f"{manager}/{vehicle_id}"
+
+    async def request_emergency_routes(self, behav, manager: str):
+        msg = Message(manager)
+        msg.set_metadata("msg_type", "emergency_routes_sync_request")
+        await behav.send(msg)
 
+    # Periodically sends alerts added and removed since the previous message, nothing if no route changed.
     class SendAlerts(PeriodicBehaviour):
+        """
+        Sent message
+        {
+            "version": 1,
+            "added": [<alert>, ...],
+            "removed": [<edge_id>, ...]
+        }
+        """
+        async def run(self):
+            diff = self.agent.alerts.take_diff()
+            if diff is None:
+                return
+            logging.debug(
+                f"[ADDITIONAL ALERTING AGENT] Alerts version {diff['version']}: {len(diff['added'])} added, {len(diff['removed'])} removed"
+            )
+            for manager in self.agent.managers:
+                msg = Message(manager)
+                msg.set_metadata("msg_type", "emergency_alerts_response")
+                set_body(msg, diff)
+                await self.send(msg)
+
+    # Sends all current alerts to a receiver that missed a version.
+    class SendAlertsSnapshotOnRequest(OneShotBehaviour):
+        """
+        Sent message
+        {
+            "version": 1,
+            "alerts": [<alert>, ...]
+        }
+        """
         async def run(self):
-            alerts = []
-            for vehicle_id, route in self.agent.routes.items():
-                for i in range(len(route) - 1):
-                    current_edge = route[i]
-                    next_edge = route[i + 1]
-                    edge_id = self.agent.graph[current_edge][next_edge]['id']
-                    alert = {
-                        "edgeId": edge_id,
-                        "startNode": current_edge,
-                        "endNode": next_edge,
-                        "alertType": "EMERGENCY_WARNING"
-                    }
-                    alerts.append(alert)
-            logging.info(f"[ADDITIONAL ALERTING AGENT] Generated alerts: {alerts}")
-            msg = Message(f"navigation_manager@{SERVER_ADDRESS}")
-            msg.set_metadata("msg_type", "emergency_alerts_response")
-            msg.body = json.dumps({"alerts": alerts})
-            await self.send(msg)
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                reply = Message(to=str(msg.sender))
+                reply.set_metadata("msg_type", "emergency_alerts_snapshot")
+                set_body(reply, self.agent.alerts.snapshot())
+                await self.send(reply)
 
+    # Asks every manager for all its emergency routes on start, then follows versioned changes published by them.
+    # A missed version triggers another request to that manager.
     class RequestEmergencyRoute(OneShotBehaviour):
+        """
+        Expected message (changes)
+        {
+            "version": 1,
+            "updated": {<vehicle_id>: <route>, ...},
+            "removed": [<vehicle_id>, ...]
+        }
+        or, as response to the request (snapshot)
+        {
+            "version": 1,
+            "routes": {<vehicle_id>: <route>, ...}
+        }
+        """
         async def run(self):
-             while 1:
+            for manager in self.agent.managers:
+                await self.agent.request_emergency_routes(self, manager)
+            while 1:
                 msg = await self.receive(timeout=10)
                 if not msg:
                     continue
-                msg_json = json.loads(msg.body)
-                routes = msg_json["routes"]
-                if routes:
-                    self.routes = routes
-                    logging.info(f"[ADDITIONAL ALERTING AGENT] Received emergency routes: {routes}")
+                manager = str(msg.sender)
+                key = self.agent.route_key
+                msg_json = get_body(msg)
+                version = msg_json["version"]
+                last_version = self.agent.routes_versions.get(manager)
+                if "routes" in msg_json:
+                    # vehicles of the manager missing in the snapshot have finished (or left its region)
+                    self.agent.alerts.set_routes(
+                        {key(manager, vehicle_id): route for vehicle_id, route in msg_json["routes"].items()},
+                        prefix=key(manager, ""),
+                    )
+                elif last_version is not None and version == last_version + 1:
+                    for vehicle_id in msg_json["removed"]:
+                        self.agent.alerts.remove_route(key(manager, vehicle_id))
+                    for vehicle_id, route in msg_json["updated"].items():
+                        self.agent.alerts.update_route(key(manager, vehicle_id), route)
+                else:
+                    if last_version is None or version > last_version:
+                        logging.info(
+                            f"[ADDITIONAL ALERTING AGENT] Emergency routes gap from {manager} (last {last_version}, got {version}), requesting all routes"
+                        )
+                        await self.agent.request_emergency_routes(self, manager)
+                    continue
+                self.agent.routes_versions[manager] = version
+                logging.debug(f"[ADDITIONAL ALERTING AGENT] Emergency routes version {version} of {manager}")
 
     async def setup(self):
         behaviourSendAlert = self.SendAlerts(period=1)
@@ -58,4 +136,11 @@ class AdditionalAlertingAgent(Agent):
         behaviourRequestEmergencyRoute = self.RequestEmergencyRoute()
         templateRequestEmergencyRoute = Template()
         templateRequestEmergencyRoute.set_metadata("msg_type", "emergency_route_response")
-        self.add_behaviour(behaviourRequestEmergencyRoute)
\ No newline at end of file
+        templateEmergencyRouteUpdate = Template()
+        templateEmergencyRouteUpdate.set_metadata("msg_type", "emergency_route_update")
+        self.add_behaviour(behaviourRequestEmergencyRoute, templateRequestEmergencyRoute | templateEmergencyRouteUpdate)
+
+        behaviourSendAlertsSnapshot = self.SendAlertsSnapshotOnRequest()
+        templateSendAlertsSnapshot = Template()
+        templateSendAlertsSnapshot.set_metadata("msg_type", "emergency_alerts_sync_request")
+        self.add_behaviour(behaviourSendAlertsSnapshot, templateSendAlertsSnapshot)
@@ -0,0 +1,111 @@
+from typing import Optional
+
+from src.utils import RoadGraph
+
+
+class AlertStore:
+    """
+    Emergency alerts indexed by edge id, one alert per edge however many emergency routes use it.
+    Updated only when a route is added, changed or finished; changes since the last diff are collected
+    and emitted as one versioned diff of added alerts and removed edge ids.
+    """
+
+    def __init__(self, graph: RoadGraph):
+        self.graph = graph
+        self.version: int = 0
+        self.alerts: dict[int, dict] = {}  # edge id -> alert
+        self.routes: dict[str, list[str]] = {}  # vehicle id -> route
+        self._vehicles_by_edge: dict[int, set[str]] = {}
+        self._edges_by_vehicle: dict[str, list[int]] = {}
+        self._sent: dict[int, dict] = {}  # alerts as of the last diff
+        self._dirty: set[int] = set()  # edge ids touched since the last diff
+
+    def _route_alerts(self, route: list[str]) -> dict[int, dict]:
+        alerts = {}
+        for i in range(len(route) - 1):
+            edge_id = self.graph.get_edge_data(route[i], route[i + 1])['id']
+            alerts[edge_id] = {
+                "edgeId": edge_id,
+                "startNode": route[i],
+                "endNode": route[i + 1],
+                "alertType": "EMERGENCY_WARNING"
+            }
+        return alerts
+
+    def _add_edge(self, vehicle_id: str, edge_id: int, alert: dict):
+        vehicles = self._vehicles_by_edge.setdefault(edge_id, set())
+        vehicles.add(vehicle_id)
+        if len(vehicles) == 1:
+            self.alerts[edge_id] = alert
+            self._dirty.add(edge_id)
+
+    def _remove_edge(self, vehicle_id: str, edge_id: int):
+        vehicles = self._vehicles_by_edge.get(edge_id)
+        if vehicles is None:
+            return
+        vehicles.discard(vehicle_id)
+        if not vehicles:
+            del self._vehicles_by_edge[edge_id]
+            del self.alerts[edge_id]
+            self._dirty.add(edge_id)
+
+    def update_route(self, vehicle_id: str, route: list[str]):
+        if self.routes.get(vehicle_id) == route:
+            return
+        self.remove_route(vehicle_id)
+        alerts = self._route_alerts(route)
+        for edge_id, alert in alerts.items():
+            self._add_edge(vehicle_id, edge_id, alert)
+        self.routes[vehicle_id] = route
+        self._edges_by_vehicle[vehicle_id] = list(alerts)
+
+    def remove_route(self, vehicle_id: str):
+        self.routes.pop(vehicle_id, None)
+        for edge_id in self._edges_by_vehicle.pop(vehicle_id, ()):
+            self._remove_edge(vehicle_id, edge_id)
+
+    def set_routes(self, routes: dict[str, list[str]], prefix: str = ""):
+        """
+        Replaces all routes (only those with keys starting with prefix), vehicles missing in routes have finished
+        """
+        for vehicle_id in [
+            vehicle_id for vehicle_id in self.routes if vehicle_id.startswith(prefix) and vehicle_id not in routes
+        ]:
+            self.remove_route(vehicle_id)
+        for vehicle_id, route in routes.items():
+            self.update_route(vehicle_id, route)
+
+    def take_diff(self) -> Optional[dict]:
+        """
+        Changes since the previous diff under a new version, None if nothing changed
+        {
+            "version": 1,
+            "added": [<alert>, ...],
+            "removed": [<edge_id>, ...]
+        }
+        """
+        added, removed = [], []
+        for edge_id in self._dirty:
+            alert = self.alerts.get(edge_id)
+            if alert is None:
+                if self._sent.pop(edge_id, None) is not None:
+                    removed.append(edge_id)
+            elif self._sent.get(edge_id) != alert:
+                self._sent[edge_id] = alert
+                added.append(alert)
+        self._dirty.clear()
+        if not added and not removed:
+            return None
+        self.version += 1
+        return {"version": self.version, "added": added, "removed": removed}
+
+    def snapshot(self) -> dict:
+        """
+        All current alerts, pending changes are folded into a new version (the receiver replaces its alerts)
+        {
+            "version": 1,
+            "alerts": [<alert>, ...]
+        }
+        """
+        self.take_diff()
+        return {"version": self.version, "alerts": list(self.alerts.values())}
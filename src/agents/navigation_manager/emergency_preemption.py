@@ -0,0 +1,254 @@
+import math
+from typing import Iterator, Optional
+
+from src.agents.traffic_light_controller.messages import TrafficLight
+from src.agents.traffic_light_controller.physical_traffic_light import TrafficLightSimulator
+from src.utils import RoadGraph
+
+
+class EmergencyRouteIndex:
+    """
+    Traffic lights to preempt for every edge of an emergency route, built once when the route is stored:
+    the light of the edge itself followed by the next `lookahead` lights further along the route.
+    Also keeps distances along the route, so the time to reach any light ahead is O(1).
+    """
+
+    def __init__(self, graph: RoadGraph, route: list[str], lookahead: int = 1):
+        self.route = route
+        edges = [(route[i], route[i + 1]) for i in range(len(route) - 1)]
+        self.position: dict[tuple[str, str], int] = {}
+        for i, edge in enumerate(edges):
+            self.position.setdefault(edge, i)
+        edges_data = [graph.get_edge_data(*edge) for edge in edges]
+        lights: list[Optional[int]] = [data.get("traffic_light_id", None) for data in edges_data]
+        # offsets[i] is the distance from the route start to the start of edge i
+        self.offsets: list[float] = [0.0]
+        for data in edges_data:
+            self.offsets.append(self.offsets[-1] + data["distance"])
+        # (edge position, light id) of every edge with a light, in route order
+        self.light_edges: list[tuple[int, int]] = [(i, id) for i, id in enumerate(lights) if id is not None]
+        # first entry of light_edges after edge i
+        self.next_light_edge: list[int] = [0] * (len(edges) + 1)
+        k = len(self.light_edges)
+        for i in range(len(edges), -1, -1):
+            while k > 0 and self.light_edges[k - 1][0] > i:
+                k -= 1
+            self.next_light_edge[i] = k
+
+        # single backward pass, upcoming[i] are the first lights after edge i
+        self.lights: list[tuple[int, ...]] = [()] * len(edges)
+        upcoming: tuple[int, ...] = ()
+        for i in range(len(edges) - 1, -1, -1):
+            self.lights[i] = ((lights[i],) if lights[i] is not None else ()) + upcoming
+            if lights[i] is not None:
+                upcoming = ((lights[i],) + upcoming)[:lookahead]
+
+    def lights_at(self, edge: tuple[str, str]) -> tuple[int, ...]:
+        """
+        Lights to preempt for a vehicle on the given edge, none if the edge is not on the route
+        """
+        i = self.position.get(tuple(edge))
+        return () if i is None else self.lights[i]
+
+    def upcoming_lights(self, edge: tuple[str, str], position_in_edge: float) -> Iterator[tuple[int, float]]:
+        """
+        (light id, distance) of lights ahead of a vehicle on the given edge, nearest first.
+        The distance is to the end of the previous edge, where the vehicle checks the light.
+        """
+        i = self.position.get(tuple(edge))
+        if i is None:
+            return
+        start = self.offsets[i] + position_in_edge
+        for j, id in self.light_edges[self.next_light_edge[i]:]:
+            yield id, max(0.0, self.offsets[j] - start)
+
+
+class PreemptionCommands:
+    """
+    Deduplicates GREEN commands for preempted lights. A light commanded less than `hold` seconds ago
+    is still held by its controller (they fall back to auto control after 10 s) and is not commanded again,
+    unless a state reported after the command shows the command did not take effect
+    (reports received less than `report_delay` after the command may have been sent before it arrived).
+    """
+
+    def __init__(self, hold: float = 8, report_delay: float = 1):
+        self.hold = hold
+        self.report_delay = report_delay
+        self.commanded_at: dict[int, float] = {}
+        self.reported: dict[int, tuple[TrafficLight, float]] = {}  # id -> (state, reported at)
+
+    def report(self, traffic_light_id: int, traffic_light: TrafficLight, now: float):
+        self.reported[traffic_light_id] = (traffic_light, now)
+
+    def needs_command(self, traffic_light_id: int, now: float) -> bool:
+        commanded_at = self.commanded_at.get(traffic_light_id)
+        if commanded_at is None or now - commanded_at >= self.hold:
+            return True
+        state, reported_at = self.reported.get(traffic_light_id, (None, None))
+        return reported_at is not None and reported_at > commanded_at + self.report_delay and state != TrafficLight.GREEN
+
+    def select(self, traffic_light_ids: tuple[int, ...], now: float) -> list[int]:
+        """
+        Lights that need a GREEN command now, they are marked as commanded
+        """
+        selected = [id for id in traffic_light_ids if self.needs_command(id, now)]
+        for id in selected:
+            self.commanded_at[id] = now
+        return selected
+
+
+class GreenWavePlanner:
+    """
+    Predictive preemption for emergency vehicles. From the route index, the vehicle's position and speed
+    it computes when the vehicle reaches each light ahead and, from the lights' phase timings and last reported
+    state, predicts whether the light will be passable then. Only lights that would not be passable get
+    a short GREEN window around the arrival, so cross traffic is disrupted as little as possible.
+    Windows are kept per light and vehicle, a replan changes only the windows of the replanned vehicle;
+    overlapping windows of several vehicles on a light are merged into one GREEN command (see green_until).
+    Times are in seconds of the caller's clock (wall clock in the manager, virtual time in the headless simulation).
+    """
+
+    def __init__(self, timings: dict[int, TrafficLightSimulator], margin: float = 1.5, horizon: float = 30):
+        self.timings = timings
+        self.margin = margin  # seconds of green before and after the predicted arrival
+        self.horizon = horizon  # lights reached later than this are planned on later position updates
+        # id -> (state, next change at, when it was reported)
+        self.observed: dict[int, tuple[TrafficLight, Optional[float], float]] = {}
+        # light id -> vehicle id -> planned green window (start, end)
+        self.windows: dict[int, dict[int, tuple[float, float]]] = {}
+        # light id -> vehicle id -> window already commanded to the controller
+        self.sent: dict[int, dict[int, tuple[float, float]]] = {}
+
+    def observe(
+        self, traffic_light_id: int, traffic_light: TrafficLight, next_change_at: Optional[float], now: float
+    ):
+        self.observed[traffic_light_id] = (traffic_light, next_change_at, now)
+
+    def planned(self, vehicle_id: int, traffic_light_id: int) -> Optional[tuple[float, float]]:
+        return self.windows.get(traffic_light_id, {}).get(vehicle_id)
+
+    def mark_sent(self, vehicle_id: int, traffic_light_id: int, window: tuple[float, float]):
+        self.sent.setdefault(traffic_light_id, {})[vehicle_id] = window
+
+    def green_until(self, traffic_light_id: int, now: float) -> float:
+        """
+        End of the GREEN the light has to show from now: windows of all vehicles (planned or sent) are merged,
+        so a command for one vehicle never cuts short the window of another
+        """
+        until = now
+        for start, end in self._green_blocks(traffic_light_id):
+            if start <= until < end:
+                until = end
+        return until
+
+    def _green_blocks(self, traffic_light_id: int, exclude: Optional[int] = None) -> list[tuple[float, float]]:
+        """
+        Merged windows of the light, sorted by start; planned (not sent) windows of the excluded vehicle are left out
+        """
+        windows = [
+            window for vehicle_id, window in self.windows.get(traffic_light_id, {}).items() if vehicle_id != exclude
+        ]
+        windows.extend(self.sent.get(traffic_light_id, {}).values())
+        blocks: list[tuple[float, float]] = []
+        for start, end in sorted(windows):
+            if blocks and start <= blocks[-1][1]:
+                blocks[-1] = (blocks[-1][0], max(blocks[-1][1], end))
+            else:
+                blocks.append((start, end))
+        return blocks
+
+    def passable_during(
+        self, traffic_light_id: int, start: float, end: float, exclude: Optional[int] = None
+    ) -> Optional[bool]:
+        """
+        Whether the light is predicted to be passable (not RED) during the whole interval, None if unknown.
+        Windows (planned or sent) are modelled like the controller runs them: GREEN until the window ends,
+        then the phase advances and the cycle goes on from there.
+        """
+        blocks = self._green_blocks(traffic_light_id, exclude)
+        if any(s <= start and end <= e for s, e in blocks):
+            return True
+        timings = self.timings.get(traffic_light_id)
+        state, change, observed_at = self.observed.get(traffic_light_id, (None, None, None))
+        if timings is None or change is None:
+            return None
+        cycle = sum(timings.phase_duration(light) for light in TrafficLight)
+        if cycle <= 0:
+            return None
+        # a window still running when the state was reported, or started since, restarts the cycle at its end
+        for s, e in blocks:
+            if s <= start and e >= observed_at:
+                state, change = TrafficLight.GREEN, e
+        if start - change > cycle:
+            # whole cycles between the report and the interval do not change the phase
+            change += math.floor((start - change) / cycle) * cycle
+        # state is shown until change
+        while change <= start:
+            state = timings.next_light(state)
+            change += timings.phase_duration(state)
+        upcoming = [(s, e) for s, e in blocks if start < s < end]
+        while True:
+            if state == TrafficLight.RED:
+                return False
+            if upcoming and upcoming[0][0] < min(change, end):
+                # a window starting before the phase ends holds GREEN until its end
+                state, change = TrafficLight.GREEN, upcoming.pop(0)[1]
+                continue
+            if change >= end:
+                return True
+            state = timings.next_light(state)
+            change += timings.phase_duration(state)
+
+    def expire(self, now: float):
+        for windows in (self.windows, self.sent):
+            for id in list(windows):
+                by_vehicle = windows[id]
+                for vehicle_id in [vehicle_id for vehicle_id, window in by_vehicle.items() if window[1] < now]:
+                    del by_vehicle[vehicle_id]
+                if not by_vehicle:
+                    del windows[id]
+
+    def forget(self, vehicle_id: int):
+        """
+        Drops planned windows of a vehicle that finished, commands already sent run out on their own
+        """
+        for id in list(self.windows):
+            self.windows[id].pop(vehicle_id, None)
+            if not self.windows[id]:
+                del self.windows[id]
+
+    def plan(
+        self,
+        vehicle_id: int,
+        index: EmergencyRouteIndex,
+        edge: tuple[str, str],
+        position_in_edge: float,
+        speed: float,
+        now: float,
+    ) -> list[tuple[int, Optional[tuple[float, float]]]]:
+        """
+        Returns changes of the vehicle's planned windows: (light id, window) to (re)schedule a GREEN command
+        at the window start, (light id, None) to cancel a window that has not started yet
+        """
+        self.expire(now)
+        changes = []
+        for id, distance in index.upcoming_lights(edge, position_in_edge):
+            eta = now + distance / speed
+            if eta - now > self.horizon:
+                break
+            need = (max(now, eta - self.margin), eta + self.margin)
+            window = self.planned(vehicle_id, id)
+            if window is not None and window[0] <= need[0] and need[1] <= window[1]:
+                continue
+            # windows of other vehicles count, the own planned one is about to be replaced
+            if self.passable_during(id, *need, exclude=vehicle_id):
+                if window is not None and window[0] > now:
+                    del self.windows[id][vehicle_id]
+                    changes.append((id, None))
+                continue
+            if window is not None and window[0] <= need[1] and need[0] <= window[1]:
+                # extend the overlapping window, it is commanded again from now at the earliest
+                need = (max(now, min(window[0], need[0])), max(window[1], need[1]))
+            self.windows.setdefault(id, {})[vehicle_id] = need
+            changes.append((id, need))
+        return changes
@@ -1,28 +1,172 @@
 import asyncio
 import logging
+import time
 import networkx as nx
 
 logging.getLogger().setLevel(logging.INFO)
 from src.agents.road_condition_reporter.road_condition_protocols import RoadConditionProtocols
-from spade.agent import Agent
+from src.agents.road_condition_reporter.road_condition_delta import RoadConditionResync
+from src.metrics import InstrumentedAgent
 from spade.template import Template
-from spade.behaviour import OneShotBehaviour
-from spade.behaviour import PeriodicBehaviour
+from spade.behaviour import OneShotBehaviour, PeriodicBehaviour
 from spade.message import Message
 from ...config import SERVER_ADDRESS
-import json
-from src.agents.traffic_light_controller.messages import TrafficLight, TrafficLightProtocols
-
-
-class NavigatorManagerAgent(Agent):
-    def __init__(self, jid: str, password: str, graph: nx.Graph, verify_security=False):
+from src.codec import get_body, set_body
+from typing import Optional
+from src.agents.traffic_light_controller.messages import TrafficLight, TrafficLightProtocols, traffic_light_controller_jid
+from src.agents.traffic_light_controller.phase_scheduler import PhaseScheduler
+from src.agents.traffic_light_controller.physical_traffic_light import PhysicalTrafficLight
+from src.agents.vehicle_navigator.dead_reckoning import PositionPredictor
+from src.compact_graph import CompactGraph
+from src.regions import RegionMap
+from src.utils import RoadGraph
+from .route_planner import RoutePlanner
+from .route_workers import RouteWorkerPool
+
+
+class NavigatorManagerAgent(InstrumentedAgent):
+    def __init__(
+        self,
+        jid: str,
+        password: str,
+        graph: RoadGraph,
+        verify_security=False,
+        traffic_lights: Optional[dict[int, PhysicalTrafficLight]] = None,
+        regions: Optional[RegionMap] = None,
+        route_workers: int = 0,
+    ):
         super().__init__(jid, password, verify_security)
         self.traffic_light_states: dict[int, TrafficLight] = {}
-        self.normal_vehicles_graph = graph
-        self.emergency_vehicles_graph = graph
-        self.vehicle_positions: dict[int, tuple[str, str]] = {}
-        self.idsOfEmergencyVehiclesInNormalGraph = set()
-        self.routes_of_emergency_vehicles = {}  # Initialize the routes dictionary of emergency vehicles
+        # routes, graphs and vehicle positions, green waves need phase timings of the lights.
+        # A shard of a partitioned map serves vehicles on edges of its region, but routes across the whole map
+        # by stitching paths between boundary nodes of the regions.
+        self.planner = RoutePlanner(
+            graph,
+            None if traffic_lights is None else {id_: ptl.simulator for id_, ptl in traffic_lights.items()},
+            regions=regions,
+        )
+        # GREEN windows of emergency green waves keyed by (vehicle id, light id), deadlines are window starts (wall clock)
+        self.green_wave_commands = PhaseScheduler(clock=time.time)
+        # edge id -> alert of emergency routes, kept in sync with the additional alerting agent by versioned diffs
+        self.emergency_alerts: dict[int, dict] = {}
+        self.emergency_alerts_version: Optional[int] = None
+        # at most one snapshot requested at a time, deltas arriving meanwhile are replayed after it
+        self.road_condition_resync = RoadConditionResync()
+        # last reported positions, extrapolated between reports (vehicles may report only when they deviate)
+        self.vehicle_positions = PositionPredictor(graph)
+        self.emergency_vehicle_ids: set[int] = set()
+        # other shards of a partitioned map, they raise costs along emergency routes planned here too
+        self.peers: list[str] = (
+            [jid for jid in regions.manager_jids() if jid != str(self.jid.bare())] if regions is not None else []
+        )
+        # routes are searched in worker processes and awaited, light states and positions are handled meanwhile
+        self.route_workers: Optional[RouteWorkerPool] = (
+            RouteWorkerPool(graph, route_workers, landmarks=self.planner.landmarks, regions=regions)
+            if route_workers
+            else None
+        )
+
+    def set_traffic_light_message(self, id: int, duration: Optional[float] = None) -> Message:
+        msg = Message(to=traffic_light_controller_jid(id))
+        msg.set_metadata("msg_type", "set_traffic_light")
+        msg_body = {"traffic_light": TrafficLight.GREEN.value, "id": id}
+        if duration is not None:
+            msg_body["duration"] = duration
+        set_body(msg, msg_body)
+        return msg
+
+    def route_message(self, vehicleId: int, route: list[str]) -> Message:
+        msg = Message(f"vehicle_navigator_{vehicleId}@{SERVER_ADDRESS}")
+        msg.set_metadata("msg_type", "route_response")
+        set_body(msg, {"route": route})
+        return msg
+
+    async def apply_vehicle_position(self, behav, vehicleId: int, isEmergency: bool, now: float, now_monotonic: float):
+        """
+        Preempts lights (or plans the green wave) for an emergency vehicle at its extrapolated position
+        and records the edge of any vehicle
+        """
+        prediction = self.vehicle_positions.predict(vehicleId, now)
+        if prediction is None:
+            return
+        current_edge, position_on_edge = prediction
+        if isEmergency and self.planner.green_wave is not None:
+            changes = self.planner.plan_green_wave(
+                vehicleId, current_edge, position_on_edge, self.vehicle_positions.reports[vehicleId].speed, now
+            )
+            for id, window in changes:
+                if window is None:
+                    self.green_wave_commands.cancel((vehicleId, id))
+                else:
+                    self.green_wave_commands.schedule_at((vehicleId, id), window[0], window)
+        elif isEmergency:
+            for id in self.planner.lights_to_preempt(vehicleId, current_edge, now_monotonic):
+                logging.debug(f"[NAVIGATOR MANAGER] Manager changing traffic light state for ID {id}")
+                await behav.send(self.set_traffic_light_message(id))
+
+        self.planner.update_vehicle_position(vehicleId, current_edge)
+
+    async def prefetch_routes(self, requests: list[tuple[bool, str, str]]):
+        """
+        Computes routes of (isEmergency, source, target) requests missing in the route cache by the route workers,
+        so the planner finds them cached. Costs changed since the last batch are broadcast to the workers first.
+        """
+        if self.route_workers is None:
+            return
+        for graph_class, pairs in self.planner.missing_routes(requests).items():
+            self.route_workers.sync_costs(
+                graph_class, self.planner.roads_graph(graph_class == "emergency"), self.planner.graph_versions[graph_class]
+            )
+            self.planner.store_routes(graph_class, pairs, await self.route_workers.routes(graph_class, pairs))
+
+    async def share_emergency_costs(self, behav):
+        """
+        Sends emergency routes that raised normal graph costs here to the other shards,
+        so their normal vehicles avoid the corridor as well
+        """
+        for vehicleId, route in self.planner.take_emergency_cost_changes():
+            for peer in self.peers:
+                msg = Message(peer)
+                msg.set_metadata("msg_type", "emergency_route_costs")
+                set_body(msg, {"vehicle_id": vehicleId, "route": route})
+                await behav.send(msg)
+
+    async def push_route_updates(self, behav):
+        """
+        Sends a route only to subscribed vehicles whose best path changed after a cost change.
+        """
+        await self.prefetch_routes(self.planner.subscription_route_requests())
+        for vehicleId, route in self.planner.changed_routes():
+            logging.debug(f"[NAVIGATION MANAGER] Pushing route: {route} to vehicle {vehicleId}")
+            await behav.send(self.route_message(vehicleId, route))
+        await self.publish_emergency_routes(behav)
+
+    async def publish_emergency_routes(self, behav):
+        """
+        Sends emergency routes created, replanned or completed since the last publication to the alerting agent,
+        nothing if no emergency route changed.
+        """
+        changes = self.planner.take_emergency_route_changes()
+        if changes is None:
+            return
+        msg = Message(f"additional_alerting_agent@{SERVER_ADDRESS}")
+        msg.set_metadata("msg_type", "emergency_route_update")
+        set_body(msg, changes)
+        logging.info(f"[NAVIGATION MANAGER] Publishing emergency routes version {changes['version']}")
+        await behav.send(msg)
+
+    async def request_road_condition_resync(self, behav, reporter: str):
+        """
+        Asks the reporter for a snapshot, unless one is already on its way
+        """
+        if not self.road_condition_resync.request():
+            return
+        last_seq = self.planner.road_condition_seq
+        logging.info(f"[NAVIGATION MANAGER] Road condition gap after seq {last_seq}, requesting snapshot")
+        resync = Message(to=reporter)
+        resync.set_metadata("msg_type", RoadConditionProtocols.REQUEST_ROAD_CONDITION_RESYNC.value)
+        set_body(resync, {"last_seq": last_seq})
+        await behav.send(resync)
 
     class SetTrafficLightState(OneShotBehaviour):
         """
@@ -34,11 +178,10 @@ class NavigatorManagerAgent(Agent):
          
         async def run(self):
             id_: int = 1
-            msg = Message(to=f"traffic_light_controller_{id_}@{SERVER_ADDRESS}")
+            msg = Message(to=traffic_light_controller_jid(id_))
             msg.set_metadata("msg_type", "set_traffic_light")
-            msg_body: str = json.dumps({"traffic_light": TrafficLight.GREEN.value})
-            msg.body = msg_body
-            logging.info(f"[NAVIGATOR MANAGER] Manager changing traffic light state for ID {id_}")
+            set_body(msg, {"traffic_light": TrafficLight.GREEN.value, "id": id_})
+            logging.debug(f"[NAVIGATOR MANAGER] Manager changing traffic light state for ID {id_}")
             await self.send(msg)
 
     class AwaitTrafficLightState(OneShotBehaviour):
@@ -46,7 +189,12 @@ class NavigatorManagerAgent(Agent):
         Expected message
         {
             "traffic_light": <RED/GREEN/...>
-            "id": <traffic_light_id>
+            "id": <traffic_light_id>,
+            "next_change_at": <timestamp>
+        }
+        or, from a bank controller
+        {
+            "lights": [{"traffic_light": <RED/GREEN/...>, "id": <traffic_light_id>, "next_change_at": <timestamp>}, ...]
         }
         """
 
@@ -55,11 +203,15 @@ class NavigatorManagerAgent(Agent):
                 msg = await self.receive(timeout=10)
                 if not msg:
                     continue
-                msg_json = json.loads(msg.body)
-                id_: int = msg_json["id"]
-                traffic_light: TrafficLight = TrafficLight[msg_json["traffic_light"]]
-                self.agent.traffic_light_states[id_] = traffic_light
-                logging.info(f"[NAVIGATION MANAGER] Navigation manager received state {traffic_light} from ID {id_}")
+                msg_json = get_body(msg)
+                for light in msg_json.get("lights", [msg_json]):
+                    id_: int = light["id"]
+                    traffic_light: TrafficLight = TrafficLight[light["traffic_light"]]
+                    self.agent.traffic_light_states[id_] = traffic_light
+                    self.agent.planner.preemption_commands.report(id_, traffic_light, time.monotonic())
+                    if self.agent.planner.green_wave is not None:
+                        self.agent.planner.green_wave.observe(id_, traffic_light, light.get("next_change_at"), time.time())
+                    logging.debug(f"[NAVIGATION MANAGER] Navigation manager received state {traffic_light} from ID {id_}")
 
     class AwaitVehiclePosition(OneShotBehaviour):
         """
@@ -68,9 +220,17 @@ class NavigatorManagerAgent(Agent):
             "node1": 'A',
             "node2": 'B',
             "vehicle_id": 0,
-            "isEmergency": True/False
+            "isEmergency": True/False,
+            "position_on_edge": 1.5,
+            "speed": 3,
+            "waiting": True/False (stopped at a light),
+            "reported_at": <timestamp> (time the position was taken)
         }
         Vehicle {vehicle_id} is currently od edge A-B
+        or, from the telemetry aggregator, positions of many vehicles applied in one go
+        {
+            "positions": [<position>, ...]
+        }
         """
 
         async def run(self):
@@ -78,47 +238,47 @@ class NavigatorManagerAgent(Agent):
                 msg = await self.receive(timeout=10)
                 if not msg:
                     continue
-                msg_json = json.loads(msg.body)
-                vehicleId = msg_json["vehicle_id"]
+                msg_json = get_body(msg)
+                now, now_monotonic = time.time(), time.monotonic()
+                for position in msg_json.get("positions", [msg_json]):
+                    vehicleId = position["vehicle_id"]
+                    vehicleType = " Emergency" if position["isEmergency"] else " Normal"
+                    logging.debug(f"[NAVIGATION MANAGER] Navigation manager received vehicle position {position} - {vehicleType}")
+                    self.agent.vehicle_positions.update(
+                        vehicleId,
+                        (position["node1"], position["node2"]),
+                        position["position_on_edge"],
+                        position["speed"],
+                        position["waiting"],
+                        position["reported_at"],
+                    )
+                    if position["isEmergency"]:
+                        self.agent.emergency_vehicle_ids.add(vehicleId)
+                    await self.agent.apply_vehicle_position(self, vehicleId, position["isEmergency"], now, now_monotonic)
+
+    # Between reports emergency vehicles are followed by extrapolation, so lights are preempted
+    # and green waves adjusted every second as if the vehicles reported that often.
+    class ExtrapolateEmergencyVehicles(PeriodicBehaviour):
+        async def run(self):
+            now, now_monotonic = time.time(), time.monotonic()
+            for vehicleId in list(self.agent.emergency_vehicle_ids):
+                await self.agent.apply_vehicle_position(self, vehicleId, True, now, now_monotonic)
 
-                vehicleType = " Emergency" if msg_json["isEmergency"] else " Normal"
-                logging.info(f"[NAVIGATION MANAGER] Navigation manager received vehicle position {msg_json} - {vehicleType}")
-                
-                if(msg_json["isEmergency"]):
-
-                     # Retrieve the current and next traffic light IDs
-                    current_edge = (msg_json["node1"], msg_json["node2"])
-                    route = self.agent.routes_of_emergency_vehicles[vehicleId]
-
-                    current_traffic_light_id = self.agent.emergency_vehicles_graph.edges[current_edge].get("traffic_light_id", None)
-                    logging.info(f"[NAVIGATION MANAGER] Current traffic light ID: {current_traffic_light_id}")
-                    next_traffic_light_id = None
-
-                     # Find the next traffic light ID in the route
-                    found_current = False
-                    for i in range(len(route) - 1):
-                        edge = (route[i], route[i + 1])
-                        if found_current:
-                            next_traffic_light_id = self.agent.emergency_vehicles_graph.edges[edge].get("traffic_light_id", None)
-                            if next_traffic_light_id is not None:
-                                break
-                        if edge == current_edge:
-                            found_current = True
-
-                    logging.info(f"[NAVIGATION MANAGER] Current traffic light ID: {current_traffic_light_id}, Next traffic light ID: {next_traffic_light_id}")
-
-                    for id in [current_traffic_light_id, next_traffic_light_id]:
-                        if id is None:
-                            continue
-
-                        msg = Message(to=f"traffic_light_controller_{id}@{SERVER_ADDRESS}")
-                        msg.set_metadata("msg_type", "set_traffic_light")
-                        msg_body: str = json.dumps({"traffic_light": TrafficLight.GREEN.value})
-                        msg.body = msg_body
-                        logging.info(f"[NAVIGATOR MANAGER] Manager changing traffic light state for ID {id}")
-                        await self.send(msg)
-
-                self.agent.vehicle_positions[vehicleId] = (msg_json["node1"], msg_json["node2"])
+    # Sends GREEN commands of emergency green waves when their windows start, each one holds the light green
+    # until the end of its window, or of overlapping windows of other emergency vehicles.
+    class SendGreenWaveCommands(OneShotBehaviour):
+        async def run(self):
+            while 1:
+                for (vehicleId, id), window in await self.agent.green_wave_commands.wait_due():
+                    green_wave = self.agent.planner.green_wave
+                    now = time.time()
+                    # replaced windows and those of finished vehicles are skipped
+                    if window[1] <= now or green_wave.planned(vehicleId, id) != window:
+                        continue
+                    green_wave.mark_sent(vehicleId, id, window)
+                    duration = green_wave.green_until(id, now) - now
+                    logging.debug(f"[NAVIGATOR MANAGER] Green wave: traffic light {id} GREEN for {duration:.1f} s")
+                    await self.send(self.agent.set_traffic_light_message(id, duration))
 
     class SendRoute(OneShotBehaviour):
         """
@@ -134,82 +294,217 @@ class NavigatorManagerAgent(Agent):
                 msg = await self.receive(timeout=10)
                 if not msg:
                     continue
-                msg_json = json.loads(msg.body)
-                isEmergency = msg_json["isEmergency"]
+                msg_json = get_body(msg)
                 vehicleId = msg_json["vehicle_id"]
-
-                roads_graph = self.agent.normal_vehicles_graph if not isEmergency else self.agent.emergency_vehicles_graph
-                route = nx.shortest_path(
-                    roads_graph,
-                    source=self.agent.vehicle_positions.get(vehicleId, ("A", "A"))[0],
-                    target=msg_json["target"],
-                    weight="cost",
+                await self.agent.prefetch_routes(
+                    [self.agent.planner.route_request(vehicleId, msg_json["target"], msg_json["isEmergency"])]
                 )
-                if isEmergency:
-                    self.agent.routes_of_emergency_vehicles[vehicleId] = route
-                    logging.info(f"[NAVIGATION MANAGER] Emergency vehicle {vehicleId} route: {route}")
-
-                # If the vehicle is an emergency vehicle 
-                # and the normal graph has not been updated due to increased cost of emergency vehicle route
-                if(isEmergency and vehicleId not in self.agent.idsOfEmergencyVehiclesInNormalGraph):
-                    for i in range(len(route) - 1):
-                        u, v = route[i], route[i + 1]
-                        # Increase the cost of the emergency route edges 
-                        if self.agent.normal_vehicles_graph.has_edge(u, v):
-
-                            self.agent.normal_vehicles_graph[u][v]['cost'] *= 3
-
-                            if 'numOfEmergencyVehPlanned' not in self.agent.normal_vehicles_graph[u][v]:
-                                self.agent.normal_vehicles_graph[u][v]['numOfEmergencyVehPlanned'] = 0
-                            else:
-                                self.agent.normal_vehicles_graph[u][v]['numOfEmergencyVehPlanned'] += 1
-
-                    self.agent.idsOfEmergencyVehiclesInNormalGraph.add(vehicleId)
-
+                route, costs_changed = self.agent.planner.plan_route(vehicleId, msg_json["target"], msg_json["isEmergency"])
+                await self.send(self.agent.route_message(vehicleId, route))
+                if costs_changed:
+                    await self.agent.share_emergency_costs(self)
+                    await self.agent.push_route_updates(self)
+                await self.agent.publish_emergency_routes(self)
+
+    class SubscribeRoute(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "vehicle_id": 0,
+            "target": "D",
+            "isEmergency": True/False,
+            "source": "A" (optional, used until the vehicle reports its position)
+        }
+        The vehicle gets its route now and a new one only when the best path changes.
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                msg_json = get_body(msg)
+                vehicleId = msg_json["vehicle_id"]
+                await self.agent.prefetch_routes(
+                    [
+                        self.agent.planner.route_request(
+                            vehicleId, msg_json["target"], msg_json["isEmergency"], msg_json.get("source")
+                        )
+                    ]
+                )
+                route, costs_changed = self.agent.planner.subscribe(
+                    vehicleId, msg_json["target"], msg_json["isEmergency"], msg_json.get("source")
+                )
+                logging.info(f"[NAVIGATION MANAGER] Vehicle {vehicleId} subscribed for route to {msg_json['target']}")
+                await self.send(self.agent.route_message(vehicleId, route))
+                if costs_changed:
+                    await self.agent.share_emergency_costs(self)
+                    await self.agent.push_route_updates(self)
+                await self.agent.publish_emergency_routes(self)
+
+    # Raises costs along emergency routes planned by other shards, normal vehicles served here avoid them too.
+    class ReceiveEmergencyRouteCosts(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "vehicle_id": 3,
+            "route": ['A', 'B', ...]
+        }
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                msg_json = get_body(msg)
+                if self.agent.planner.raise_emergency_route_costs(msg_json["vehicle_id"], msg_json["route"]):
+                    await self.agent.push_route_updates(self)
 
-                msg = Message(f"vehicle_navigator_{vehicleId}@{SERVER_ADDRESS}")
-                msg.set_metadata("msg_type", "route_response")
-                msg.body = json.dumps({"route": route})
-                vehicleType = " Emergency" if isEmergency else " Normal"
-                logging.info(f"[NAVIGATION MANAGER] Generated route: {route} for vehicle {vehicleId} - {vehicleType}")
-                await self.send(msg)
+    class UnsubscribeRoute(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "vehicle_id": 0
+        }
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                vehicleId = get_body(msg)["vehicle_id"]
+                self.agent.planner.unsubscribe(vehicleId)
+                self.agent.vehicle_positions.forget(vehicleId)
+                self.agent.emergency_vehicle_ids.discard(vehicleId)
+                logging.info(f"[NAVIGATION MANAGER] Vehicle {vehicleId} unsubscribed from route updates")
+                await self.agent.publish_emergency_routes(self)
 
     class ReceiveRoadCondition(OneShotBehaviour):
+        """
+        Expected message (full snapshot)
+        {
+            "seq": 0,
+            "updated_graph": <node_link_data>
+        }
+        """
         async def run(self):
             while 1:
                 msg = await self.receive(timeout=20)
                 if not msg:
                     continue
-                msg_json = json.loads(msg.body)
+                msg_json = get_body(msg)
                 updated_graph_with_conditions = nx.readwrite.json_graph.node_link_graph(msg_json["updated_graph"])
-                logging.info(f"[NAVIGATION MANAGER] Received updated roads with current conditions")
-                self.agent.graph = updated_graph_with_conditions
-                self.agent.emergency_vehicles_graph = updated_graph_with_conditions
-
-    class SendEmergencyRoutes(PeriodicBehaviour):
+                if isinstance(self.agent.planner.emergency_vehicles_graph, CompactGraph):
+                    updated_graph_with_conditions = CompactGraph.from_networkx(updated_graph_with_conditions)
+                logging.info(f"[NAVIGATION MANAGER] Received updated roads with current conditions (seq {msg_json.get('seq')})")
+                self.agent.planner.apply_road_condition_snapshot(updated_graph_with_conditions, msg_json.get("seq", 0))
+                for seq, patches in self.agent.road_condition_resync.snapshot_received():
+                    if self.agent.planner.apply_road_condition_delta(seq, patches) == "gap":
+                        await self.agent.request_road_condition_resync(self, str(msg.sender))
+                        break
+                await self.agent.push_route_updates(self)
+
+    class ReceiveRoadConditionDelta(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "seq": 1,
+            "patches": [[<edge_id>, <condition>, <cost_factor>], ...]
+        }
+        Patches are applied in place, a gap in sequence numbers triggers a full snapshot resync.
+        Deltas arriving while the snapshot is awaited are buffered and replayed after it.
+        """
         async def run(self):
-            routes = self.agent.routes_of_emergency_vehicles
-            msg = Message(f"additional_alerting_agent@{SERVER_ADDRESS}")
-            msg.set_metadata("msg_type", "emergency_route_response")
-            msg.body = json.dumps({"routes": routes})
-            logging.info(f"[NAVIGATION MANAGER] Sending emergency routes to additional alerting manager")
-            await self.send(msg)
-    
+            while 1:
+                msg = await self.receive(timeout=20)
+                if not msg:
+                    continue
+                msg_json = get_body(msg)
+                seq: int = msg_json["seq"]
+                resync = self.agent.road_condition_resync
+                if resync.resync_pending:
+                    status = "gap"
+                else:
+                    status = self.agent.planner.apply_road_condition_delta(seq, msg_json["patches"])
+                if status == "gap":
+                    resync.buffer(seq, msg_json["patches"])
+                    await self.agent.request_road_condition_resync(self, str(msg.sender))
+                elif status == "applied":
+                    await self.agent.push_route_updates(self)
+
+    # Sends all emergency routes to an agent catching up, e.g. the alerting agent after a restart or a missed version.
+    class SendEmergencyRoutesOnRequest(OneShotBehaviour):
+        """
+        Sent message
+        {
+            "version": 1,
+            "routes": {<vehicle_id>: <route>, ...}
+        }
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                reply = Message(to=str(msg.sender))
+                reply.set_metadata("msg_type", "emergency_route_response")
+                set_body(reply, self.agent.planner.emergency_routes_snapshot())
+                logging.info(f"[NAVIGATION MANAGER] Sending emergency routes snapshot to {msg.sender}")
+                await self.send(reply)
+
     class AwaitEmergencyAlerts(OneShotBehaviour):
+        """
+        Expected message (diff)
+        {
+            "version": 1,
+            "added": [<alert>, ...],
+            "removed": [<edge_id>, ...]
+        }
+        or, after a sync request (snapshot)
+        {
+            "version": 1,
+            "alerts": [<alert>, ...]
+        }
+        A gap in versions triggers a sync request.
+        """
         async def run(self):
             while 1:
                 msg = await self.receive(timeout=10)
                 if not msg:
                     continue
-                msg_json = json.loads(msg.body)
-                alerts = msg_json["alerts"]
-                logging.info(f"[NAVIGATION MANAGER] Received emergency alerts from additional alerting manager: {alerts}")
+                msg_json = get_body(msg)
+                version = msg_json["version"]
+                last_version = self.agent.emergency_alerts_version
+                if "alerts" in msg_json:
+                    self.agent.emergency_alerts = {alert["edgeId"]: alert for alert in msg_json["alerts"]}
+                elif last_version is not None and version == last_version + 1:
+                    for edge_id in msg_json["removed"]:
+                        self.agent.emergency_alerts.pop(edge_id, None)
+                    for alert in msg_json["added"]:
+                        self.agent.emergency_alerts[alert["edgeId"]] = alert
+                else:
+                    if last_version is None or version > last_version:
+                        logging.info(f"[NAVIGATION MANAGER] Emergency alerts gap (last {last_version}, got {version}), requesting sync")
+                        sync = Message(to=str(msg.sender))
+                        sync.set_metadata("msg_type", "emergency_alerts_sync_request")
+                        await self.send(sync)
+                    continue
+                self.agent.emergency_alerts_version = version
+                logging.info(
+                    f"[NAVIGATION MANAGER] Emergency alerts version {version}: {len(self.agent.emergency_alerts)} alerted edges"
+                )
 
     async def setup(self):
+        if self.route_workers is not None:
+            self.route_workers.start()
+
         b0 = self.ReceiveRoadCondition()
         t0 = Template()
         t0.set_metadata("msg_type", RoadConditionProtocols.REQUEST_ROAD_CONDITION.value)
 
+        b0d = self.ReceiveRoadConditionDelta()
+        t0d = Template()
+        t0d.set_metadata("msg_type", RoadConditionProtocols.ROAD_CONDITION_DELTA.value)
+
         b1 = self.AwaitTrafficLightState()
         t1 = Template()
         t1.set_metadata("msg_type", TrafficLightProtocols.SEND_TRAFFIC_LIGHT.value)
@@ -220,19 +515,53 @@ class NavigatorManagerAgent(Agent):
         t3 = Template()
         t3.set_metadata("msg_type", "send_route")
 
+        b3s = self.SubscribeRoute()
+        t3s = Template()
+        t3s.set_metadata("msg_type", "subscribe_route")
+
+        b3u = self.UnsubscribeRoute()
+        t3u = Template()
+        t3u.set_metadata("msg_type", "unsubscribe_route")
+
+        b3c = self.ReceiveEmergencyRouteCosts()
+        t3c = Template()
+        t3c.set_metadata("msg_type", "emergency_route_costs")
+
         b4 = self.AwaitVehiclePosition()
         t4 = Template()
         t4.set_metadata("msg_type", "send_vehicle_position")
+        t4_batch = Template()
+        t4_batch.set_metadata("msg_type", "send_vehicle_position_batch")
+
+        b4e = self.ExtrapolateEmergencyVehicles(period=1)
+
+        b4g = self.SendGreenWaveCommands()
 
-        b5 = self.SendEmergencyRoutes(period=1)
+        b5 = self.SendEmergencyRoutesOnRequest()
+        t5 = Template()
+        t5.set_metadata("msg_type", "emergency_routes_sync_request")
 
         b6 = self.AwaitEmergencyAlerts()
         t6 = Template()
         t6.set_metadata("msg_type", "emergency_alerts_response")
+        t6_snapshot = Template()
+        t6_snapshot.set_metadata("msg_type", "emergency_alerts_snapshot")
 
         self.add_behaviour(b0, t0)
+        self.add_behaviour(b0d, t0d)
         self.add_behaviour(b1, t1)
         self.add_behaviour(b2)
         self.add_behaviour(b3, t3)
-        self.add_behaviour(b4, t4)
-        self.add_behaviour(b5)
+        self.add_behaviour(b3s, t3s)
+        self.add_behaviour(b3u, t3u)
+        self.add_behaviour(b3c, t3c)
+        self.add_behaviour(b4, t4 | t4_batch)
+        self.add_behaviour(b4e)
+        self.add_behaviour(b4g)
+        self.add_behaviour(b5, t5)
+        self.add_behaviour(b6, t6 | t6_snapshot)
+
+    async def stop(self):
+        await super().stop()
+        if self.route_workers is not None:
+            self.route_workers.stop()
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class RouteCache:
+    """
+    LRU cache of computed routes keyed by (graph class, source, target, graph version).
+    Entries computed on an older graph version are never returned, they just age out.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self._routes: "OrderedDict[Tuple[Hashable, str, str, int], list[str]]" = OrderedDict()
+
+    def get(self, graph_class: Hashable, source: str, target: str, version: int) -> Optional[list[str]]:
+        key = (graph_class, source, target, version)
+        route = self._routes.get(key)
+        if route is None:
+            self.misses += 1
+            return None
+        self._routes.move_to_end(key)
+        self.hits += 1
+        return route
+
+    def contains(self, graph_class: Hashable, source: str, target: str, version: int) -> bool:
+        """
+        Whether the route is cached, without counting a hit or miss
+        """
+        return (graph_class, source, target, version) in self._routes
+
+    def put(self, graph_class: Hashable, source: str, target: str, version: int, route: list[str]):
+        key = (graph_class, source, target, version)
+        self._routes[key] = route
+        self._routes.move_to_end(key)
+        if len(self._routes) > self.max_size:
+            self._routes.popitem(last=False)
+
+    def clear(self):
+        self._routes.clear()
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._routes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,348 @@
+import logging
+from typing import Optional
+
+from src.agents.road_condition_reporter.road_condition_delta import (
+    RoadConditionPatch,
+    apply_road_condition_patches,
+    build_edge_index,
+)
+from src.compact_graph import CompactGraph
+from src.config import ROUTING_LANDMARKS
+from src.landmarks import LandmarkRouter
+from src.regions import BoundaryRouter, RegionMap
+from src.utils import RoadGraph, shortest_path, update_edge
+from src.agents.traffic_light_controller.physical_traffic_light import TrafficLightSimulator
+from .emergency_preemption import EmergencyRouteIndex, GreenWavePlanner, PreemptionCommands
+from .route_cache import RouteCache
+
+
+class RoutePlanner:
+    """
+    Routing state and logic of the navigation manager, free of any messaging,
+    so it can be driven by the NavigatorManagerAgent as well as by the headless simulation.
+    """
+
+    def __init__(
+        self,
+        graph: RoadGraph,
+        traffic_light_timings: Optional[dict[int, TrafficLightSimulator]] = None,
+        landmarks: int = ROUTING_LANDMARKS,
+        regions: Optional[RegionMap] = None,
+    ):
+        self.normal_vehicles_graph = graph
+        # emergency vehicles must not see costs inflated by their own planned routes
+        self.emergency_vehicles_graph = graph.copy()
+        self.vehicle_positions: dict[int, tuple[str, str]] = {}
+        self.idsOfEmergencyVehiclesInNormalGraph = set()
+        # (vehicle id, route) of emergency routes planned here that raised normal graph costs, not yet shared with
+        # the other shards (only with regions)
+        self.emergency_cost_changes: list[tuple[int, list[str]]] = []
+        self.routes_of_emergency_vehicles = {}  # Initialize the routes dictionary of emergency vehicles
+        # lights to preempt per edge of each emergency route, rebuilt whenever the route changes
+        self.emergency_route_indexes: dict[int, EmergencyRouteIndex] = {}
+        # emergency routes are published as versioned changes, route or None for a completed one
+        self.emergency_routes_version: int = 0
+        self.emergency_route_changes: dict[int, Optional[list[str]]] = {}
+        self.preemption_commands = PreemptionCommands()
+        # predictive preemption needs phase timings of the lights, without them lights are preempted on position updates
+        self.green_wave: Optional[GreenWavePlanner] = (
+            GreenWavePlanner(traffic_light_timings) if traffic_light_timings is not None else None
+        )
+        # bumped whenever costs of the given graph class change, invalidates cached routes
+        self.graph_versions: dict[str, int] = {"normal": 0, "emergency": 0}
+        self.route_cache = RouteCache()
+        # ALT routers per graph class, only for CompactGraph
+        self.landmarks = landmarks
+        self.landmark_routers: dict[str, LandmarkRouter] = {}
+        # with a partition (a sharded manager), routes are stitched from boundary-to-boundary paths per graph class
+        self.regions = regions
+        self.boundary_routers: dict[str, BoundaryRouter] = {}
+        # sequence number of the last applied road condition update, None until the first snapshot
+        self.road_condition_seq: Optional[int] = None
+        self.emergency_edge_index = build_edge_index(self.emergency_vehicles_graph)
+        # vehicle id -> {"target", "isEmergency", "route"} of vehicles subscribed for route updates
+        self.route_subscriptions: dict[int, dict] = {}
+
+    def roads_graph(self, isEmergency: bool) -> RoadGraph:
+        return self.emergency_vehicles_graph if isEmergency else self.normal_vehicles_graph
+
+    def bump_graph_version(self, graph: RoadGraph):
+        """
+        Marks every graph class backed by the given graph object as changed
+        (normal and emergency graphs may share one object).
+        """
+        if graph is self.normal_vehicles_graph:
+            self.graph_versions["normal"] += 1
+        if graph is self.emergency_vehicles_graph:
+            self.graph_versions["emergency"] += 1
+
+    def landmark_router(self, graph_class: str, graph: RoadGraph) -> Optional[LandmarkRouter]:
+        """
+        ALT router of the graph class, rebound when the graph object was replaced (e.g. by a road condition snapshot)
+        """
+        if not self.landmarks or not isinstance(graph, CompactGraph):
+            return None
+        router = self.landmark_routers.get(graph_class)
+        if router is None or router.graph is not graph:
+            # graph classes share the topology, so tables of any existing router are a good start
+            existing = router or next(iter(self.landmark_routers.values()), None)
+            router = existing.for_graph(graph) if existing is not None else LandmarkRouter(graph, self.landmarks)
+            self.landmark_routers[graph_class] = router
+        return router
+
+    def boundary_router(self, graph_class: str, graph: RoadGraph) -> BoundaryRouter:
+        """
+        Boundary router of the graph class, rebound when the graph object was replaced, refreshed on cost changes
+        """
+        router = self.boundary_routers.get(graph_class)
+        if router is None or router.graph is not graph:
+            existing = router or next(iter(self.boundary_routers.values()), None)
+            router = existing.for_graph(graph) if existing is not None else BoundaryRouter(graph, self.regions)
+            self.boundary_routers[graph_class] = router
+        router.refresh(self.graph_versions[graph_class])
+        return router
+
+    def find_route(self, isEmergency: bool, source: str, target: str) -> list[str]:
+        graph_class = "emergency" if isEmergency else "normal"
+        version = self.graph_versions[graph_class]
+        route = self.route_cache.get(graph_class, source, target, version)
+        if route is None:
+            graph = self.roads_graph(isEmergency)
+            router = (
+                self.boundary_router(graph_class, graph)
+                if self.regions is not None
+                else self.landmark_router(graph_class, graph)
+            )
+            if router is not None:
+                route = router.shortest_path(source, target)
+            else:
+                route = shortest_path(graph, source, target, weight="cost")
+            self.route_cache.put(graph_class, source, target, version, route)
+        return route
+
+    def missing_routes(self, requests: list[tuple[bool, str, str]]) -> dict[str, list[tuple[str, str]]]:
+        """
+        (source, target) pairs per graph class of the (isEmergency, source, target) requests not cached
+        for the current graph versions, so they can be computed elsewhere (see store_routes)
+        """
+        missing: dict[str, dict[tuple[str, str], None]] = {}
+        for isEmergency, source, target in requests:
+            graph_class = "emergency" if isEmergency else "normal"
+            if not self.route_cache.contains(graph_class, source, target, self.graph_versions[graph_class]):
+                missing.setdefault(graph_class, {})[(source, target)] = None
+        return {graph_class: list(pairs) for graph_class, pairs in missing.items()}
+
+    def store_routes(
+        self, graph_class: str, pairs: list[tuple[str, str]], results: list[tuple[int, Optional[list[str]]]]
+    ) -> int:
+        """
+        Caches routes computed elsewhere for the given graph version, routes of an outdated version are dropped
+        (find_route computes them again). Returns the number of cached routes.
+        """
+        stored = 0
+        for (source, target), (version, route) in zip(pairs, results):
+            if route is not None and version == self.graph_versions[graph_class]:
+                self.route_cache.put(graph_class, source, target, version, route)
+                stored += 1
+        return stored
+
+    def route_request(
+        self, vehicleId: int, target: str, isEmergency: bool, source: Optional[str] = None
+    ) -> tuple[bool, str, str]:
+        """
+        (isEmergency, source, target) of the route plan_route will look up
+        """
+        return isEmergency, self.vehicle_source(vehicleId, source), target
+
+    def subscription_route_requests(self) -> list[tuple[bool, str, str]]:
+        """
+        (isEmergency, source, target) of the routes changed_routes will look up
+        """
+        return [
+            (subscription["isEmergency"], self.vehicle_source(vehicleId, subscription["route"][0]), subscription["target"])
+            for vehicleId, subscription in self.route_subscriptions.items()
+        ]
+
+    def vehicle_source(self, vehicleId: int, default: Optional[str] = None) -> str:
+        """
+        Start node of the edge the vehicle is on, the given default (or "A") if it has not reported yet
+        """
+        return self.vehicle_positions.get(vehicleId, (default or "A",))[0]
+
+    def set_emergency_route(self, vehicleId: int, route: list[str]):
+        if self.routes_of_emergency_vehicles.get(vehicleId) != route:
+            self.emergency_route_changes[vehicleId] = route
+        self.routes_of_emergency_vehicles[vehicleId] = route
+        if vehicleId not in self.emergency_route_indexes or self.emergency_route_indexes[vehicleId].route != route:
+            self.emergency_route_indexes[vehicleId] = EmergencyRouteIndex(self.emergency_vehicles_graph, route)
+
+    def update_vehicle_position(self, vehicleId: int, edge: tuple[str, str]):
+        self.vehicle_positions[vehicleId] = edge
+
+    def plan_route(
+        self, vehicleId: int, target: str, isEmergency: bool, source: Optional[str] = None
+    ) -> tuple[list[str], bool]:
+        """
+        Returns route from the current vehicle position and whether planning it changed the normal graph costs
+        """
+        route = self.find_route(isEmergency, source=self.vehicle_source(vehicleId, source), target=target)
+        if isEmergency:
+            self.set_emergency_route(vehicleId, route)
+            logging.debug(f"[NAVIGATION MANAGER] Emergency vehicle {vehicleId} route: {route}")
+
+        costs_changed = isEmergency and self.raise_emergency_route_costs(vehicleId, route)
+        if costs_changed and self.regions is not None:
+            self.emergency_cost_changes.append((vehicleId, route))
+
+        vehicleType = " Emergency" if isEmergency else " Normal"
+        logging.debug(f"[NAVIGATION MANAGER] Generated route: {route} for vehicle {vehicleId} - {vehicleType} (route cache: {self.route_cache.stats()})")
+        return route, costs_changed
+
+    def raise_emergency_route_costs(self, vehicleId: int, route: list[str]) -> bool:
+        """
+        Raises normal graph costs along the route of an emergency vehicle, once per vehicle
+        (also for routes planned by other shards), returns whether the costs changed
+        """
+        if vehicleId in self.idsOfEmergencyVehiclesInNormalGraph:
+            return False
+        for i in range(len(route) - 1):
+            u, v = route[i], route[i + 1]
+            # Increase the cost of the emergency route edges
+            edge_data = self.normal_vehicles_graph.get_edge_data(u, v)
+            if edge_data is not None:
+                if 'numOfEmergencyVehPlanned' not in edge_data:
+                    planned = 0
+                else:
+                    planned = edge_data['numOfEmergencyVehPlanned'] + 1
+                update_edge(
+                    self.normal_vehicles_graph, u, v, cost=edge_data['cost'] * 3, numOfEmergencyVehPlanned=planned
+                )
+
+        self.idsOfEmergencyVehiclesInNormalGraph.add(vehicleId)
+        self.bump_graph_version(self.normal_vehicles_graph)
+        return True
+
+    def take_emergency_cost_changes(self) -> list[tuple[int, list[str]]]:
+        """
+        (vehicle id, route) of emergency routes that raised costs since the previous call, for the other shards
+        """
+        changes = self.emergency_cost_changes
+        self.emergency_cost_changes = []
+        return changes
+
+    def subscribe(
+        self, vehicleId: int, target: str, isEmergency: bool, source: Optional[str] = None
+    ) -> tuple[list[str], bool]:
+        route, costs_changed = self.plan_route(vehicleId, target, isEmergency, source)
+        self.route_subscriptions[vehicleId] = {
+            "target": target,
+            "isEmergency": isEmergency,
+            "route": route,
+        }
+        return route, costs_changed
+
+    def unsubscribe(self, vehicleId: int):
+        """
+        The vehicle has finished, its emergency route (if any) is not alerted nor preempted any more
+        """
+        self.route_subscriptions.pop(vehicleId, None)
+        if self.routes_of_emergency_vehicles.pop(vehicleId, None) is not None:
+            self.emergency_route_changes[vehicleId] = None
+        self.emergency_route_indexes.pop(vehicleId, None)
+        if self.green_wave is not None:
+            self.green_wave.forget(vehicleId)
+
+    def take_emergency_route_changes(self) -> Optional[dict]:
+        """
+        Emergency routes created, replanned or completed since the previous call under a new version,
+        None if nothing changed
+        {
+            "version": 1,
+            "updated": {<vehicle_id>: <route>, ...},
+            "removed": [<vehicle_id>, ...]
+        }
+        """
+        if not self.emergency_route_changes:
+            return None
+        self.emergency_routes_version += 1
+        changes = self.emergency_route_changes
+        self.emergency_route_changes = {}
+        return {
+            "version": self.emergency_routes_version,
+            "updated": {vehicleId: route for vehicleId, route in changes.items() if route is not None},
+            "removed": [vehicleId for vehicleId, route in changes.items() if route is None],
+        }
+
+    def emergency_routes_snapshot(self) -> dict:
+        """
+        All emergency routes, pending changes are folded into a new version (the receiver replaces its routes)
+        {
+            "version": 1,
+            "routes": {<vehicle_id>: <route>, ...}
+        }
+        """
+        self.take_emergency_route_changes()
+        return {"version": self.emergency_routes_version, "routes": self.routes_of_emergency_vehicles}
+
+    def changed_routes(self) -> list[tuple[int, list[str]]]:
+        """
+        Recomputes routes of subscribed vehicles after a cost change,
+        returns (vehicle id, route) only for vehicles whose best path changed.
+        """
+        changed = []
+        for vehicleId, subscription in self.route_subscriptions.items():
+            isEmergency = subscription["isEmergency"]
+            previous = subscription["route"]
+            source = self.vehicle_source(vehicleId, previous[0])
+            route = self.find_route(isEmergency, source, subscription["target"])
+            # still driving along the previous route
+            if source in previous and previous[previous.index(source):] == route:
+                continue
+            subscription["route"] = route
+            if isEmergency:
+                self.set_emergency_route(vehicleId, route)
+            logging.debug(f"[NAVIGATION MANAGER] Best path changed for vehicle {vehicleId}, new route: {route}")
+            changed.append((vehicleId, route))
+        return changed
+
+    def apply_road_condition_snapshot(self, graph: RoadGraph, seq: int):
+        self.emergency_vehicles_graph = graph
+        self.emergency_edge_index = build_edge_index(graph)
+        self.road_condition_seq = seq
+        self.graph_versions["emergency"] += 1
+
+    def apply_road_condition_delta(self, seq: int, patches: list[RoadConditionPatch]) -> str:
+        """
+        Returns "applied", "stale" for already applied updates or "gap" when a snapshot resync is needed
+        """
+        last_seq = self.road_condition_seq
+        if last_seq is not None and seq <= last_seq:
+            return "stale"
+        if last_seq is None or seq != last_seq + 1:
+            return "gap"
+        applied = apply_road_condition_patches(self.emergency_vehicles_graph, self.emergency_edge_index, patches)
+        self.road_condition_seq = seq
+        self.bump_graph_version(self.emergency_vehicles_graph)
+        logging.debug(f"[NAVIGATION MANAGER] Applied road condition delta {seq} ({applied} edges)")
+        return "applied"
+
+    def lights_to_preempt(self, vehicleId: int, current_edge: tuple[str, str], now: float) -> list[int]:
+        """
+        Traffic lights that should be commanded GREEN now for the emergency vehicle on the given edge:
+        the light of the edge and the next one on the route, unless already held green.
+        """
+        index = self.emergency_route_indexes.get(vehicleId)
+        if index is None:
+            return []
+        return self.preemption_commands.select(index.lights_at(current_edge), now)
+
+    def plan_green_wave(
+        self, vehicleId: int, current_edge: tuple[str, str], position_in_edge: float, speed: float, now: float
+    ) -> list[tuple[int, Optional[tuple[float, float]]]]:
+        """
+        Changes of GREEN windows for lights ahead of the emergency vehicle, see GreenWavePlanner.plan
+        """
+        index = self.emergency_route_indexes.get(vehicleId)
+        if index is None or self.green_wave is None or speed <= 0:
+            return []
+        return self.green_wave.plan(vehicleId, index, current_edge, position_in_edge, speed, now)
@@ -0,0 +1,236 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+from typing import Optional
+
+import networkx
+
+from src.compact_graph import CompactGraph
+from src.regions import RegionMap
+from src.utils import RoadGraph, update_edge
+from .route_planner import RoutePlanner
+
+GRAPH_CLASSES = ("normal", "emergency")
+# graph version of routes not computed by a worker, matches no planner version so store_routes drops them
+NO_VERSION = -1
+
+
+def cost_table(graph: RoadGraph) -> tuple[list[int], list[float]]:
+    """
+    (edge ids, costs) of all edges, edges are matched by id so a replaced graph may list them in another order
+    """
+    if isinstance(graph, CompactGraph):
+        return graph.edge_id.tolist(), graph.cost.tolist()
+    ids, costs = [], []
+    for _, _, data in graph.edges(data=True):
+        ids.append(data["id"])
+        costs.append(data["cost"])
+    return ids, costs
+
+
+def run_route_worker(graph: RoadGraph, landmarks: int, regions: Optional[RegionMap], requests, results):
+    """
+    Worker process: keeps its own copy of the normal and emergency graph, applies cost broadcasts
+    and answers route batches in the order they were queued.
+
+    Requests: ("costs", graph class, version, edge ids, costs) of changed edges,
+    ("routes", batch id, graph class, [(source, target)]) or None to stop.
+    Results: (batch id, graph version, routes, None), None for pairs without a path,
+    or (batch id, graph version, None, error) if the batch failed - the worker keeps serving the next ones.
+    """
+    planner = RoutePlanner(graph, landmarks=landmarks, regions=regions)
+    edges = {data["id"]: (u, v) for u, v, data in graph.edges(data=True)}
+    versions = {graph_class: 0 for graph_class in GRAPH_CLASSES}
+    diverged: set[str] = set()  # graph classes whose costs could not be applied
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        if request[0] == "costs":
+            _, graph_class, version, ids, costs = request
+            roads_graph = planner.roads_graph(graph_class == "emergency")
+            planner.graph_versions[graph_class] += 1
+            if graph_class in diverged:
+                continue
+            try:
+                for id_, cost in zip(ids, costs):
+                    u, v = edges[id_]
+                    if roads_graph.get_edge_data(u, v)["cost"] != cost:
+                        update_edge(roads_graph, u, v, cost=cost)
+                versions[graph_class] = version
+            except Exception as e:
+                # costs are partly applied and later broadcasts carry only changed edges,
+                # so routes of the class are reported for no version from now on
+                logging.exception(f"[ROUTE WORKER] Failed to apply {graph_class} costs of version {version}: {e}")
+                diverged.add(graph_class)
+                versions[graph_class] = NO_VERSION
+            continue
+        _, batch_id, graph_class, pairs = request
+        try:
+            routes = []
+            for source, target in pairs:
+                try:
+                    routes.append(planner.find_route(graph_class == "emergency", source, target))
+                except (networkx.NetworkXNoPath, networkx.NodeNotFound):
+                    routes.append(None)
+            results.put((batch_id, versions[graph_class], routes, None))
+        except Exception as e:
+            logging.exception(f"[ROUTE WORKER] Route batch {batch_id} failed: {e}")
+            results.put((batch_id, versions[graph_class], None, repr(e)))
+
+
+class RouteWorkerPool:
+    """
+    Computes routes in worker processes, so a slow search never stalls the manager's event loop.
+    Every worker holds a read-only copy of the graph, costs of changed edges are broadcast to all of them
+    (sync_costs, before the next batch, queues keep the order). Requests go in as batches split between workers;
+    at most max_pending routes are in flight, further callers wait (backpressure instead of a growing backlog).
+    A batch that fails, is not answered within timeout seconds or has no live worker yields no routes,
+    the planner then computes them in the event loop (find_route).
+    """
+
+    def __init__(
+        self,
+        graph: RoadGraph,
+        workers: int = 2,
+        max_pending: int = 256,
+        batch_size: int = 32,
+        landmarks: int = 0,
+        regions: Optional[RegionMap] = None,
+        timeout: float = 5.0,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.batch_size = max(1, min(batch_size, max_pending))
+        self.max_pending = max_pending
+        context = multiprocessing.get_context("spawn")
+        self.requests = [context.Queue() for _ in range(workers)]
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(
+                target=run_route_worker, args=(graph, landmarks, regions, requests, self.results), daemon=True
+            )
+            for requests in self.requests
+        ]
+        # graph class -> version of the costs last broadcast to the workers
+        self.versions: dict[str, int] = {graph_class: 0 for graph_class in GRAPH_CLASSES}
+        # graph class -> edge id -> cost last broadcast (the workers start with the costs of graph)
+        ids, costs = cost_table(graph)
+        self.costs: dict[str, dict[int, float]] = {graph_class: dict(zip(ids, costs)) for graph_class in GRAPH_CLASSES}
+        self.in_flight: list[int] = [0] * workers  # batches queued per worker
+        self._batch_ids = itertools.count()
+        self._waiting: dict[int, tuple[asyncio.Future, int]] = {}  # batch id -> (future, worker)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pending: int = 0  # routes queued or being computed
+        self._capacity: Optional[asyncio.Condition] = None
+        self._reader: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Starts the workers, call from the event loop that awaits the routes
+        """
+        self._loop = asyncio.get_running_loop()
+        self._capacity = asyncio.Condition()
+        for process in self.processes:
+            process.start()
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def _read_results(self):
+        while True:
+            result = self.results.get()
+            if result is None:
+                return
+            self._loop.call_soon_threadsafe(self._resolve, *result)
+
+    def _resolve(
+        self, batch_id: int, version: int, routes: Optional[list[Optional[list[str]]]], error: Optional[str]
+    ):
+        future, worker = self._waiting.pop(batch_id)
+        self.in_flight[worker] -= 1
+        if future.done():  # timed out
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(f"route worker {worker} failed: {error}"))
+        else:
+            future.set_result((version, routes))
+
+    def sync_costs(self, graph_class: str, graph: RoadGraph, version: int):
+        """
+        Broadcasts costs of the graph class that changed since the last broadcast to every worker
+        """
+        if self.versions[graph_class] == version:
+            return
+        last = self.costs[graph_class]
+        ids, costs = [], []
+        for id_, cost in zip(*cost_table(graph)):
+            if last.get(id_) != cost:
+                last[id_] = cost
+                ids.append(id_)
+                costs.append(cost)
+        # sent even without changed edges, the workers report routes for the new version
+        for requests in self.requests:
+            requests.put(("costs", graph_class, version, ids, costs))
+        self.versions[graph_class] = version
+
+    def live_workers(self) -> list[int]:
+        return [worker for worker, process in enumerate(self.processes) if process.is_alive()]
+
+    async def _run_batch(self, graph_class: str, pairs: list[tuple[str, str]]) -> tuple[int, list[Optional[list[str]]]]:
+        # the whole batch is admitted at once, taking slots one by one could deadlock concurrent batches
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: self.pending + len(pairs) <= self.max_pending)
+            self.pending += len(pairs)
+        try:
+            workers = self.live_workers()
+            if not workers:
+                logging.warning(f"[NAVIGATION MANAGER] No route worker alive, routing {len(pairs)} pairs in the event loop")
+                return NO_VERSION, [None] * len(pairs)
+            worker = min(workers, key=self.in_flight.__getitem__)
+            batch_id = next(self._batch_ids)
+            future = self._loop.create_future()
+            # stays registered after a timeout, a late result still frees the worker's slot
+            self._waiting[batch_id] = (future, worker)
+            self.in_flight[worker] += 1
+            self.requests[worker].put(("routes", batch_id, graph_class, pairs))
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                logging.warning(
+                    f"[NAVIGATION MANAGER] Route worker {worker} did not answer within {self.timeout} s, "
+                    f"routing {len(pairs)} pairs in the event loop"
+                )
+            except RuntimeError as e:
+                logging.warning(f"[NAVIGATION MANAGER] {e}, routing {len(pairs)} pairs in the event loop")
+            return NO_VERSION, [None] * len(pairs)
+        finally:
+            async with self._capacity:
+                self.pending -= len(pairs)
+                self._capacity.notify_all()
+
+    async def routes(
+        self, graph_class: str, pairs: list[tuple[str, str]]
+    ) -> list[tuple[int, Optional[list[str]]]]:
+        """
+        (graph version, route) for every (source, target) pair, route None if there is no path
+        (version NO_VERSION if the batch could not be computed by a worker).
+        Pairs are split into batches of batch_size computed in parallel by the least busy workers.
+        """
+        batches = [pairs[i:i + self.batch_size] for i in range(0, len(pairs), self.batch_size)]
+        results = await asyncio.gather(*(self._run_batch(graph_class, batch) for batch in batches))
+        return [(version, route) for version, routes in results for route in routes]
+
+    def stop(self):
+        for requests in self.requests:
+            requests.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.results.put(None)
+        if self._reader is not None:
+            self._reader.join(timeout=5)
+        for future, _ in self._waiting.values():
+            future.cancel()
+        self._waiting.clear()
+        logging.info("[NAVIGATION MANAGER] Route workers stopped")
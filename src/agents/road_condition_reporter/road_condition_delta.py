@@ -0,0 +1,98 @@
+import time
+from src.utils import RoadGraph, update_edge
+from typing import Callable, Optional, Tuple
+
+CONDITION_MULTIPLIERS = {
+    "NONE": 1,
+    "LOW": 1.5,
+    "MEDIUM": 3,
+    "HIGH": 5,
+    "CRITICAL": 10,
+}
+
+# (edge_id, condition, cost_factor)
+RoadConditionPatch = Tuple[int, str, float]
+
+
+def build_edge_index(graph: RoadGraph) -> dict[int, Tuple[str, str]]:
+    """
+    returns mapping edge id -> (node1, node2)
+    """
+    return {data["id"]: (u, v) for u, v, data in graph.edges(data=True)}
+
+
+def edge_condition_update(edge_data: dict, condition: str, cost_factor: float) -> dict:
+    """
+    Rescales the edge cost from its previous condition factor to the new one,
+    so other cost changes (e.g. planned emergency routes) are preserved.
+    Returns attributes to update.
+    """
+    previous_factor = edge_data.get("cost_factor", 1)
+    return {
+        "cost": edge_data["cost"] / previous_factor * cost_factor,
+        "cost_factor": cost_factor,
+        "condition": condition,
+    }
+
+
+def set_edge_condition(edge_data: dict, condition: str, cost_factor: float):
+    edge_data.update(edge_condition_update(edge_data, condition, cost_factor))
+
+
+def apply_road_condition_patches(
+    graph: RoadGraph, edge_index: dict[int, Tuple[str, str]], patches: list[RoadConditionPatch]
+) -> int:
+    """
+    Applies patches in place, returns number of patched edges
+    """
+    applied = 0
+    for edge_id, condition, cost_factor in patches:
+        edge: Optional[Tuple[str, str]] = edge_index.get(edge_id)
+        edge_data = graph.get_edge_data(*edge) if edge is not None else None
+        if edge_data is None:
+            continue
+        update_edge(graph, *edge, **edge_condition_update(edge_data, condition, cost_factor))
+        applied += 1
+    return applied
+
+
+class RoadConditionResync:
+    """
+    Keeps one snapshot resync in flight per receiver: while it is pending, deltas are buffered instead of each
+    reporting the gap again (every request makes the reporter serialize a full snapshot). The snapshot handler
+    clears the flag and replays the buffered deltas, those older than the snapshot are skipped as stale.
+    A request unanswered for timeout seconds is repeated, in case the request or the snapshot was lost.
+    """
+
+    def __init__(self, timeout: float = 10, max_buffered: int = 1000, clock: Callable[[], float] = time.monotonic):
+        self.timeout = timeout
+        self.max_buffered = max_buffered
+        self.clock = clock
+        self.resync_pending: bool = False
+        self.requested_at: float = 0.0
+        self.buffered: list[tuple[int, list[RoadConditionPatch]]] = []
+
+    def request(self) -> bool:
+        """
+        Whether a resync request should be sent now, marks it pending if so
+        """
+        if self.resync_pending and self.clock() - self.requested_at < self.timeout:
+            return False
+        self.resync_pending = True
+        self.requested_at = self.clock()
+        return True
+
+    def buffer(self, seq: int, patches: list[RoadConditionPatch]):
+        # past the limit the oldest deltas are dropped, a gap after the replay just requests another snapshot
+        if len(self.buffered) >= self.max_buffered:
+            self.buffered.pop(0)
+        self.buffered.append((seq, patches))
+
+    def snapshot_received(self) -> list[tuple[int, list[RoadConditionPatch]]]:
+        """
+        Clears the pending flag, returns buffered deltas to replay in sequence order
+        """
+        buffered = sorted(self.buffered, key=lambda delta: delta[0])
+        self.resync_pending = False
+        self.buffered = []
+        return buffered
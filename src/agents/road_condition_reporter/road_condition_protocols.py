@@ -2,4 +2,9 @@ from enum import Enum
 
 class RoadConditionProtocols(Enum):
     SEND_ROAD_CONDITION = "send_road_condition"
-    REQUEST_ROAD_CONDITION = "request_road_condition"
\ No newline at end of file
+    # full snapshot of the graph (node_link_data) stamped with the current sequence number
+    REQUEST_ROAD_CONDITION = "request_road_condition"
+    # sequence-numbered per-edge patches: [[edge_id, condition, cost_factor], ...]
+    ROAD_CONDITION_DELTA = "road_condition_delta"
+    # sent to the reporter when a gap in delta sequence numbers is detected
+    REQUEST_ROAD_CONDITION_RESYNC = "request_road_condition_resync"
@@ -2,59 +2,129 @@ import logging
 
 logging.getLogger().setLevel(logging.INFO)
 from src.agents.road_condition_reporter.road_condition_protocols import RoadConditionProtocols
-from spade.agent import Agent
+from src.agents.road_condition_reporter.road_condition_delta import (
+    CONDITION_MULTIPLIERS,
+    RoadConditionPatch,
+    set_edge_condition,
+)
+from src.metrics import InstrumentedAgent
 from spade.template import Template
 from spade.behaviour import OneShotBehaviour
 from spade.behaviour import PeriodicBehaviour
 from spade.message import Message
-from ...config import SERVER_ADDRESS
-import json
+import datetime
+from src.codec import set_body
+from src.regions import navigation_manager_jid
+from typing import Optional
 import networkx as nx
 import random
 
 
-class RoadConditionReporter(Agent):
-    def __init__(self, jid, password, graph: nx.Graph, verify_security=False):
+class RoadConditionReporter(InstrumentedAgent):
+    def __init__(
+        self,
+        jid,
+        password,
+        graph: nx.Graph,
+        verify_security=False,
+        observers: list[str] = (),
+        managers: Optional[list[str]] = None,
+    ):
         super().__init__(jid, password, verify_security)
         self.graph = graph
+        # every navigation manager (shard) routes on the whole map, so all of them get snapshots and deltas
+        self.managers: list[str] = [navigation_manager_jid()] if managers is None else managers
+        # observers (e.g. a recording visualizer) get copies of the deltas
+        self.delta_recipients = [*self.managers, *observers]
         self.busy_edges_count = 3  # Hardcoded parameter for the number of busy edges
+        self.delta_period = 5  # seconds between delta updates
+        self.seq = 0  # sequence number of the last sent update (snapshot or delta)
 
-    def update_graph_with_curr_conditions(self):
+    def update_graph_with_curr_conditions(self, edges=None) -> list[RoadConditionPatch]:
+        """
+        Draws a new condition for the given edges (all edges by default).
+        Returns patches for edges whose condition changed.
+        """
 
         # Define conditions and their probabilities
         conditions = ["NONE", "LOW", "MEDIUM", "HIGH", "CRITICAL"]
         probabilities = [0.5, 0.3, 0.15, 0.04, 0.01]  # Adjust probabilities as needed
 
-        condition_multipliers = {
-            "NONE": 1,
-            "LOW": 1.5,
-            "MEDIUM": 3,
-            "HIGH": 5,
-            "CRITICAL": 10
-        }
+        if edges is None:
+            edges = self.graph.edges()
 
-        for u, v, data in self.graph.edges(data=True):
+        patches: list[RoadConditionPatch] = []
+        for u, v in edges:
             # Select a condition based on the defined probabilities
             condition = random.choices(conditions, probabilities)[0]
-            logging.info(f"[ROAD CONDITION MANAGER] Edge {u} -> {v} has condition {condition}: {self.graph[u][v]}")
-            self.graph[u][v]["condition"] = condition
-            self.graph[u][v]["cost"] *= condition_multipliers[condition]
+            logging.debug(f"[ROAD CONDITION MANAGER] Edge {u} -> {v} has condition {condition}: {self.graph[u][v]}")
+            if self.graph[u][v].get("condition") == condition:
+                continue
+            set_edge_condition(self.graph[u][v], condition, CONDITION_MULTIPLIERS[condition])
+            patches.append((self.graph[u][v]["id"], condition, CONDITION_MULTIPLIERS[condition]))
+
+        return patches
 
-        return self.graph
+    def snapshot_message(self, to: str) -> Message:
+        msg = Message(to)
+        msg.set_metadata("msg_type", RoadConditionProtocols.REQUEST_ROAD_CONDITION.value)
+        graph_data = nx.readwrite.json_graph.node_link_data(self.graph)
+        set_body(msg, {"seq": self.seq, "updated_graph": graph_data})
+        return msg
 
     class SendRoadCondition(OneShotBehaviour):
         async def run(self):
-                msg = Message(f"navigation_manager@{SERVER_ADDRESS}")
-                msg.set_metadata("msg_type", RoadConditionProtocols.REQUEST_ROAD_CONDITION.value)
                 # invoke a method that will return the road condition
-                updated_graph_with_busy_edges = self.agent.update_graph_with_curr_conditions()
-                graph_data = nx.readwrite.json_graph.node_link_data(updated_graph_with_busy_edges)
-                msg.body = json.dumps({"updated_graph": graph_data})
-                logging.info(f"[ROAD CONDITION MANAGER] Road condition: {graph_data}")
+                self.agent.update_graph_with_curr_conditions()
+                logging.info(f"[ROAD CONDITION MANAGER] Road condition snapshot {self.agent.seq}")
+                for to in self.agent.managers:
+                    await self.send(self.agent.snapshot_message(to))
+
+    class SendRoadConditionDelta(PeriodicBehaviour):
+        """
+        Sends only the edges whose condition changed
+        {
+            "seq": 1,
+            "patches": [[<edge_id>, <condition>, <cost_factor>], ...]
+        }
+        """
+        async def run(self):
+            edges = list(self.agent.graph.edges())
+            busy_edges = random.sample(edges, min(self.agent.busy_edges_count, len(edges)))
+            patches = self.agent.update_graph_with_curr_conditions(busy_edges)
+            if not patches:
+                return
+            self.agent.seq += 1
+            logging.debug(f"[ROAD CONDITION MANAGER] Road condition delta {self.agent.seq}: {patches}")
+            for to in self.agent.delta_recipients:
+                msg = Message(to)
+                msg.set_metadata("msg_type", RoadConditionProtocols.ROAD_CONDITION_DELTA.value)
+                set_body(msg, {"seq": self.agent.seq, "patches": patches})
                 await self.send(msg)
 
+    class SendRoadConditionSnapshotOnRequest(OneShotBehaviour):
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                logging.info(f"[ROAD CONDITION MANAGER] Resync requested by {msg.sender}, sending snapshot {self.agent.seq}")
+                await self.send(self.agent.snapshot_message(str(msg.sender)))
+
     async def setup(self):
         behaviourSendRoadCondition = self.SendRoadCondition()
         templateSendRoadCondition = Template()
         templateSendRoadCondition.set_metadata("msg_type", RoadConditionProtocols.SEND_ROAD_CONDITION.value)
         self.add_behaviour(behaviourSendRoadCondition)
+
+        # first delta goes out after the initial snapshot
+        behaviourSendRoadConditionDelta = self.SendRoadConditionDelta(
+            period=self.delta_period,
+            start_at=datetime.datetime.now() + datetime.timedelta(seconds=self.delta_period),
+        )
+        self.add_behaviour(behaviourSendRoadConditionDelta)
+
+        behaviourResync = self.SendRoadConditionSnapshotOnRequest()
+        templateResync = Template()
+        templateResync.set_metadata("msg_type", RoadConditionProtocols.REQUEST_ROAD_CONDITION_RESYNC.value)
+        self.add_behaviour(behaviourResync, templateResync)
@@ -0,0 +1,68 @@
+import logging
+
+logging.getLogger().setLevel(logging.INFO)
+from src.metrics import InstrumentedAgent
+from spade.behaviour import PeriodicBehaviour
+from spade.message import Message
+from src.codec import set_body
+from src.regions import navigation_manager_jid
+from typing import Optional
+from ...config import SERVER_ADDRESS
+from .telemetry_buffer import TelemetryBuffer
+
+
+def telemetry_consumers(managers: Optional[list[str]] = None) -> list[tuple[str, str, str, float]]:
+    """
+    Consumers of vehicle telemetry: (buffer key, receiver, batch message type, period in seconds).
+    Positions for navigation managers are keyed by the manager JID, vehicles report to the shard owning their edge.
+    """
+    return [
+        *((jid, jid, "send_vehicle_position_batch", 1) for jid in managers or [navigation_manager_jid()]),
+        ("visualizer", f"visualizer@{SERVER_ADDRESS}", "vehicle_position_update_batch", 0.1),
+    ]
+
+
+class TelemetryAggregatorAgent(InstrumentedAgent):
+    """
+    Sends positions reported to the telemetry buffer as one message per consumer and tick,
+    so the number of stanzas does not grow with the fleet.
+    """
+
+    def __init__(
+        self,
+        jid,
+        password,
+        buffer: TelemetryBuffer,
+        verify_security=False,
+        consumers: Optional[list[tuple[str, str, str, float]]] = None,
+    ):
+        super().__init__(jid, password, verify_security)
+        self.buffer = buffer
+        self.consumers = telemetry_consumers() if consumers is None else consumers
+
+    class SendBatch(PeriodicBehaviour):
+        """
+        Sends
+        {
+            "positions": [<position message body>, ...]
+        }
+        """
+        def __init__(self, consumer: str, to: str, msg_type: str, period: float):
+            super().__init__(period=period)
+            self.consumer = consumer
+            self.to = to
+            self.msg_type = msg_type
+
+        async def run(self):
+            positions = self.agent.buffer.take(self.consumer)
+            if not positions:
+                return
+            msg = Message(to=self.to)
+            msg.set_metadata("msg_type", self.msg_type)
+            set_body(msg, {"positions": positions})
+            logging.debug(f"[TELEMETRY AGGREGATOR] Sending {len(positions)} positions to {self.to}")
+            await self.send(msg)
+
+    async def setup(self):
+        for consumer, to, msg_type, period in self.consumers:
+            self.add_behaviour(self.SendBatch(consumer, to, msg_type, period))
@@ -0,0 +1,32 @@
+from typing import Iterable, Optional
+
+
+class TelemetryBuffer:
+    """
+    Latest message body of every vehicle per consumer, collected between two flushes.
+    Vehicles running in the same process report here instead of sending a message each,
+    the telemetry aggregator takes one batch per consumer and tick.
+    """
+
+    def __init__(self, consumers: Iterable[str]):
+        self._pending: dict[str, dict[int, dict]] = {consumer: {} for consumer in consumers}
+
+    def report(self, consumer: str, vehicle_id: int, body: dict):
+        # a newer report replaces one not flushed yet
+        self._pending[consumer][vehicle_id] = body
+
+    def forget(self, vehicle_id: int, consumer: Optional[str] = None):
+        """
+        Drops pending reports of a vehicle that finished (or left the consumer's region),
+        so none arrive after it unsubscribed
+        """
+        for key, pending in self._pending.items():
+            if consumer is None or key == consumer:
+                pending.pop(vehicle_id, None)
+
+    def take(self, consumer: str) -> list[dict]:
+        pending = self._pending[consumer]
+        if not pending:
+            return []
+        self._pending[consumer] = {}
+        return list(pending.values())
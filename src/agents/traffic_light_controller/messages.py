@@ -1,8 +1,17 @@
 from enum import Enum
+from typing import Optional
+
+from spade.message import Message
+from ...codec import set_body
+from ...config import SERVER_ADDRESS, LIGHTS_PER_CONTROLLER
 
 class TrafficLightProtocols(str, Enum):
     SEND_TRAFFIC_LIGHT = "send_traffic_light"
     SEND_TRAFFIC_LIGHT_ON_REQUEST = "send_traffic_light_on_request"
+    # subscribers get every phase change of the light pushed, together with the time of the next one
+    SUBSCRIBE_TRAFFIC_LIGHT = "subscribe_traffic_light"
+    UNSUBSCRIBE_TRAFFIC_LIGHT = "unsubscribe_traffic_light"
+    TRAFFIC_LIGHT_PHASE_CHANGE = "traffic_light_phase_change"
 
 class TrafficLight(str, Enum):
     RED = "RED"
@@ -15,3 +24,41 @@ class TrafficLightStateMsg:
     def __init__(self, traffic_light_id: int, traffic_light_state: TrafficLight):
         self.traffic_light_id = traffic_light_id
         self.traffic_light_state = traffic_light_state
+
+
+def traffic_light_district(traffic_light_id: int) -> int:
+    return (traffic_light_id - 1) // LIGHTS_PER_CONTROLLER
+
+
+def traffic_light_controller_jid(traffic_light_id: int) -> str:
+    """
+    JID of the agent controlling the given light. Messages to it should carry the light "id" in the body,
+    bank controllers route them by it.
+    """
+    if LIGHTS_PER_CONTROLLER:
+        return f"traffic_light_controller_district_{traffic_light_district(traffic_light_id)}@{SERVER_ADDRESS}"
+    return f"traffic_light_controller_{traffic_light_id}@{SERVER_ADDRESS}"
+
+
+def traffic_light_phase_message(
+    to: str, traffic_light_id: int, traffic_light: TrafficLight, next_change_at: Optional[float], msg_type: str
+) -> Message:
+    """
+    State of a light valid until next_change_at (wall clock time.time(), None if unknown)
+    {
+        "traffic_light": <RED/GREEN/...>,
+        "id": <traffic_light_id>,
+        "next_change_at": <timestamp>
+    }
+    """
+    msg = Message(to=to)
+    msg.set_metadata("msg_type", msg_type)
+    set_body(
+        msg,
+        {
+            "traffic_light": traffic_light.value,
+            "id": traffic_light_id,
+            "next_change_at": next_change_at,
+        },
+    )
+    return msg
@@ -0,0 +1,86 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class PhaseScheduler:
+    """
+    Timer heap of events keyed by e.g. traffic light id.
+    Every key has at most one pending event, scheduling it again replaces the previous one
+    (replaced entries stay in the heap and are skipped when popped).
+    All times are in seconds of the given clock.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._heap: list[Tuple[float, int, Hashable, Any]] = []
+        self._pending: dict[Hashable, Tuple[int, float]] = {}  # key -> (sequence number, deadline) of its valid heap entry
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def schedule_at(self, key: Hashable, deadline: float, event: Any):
+        seq = next(self._counter)
+        self._pending[key] = (seq, deadline)
+        heapq.heappush(self._heap, (deadline, seq, key, event))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def schedule(self, key: Hashable, delay: float, event: Any):
+        self.schedule_at(key, self.clock() + delay, event)
+
+    def cancel(self, key: Hashable):
+        self._pending.pop(key, None)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        pending = self._pending.get(key)
+        return None if pending is None else pending[1]
+
+    def _drop_stale(self):
+        while self._heap:
+            _, seq, key, _ = self._heap[0]
+            pending = self._pending.get(key)
+            if pending is not None and pending[0] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    def next_deadline(self) -> Optional[float]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[float] = None) -> list[Tuple[Hashable, Any]]:
+        """
+        Removes and returns (key, event) of all events due at the given time, in deadline order
+        """
+        if now is None:
+            now = self.clock()
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, key, event = heapq.heappop(self._heap)
+            del self._pending[key]
+            due.append((key, event))
+
+    async def wait_due(self) -> list[Tuple[Hashable, Any]]:
+        """
+        Sleeps until the earliest event is due, waking up early when something gets scheduled
+        """
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while True:
+            due = self.pop_due()
+            if due:
+                return due
+            deadline = self.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - self.clock())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._pending)
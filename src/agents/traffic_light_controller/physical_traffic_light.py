@@ -1,6 +1,12 @@
 import datetime
 from .messages import TrafficLight
-import datetime
+
+NEXT_TRAFFIC_LIGHT = {
+    TrafficLight.RED: TrafficLight.RED_YELLOW,
+    TrafficLight.RED_YELLOW: TrafficLight.GREEN,
+    TrafficLight.GREEN: TrafficLight.YELLOW,
+    TrafficLight.YELLOW: TrafficLight.RED,
+}
 
 
 class TrafficLightSimulator:
@@ -13,31 +19,38 @@ class TrafficLightSimulator:
         self.green_time: float = green_time
         self.red_yellow_time: float = red_yellow_time
 
-    def iter(self, curr_traffic_light: TrafficLight, last_changed: datetime.datetime) -> TrafficLight:
+    def phase_duration(self, traffic_light: TrafficLight) -> float:
         """
-        Returns new traffic light
+        Returns how long (in seconds) the given light is shown
         """
-        if curr_traffic_light == TrafficLight.RED:
-            if datetime.datetime.now() - last_changed >= datetime.timedelta(seconds=self.red_time):
-                return TrafficLight.RED_YELLOW
-            return TrafficLight.RED
-
-        if curr_traffic_light == TrafficLight.RED_YELLOW:
-            if datetime.datetime.now() - last_changed >= datetime.timedelta(seconds=self.red_yellow_time):
-                return TrafficLight.GREEN
-            return TrafficLight.RED_YELLOW
+        if traffic_light == TrafficLight.RED:
+            return self.red_time
+        if traffic_light == TrafficLight.RED_YELLOW:
+            return self.red_yellow_time
+        if traffic_light == TrafficLight.GREEN:
+            return self.green_time
+        if traffic_light == TrafficLight.YELLOW:
+            return self.yellow_time
+        raise ValueError(f"Unknown traffic light state: {traffic_light}")
 
-        if curr_traffic_light == TrafficLight.GREEN:
-            if datetime.datetime.now() - last_changed >= datetime.timedelta(seconds=self.green_time):
-                return TrafficLight.YELLOW
-            return TrafficLight.GREEN
+    def next_light(self, traffic_light: TrafficLight) -> TrafficLight:
+        if traffic_light not in NEXT_TRAFFIC_LIGHT:
+            raise ValueError(f"Unknown traffic light state: {traffic_light}")
+        return NEXT_TRAFFIC_LIGHT[traffic_light]
 
-        if curr_traffic_light == TrafficLight.YELLOW:
-            if datetime.datetime.now() - last_changed >= datetime.timedelta(seconds=self.yellow_time):
-                return TrafficLight.RED
-            return TrafficLight.YELLOW
+    def next_transition(self, curr_traffic_light: TrafficLight, last_changed: datetime.datetime) -> datetime.datetime:
+        """
+        Returns when the current light changes to the next one
+        """
+        return last_changed + datetime.timedelta(seconds=self.phase_duration(curr_traffic_light))
 
-        raise ValueError(f"Unknown traffic light state: {curr_traffic_light}")
+    def iter(self, curr_traffic_light: TrafficLight, last_changed: datetime.datetime) -> TrafficLight:
+        """
+        Returns new traffic light
+        """
+        if datetime.datetime.now() >= self.next_transition(curr_traffic_light, last_changed):
+            return self.next_light(curr_traffic_light)
+        return curr_traffic_light
 
 
 class PhysicalTrafficLight:
@@ -0,0 +1,81 @@
+import logging
+import time
+from typing import Optional
+
+from .messages import TrafficLight
+from .phase_scheduler import PhaseScheduler
+from .physical_traffic_light import PhysicalTrafficLight
+
+
+class TrafficLightBank:
+    """
+    Phase logic of many physical traffic lights driven by one PhaseScheduler (one pending event per light id).
+    Used by TrafficLightBankControllerAgent (and TrafficLightControllerAgent, a bank of one light) and,
+    with a virtual clock, by the headless simulation.
+    """
+
+    def __init__(self, physical_traffic_lights: dict[int, PhysicalTrafficLight], scheduler: Optional[PhaseScheduler] = None):
+        self.physical_traffic_lights: dict[int, PhysicalTrafficLight] = physical_traffic_lights
+        self.scheduler: PhaseScheduler = scheduler if scheduler is not None else PhaseScheduler()
+        now = self.scheduler.clock()
+        self.traffic_light_last_changed: dict[int, float] = {id_: now for id_ in physical_traffic_lights}
+        # ids of lights whose current state is controlled by navigator manager
+        self.controlled_by_manager: set[int] = set()
+        self.CONTROLLED_BY_MANAGER_TIMEOUT = 10  # seconds
+
+    def start(self):
+        for id_ in self.physical_traffic_lights:
+            self.schedule_next_phase(id_)
+
+    def get_traffic_light(self, id_: int) -> Optional[TrafficLight]:
+        ptl = self.physical_traffic_lights.get(id_)
+        return None if ptl is None else ptl.get_traffic_light()
+
+    def next_change_at(self, id_: int) -> Optional[float]:
+        """
+        Wall clock time (time.time()) of the next scheduled change of the light, None if nothing is scheduled
+        """
+        deadline = self.scheduler.deadline(id_)
+        return None if deadline is None else time.time() + deadline - self.scheduler.clock()
+
+    def schedule_next_phase(self, id_: int):
+        ptl = self.physical_traffic_lights[id_]
+        self.scheduler.schedule(id_, ptl.simulator.phase_duration(ptl.get_traffic_light()), "phase")
+
+    def handle_event(self, id_: int, event: str):
+        """
+        Handles a due scheduler event: next phase, or going back to auto control after a manager override.
+        The override ends like a phase does, the light advances from the held state (e.g. GREEN to YELLOW)
+        so the reported next change is when the phase actually changes.
+        """
+        ptl: PhysicalTrafficLight = self.physical_traffic_lights[id_]
+        if event == "manager_timeout":
+            logging.info(
+                f"[TRAFFIC_LIGHT {id_}] Traffic light with ID {id_} exceeded timeout of controlled by manager. Going back to auto control."
+            )
+            self.controlled_by_manager.discard(id_)
+        curr_light: TrafficLight = ptl.get_traffic_light()
+        new_light: TrafficLight = ptl.simulator.next_light(curr_light)
+        ptl.set_traffic_light(new_light)
+        logging.debug(f"[TRAFFIC_LIGHT {id_}] Traffic light with ID {id_} changed from {curr_light} to {new_light}")
+        self.traffic_light_last_changed[id_] = self.scheduler.clock()
+        self.schedule_next_phase(id_)
+
+    def set_by_manager(self, id_: int, traffic_light: TrafficLight, duration: Optional[float] = None) -> bool:
+        """
+        Holds the light in the given state for duration seconds (CONTROLLED_BY_MANAGER_TIMEOUT by default).
+        Returns False if the light is not in this bank
+        """
+        if id_ not in self.physical_traffic_lights:
+            return False
+        logging.debug(
+            f"[TRAFFIC_LIGHT {id_}] Traffic light with ID {id_} is now controlled by manager. Current state: {traffic_light}"
+        )
+        self.physical_traffic_lights[id_].set_traffic_light(traffic_light)
+        self.traffic_light_last_changed[id_] = self.scheduler.clock()
+        self.controlled_by_manager.add(id_)
+        # replaces the pending phase change, phases are frozen until the timeout
+        if duration is None:
+            duration = self.CONTROLLED_BY_MANAGER_TIMEOUT
+        self.scheduler.schedule(id_, duration, "manager_timeout")
+        return True
@@ -0,0 +1,174 @@
+import logging
+
+logging.getLogger().setLevel(logging.INFO)
+from src.metrics import InstrumentedAgent
+from spade.template import Template
+from spade.behaviour import PeriodicBehaviour, OneShotBehaviour
+from spade.message import Message
+from .physical_traffic_light import PhysicalTrafficLight
+from .traffic_light_bank import TrafficLightBank
+from .messages import TrafficLight, TrafficLightProtocols, traffic_light_phase_message
+from src.codec import get_body, set_body
+from src.regions import navigation_manager_jid
+from typing import Optional
+
+
+class TrafficLightBankControllerAgent(InstrumentedAgent):
+    """
+    Controls a bank of physical traffic lights (e.g. a district) with a single agent.
+    Messages carry the light "id" in the body, TrafficLightControllerAgent is a bank of one light.
+    """
+
+    def __init__(
+        self,
+        jid,
+        password,
+        physical_traffic_lights: dict[int, PhysicalTrafficLight],
+        verify_security=False,
+        managers: Optional[list[str]] = None,
+    ):
+        super().__init__(jid, password, verify_security)
+        self.physical_traffic_lights: dict[int, PhysicalTrafficLight] = physical_traffic_lights
+        # one pending event per light id, the agent wakes only at the earliest one
+        self.bank = TrafficLightBank(physical_traffic_lights)
+        # light id -> JIDs of agents that get its phase changes pushed
+        self.subscribers: dict[int, set[str]] = {}
+        # navigation managers that get states of the bank (shards owning an edge with any of its lights)
+        self.managers: list[str] = [navigation_manager_jid()] if managers is None else managers
+
+    def phase_message(self, id_: int, to: str, msg_type: str) -> Message:
+        return traffic_light_phase_message(
+            to, id_, self.bank.get_traffic_light(id_), self.bank.next_change_at(id_), msg_type
+        )
+
+    async def push_phase_change(self, behav, id_: int):
+        for jid in list(self.subscribers.get(id_, ())):
+            await behav.send(self.phase_message(id_, jid, TrafficLightProtocols.TRAFFIC_LIGHT_PHASE_CHANGE.value))
+
+    # Changes states of all lights at their phase boundaries, lights controlled by a manager
+    # go back to auto control when their scheduled timeout fires.
+    class ChangeTrafficLights(OneShotBehaviour):
+        async def run(self):
+            while 1:
+                for id_, event in await self.agent.bank.scheduler.wait_due():
+                    self.agent.bank.handle_event(id_, event)
+                    await self.agent.push_phase_change(self, id_)
+
+    # Periodically sends states of all lights in the bank to each navigation manager in one message.
+    class SendTrafficLightStates(PeriodicBehaviour):
+        """
+        Sent message
+        {
+            "lights": [{"id": <traffic_light_id>, "traffic_light": <RED/GREEN/...>, "next_change_at": <timestamp>}, ...]
+        }
+        """
+        async def run(self):
+            lights = [
+                {
+                    "id": id_,
+                    "traffic_light": ptl.get_traffic_light().value,
+                    "next_change_at": self.agent.bank.next_change_at(id_),
+                }
+                for id_, ptl in self.agent.physical_traffic_lights.items()
+            ]
+            for jid in self.agent.managers:
+                msg = Message(to=jid)
+                msg.set_metadata("msg_type", TrafficLightProtocols.SEND_TRAFFIC_LIGHT.value)
+                set_body(msg, {"lights": lights})
+                await self.send(msg)
+
+    class SetTrafficLightState(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "traffic_light": <RED/GREEN/...>,
+            "id": <traffic_light_id>,
+            "duration": <seconds> (optional, how long the manager controls the light)
+        }
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                msg_json = get_body(msg)
+                id_ = msg_json.get("id")
+                new_traffic_light_state: TrafficLight = TrafficLight[msg_json["traffic_light"]]
+                if not self.agent.bank.set_by_manager(id_, new_traffic_light_state, msg_json.get("duration")):
+                    logging.warning(f"[TRAFFIC_LIGHT] Bank {self.agent.jid} has no traffic light with ID {id_}")
+                    continue
+                await self.agent.push_phase_change(self, id_)
+
+    # Answers with the state of the requested light to the sender of the request.
+    class SendTrafficLightStateOnRequest(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "id": <traffic_light_id>
+        }
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                id_ = get_body(msg).get("id")
+                if id_ not in self.agent.physical_traffic_lights:
+                    logging.warning(f"[TRAFFIC_LIGHT] Bank {self.agent.jid} has no traffic light with ID {id_}")
+                    continue
+                await self.send(
+                    self.agent.phase_message(id_, str(msg.sender), TrafficLightProtocols.SEND_TRAFFIC_LIGHT_ON_REQUEST.value)
+                )
+
+    # Adds or removes the sender from subscribers of the light's phase changes,
+    # a new subscriber gets the current state right away.
+    class SubscribeTrafficLight(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "id": <traffic_light_id>
+        }
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                id_ = get_body(msg).get("id")
+                sender = str(msg.sender)
+                if msg.get_metadata("msg_type") == TrafficLightProtocols.UNSUBSCRIBE_TRAFFIC_LIGHT.value:
+                    self.agent.subscribers.get(id_, set()).discard(sender)
+                    continue
+                if id_ not in self.agent.physical_traffic_lights:
+                    logging.warning(f"[TRAFFIC_LIGHT] Bank {self.agent.jid} has no traffic light with ID {id_}")
+                    continue
+                self.agent.subscribers.setdefault(id_, set()).add(sender)
+                await self.send(
+                    self.agent.phase_message(id_, sender, TrafficLightProtocols.TRAFFIC_LIGHT_PHASE_CHANGE.value)
+                )
+
+    async def setup(self):
+        self.bank.start()
+        b1 = self.ChangeTrafficLights()
+
+        t2 = Template()
+        t2.set_metadata("msg_type", "set_traffic_light")
+        b2 = self.SetTrafficLightState()
+
+        b3 = self.SendTrafficLightStates(period=1)
+
+        t4 = Template()
+        t4.set_metadata("msg_type", "get_traffic_light_request")
+        b4 = self.SendTrafficLightStateOnRequest()
+
+        t5 = Template()
+        t5.set_metadata("msg_type", TrafficLightProtocols.SUBSCRIBE_TRAFFIC_LIGHT.value)
+        t5_unsubscribe = Template()
+        t5_unsubscribe.set_metadata("msg_type", TrafficLightProtocols.UNSUBSCRIBE_TRAFFIC_LIGHT.value)
+        b5 = self.SubscribeTrafficLight()
+
+        self.add_behaviour(b1)
+        self.add_behaviour(b2, t2)
+        self.add_behaviour(b3)
+        self.add_behaviour(b4, t4)
+        self.add_behaviour(b5, t5 | t5_unsubscribe)
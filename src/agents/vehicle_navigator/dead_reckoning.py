@@ -0,0 +1,113 @@
+import time
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from src.utils import RoadGraph
+
+
+def predict_position(position: float, speed: float, waiting: bool, elapsed: float, edge_length: float) -> float:
+    """
+    Position on the edge after elapsed seconds, vehicles move at a constant speed and stop at the end of the edge
+    """
+    if waiting:
+        return position
+    return min(edge_length, position + speed * max(0.0, elapsed))
+
+
+class PositionReport(NamedTuple):
+    edge: Tuple[str, str]
+    position: float
+    speed: float
+    waiting: bool
+    reported_at: float
+
+
+class DeadReckoningPolicy:
+    """
+    Decides when a vehicle has to report its position. The receiver extrapolates from the last report,
+    so a new one is needed only after an edge change, when the vehicle stops at or leaves a light,
+    when the extrapolation is off by more than threshold, or after max_interval seconds as a heartbeat.
+    """
+
+    def __init__(self, threshold: float = 0.5, max_interval: float = 10, clock: Callable[[], float] = time.time):
+        self.threshold = threshold
+        self.max_interval = max_interval
+        self.clock = clock
+        self.last: Optional[PositionReport] = None
+        self.sent: int = 0
+        self.suppressed: int = 0
+
+    def report_due(
+        self, edge: Tuple[str, str], position: float, speed: float, waiting: bool, edge_length: float
+    ) -> Optional[PositionReport]:
+        """
+        Returns the report to send (and remembers it as sent), None if the receiver's extrapolation is good enough
+        """
+        now = self.clock()
+        last = self.last
+        if (
+            last is not None
+            and tuple(edge) == last.edge
+            and waiting == last.waiting
+            and now - last.reported_at < self.max_interval
+            and abs(
+                predict_position(last.position, last.speed, last.waiting, now - last.reported_at, edge_length)
+                - position
+            ) <= self.threshold
+        ):
+            self.suppressed += 1
+            return None
+        self.last = PositionReport(tuple(edge), position, speed, waiting, now)
+        self.sent += 1
+        return self.last
+
+
+class PositionPredictor:
+    """
+    Last reported position of every vehicle, extrapolated to the current time along its edge
+    """
+
+    def __init__(self, graph: RoadGraph, clock: Callable[[], float] = time.time):
+        self.graph = graph
+        self.clock = clock
+        self.reports: dict[int, PositionReport] = {}
+
+    def update(
+        self,
+        vehicle_id: int,
+        edge: Tuple[str, str],
+        position: float,
+        speed: float,
+        waiting: bool = False,
+        reported_at: Optional[float] = None,
+    ):
+        self.reports[vehicle_id] = PositionReport(
+            tuple(edge), position, speed, waiting, self.clock() if reported_at is None else reported_at
+        )
+
+    def forget(self, vehicle_id: int):
+        self.reports.pop(vehicle_id, None)
+
+    def predict(self, vehicle_id: int, now: Optional[float] = None) -> Optional[Tuple[Tuple[str, str], float]]:
+        """
+        (edge, position on edge) now, None for an unknown vehicle
+        """
+        report = self.reports.get(vehicle_id)
+        if report is None:
+            return None
+        now = self.clock() if now is None else now
+        edge_length = self.graph.get_edge_data(*report.edge)["distance"]
+        position = predict_position(report.position, report.speed, report.waiting, now - report.reported_at, edge_length)
+        return report.edge, position
+
+    def moving(self) -> bool:
+        """
+        Whether any extrapolated position still changes
+        """
+        now = self.clock()
+        for report in self.reports.values():
+            if report.waiting:
+                continue
+            edge_length = self.graph.get_edge_data(*report.edge)["distance"]
+            if report.position + report.speed * (now - report.reported_at) < edge_length:
+                return True
+        return False
@@ -0,0 +1,50 @@
+import time
+from typing import Callable, Optional, Tuple
+
+from src.agents.traffic_light_controller.messages import TrafficLight
+
+
+class TrafficLightStateCache:
+    """
+    Light states pushed by traffic light controllers, each one valid until the next change announced with it.
+    Expired or unknown entries are misses, the vehicle then asks the controller directly.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.hits: int = 0
+        self.misses: int = 0
+        self._states: dict[int, Tuple[TrafficLight, Optional[float]]] = {}  # id -> (state, next change at)
+
+    def update(self, traffic_light_id: int, traffic_light: TrafficLight, next_change_at: Optional[float]):
+        self._states[traffic_light_id] = (traffic_light, next_change_at)
+
+    def update_from_body(self, msg_body: dict):
+        """
+        Updates the cache from a traffic light phase message body
+        """
+        self.update(msg_body["id"], TrafficLight[msg_body["traffic_light"]], msg_body.get("next_change_at"))
+
+    def get(self, traffic_light_id: int) -> Optional[TrafficLight]:
+        entry = self._states.get(traffic_light_id)
+        # without a known next change the state may be outdated at any moment
+        if entry is None or entry[1] is None or self.clock() >= entry[1]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def forget(self, traffic_light_id: int):
+        self._states.pop(traffic_light_id, None)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._states),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
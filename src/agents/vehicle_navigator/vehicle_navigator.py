@@ -1,17 +1,22 @@
 import logging
+import time
 
 logging.getLogger().setLevel(logging.INFO)
-from src.agents.traffic_light_controller.messages import TrafficLightProtocols
-from spade.agent import Agent
-from spade.behaviour import PeriodicBehaviour
+from src.agents.traffic_light_controller.messages import TrafficLightProtocols, traffic_light_controller_jid
+from src.metrics import InstrumentedAgent
+from spade.behaviour import PeriodicBehaviour, OneShotBehaviour
 from spade.message import Message
 from spade.template import Template
+from typing import Optional
 from ...config import SERVER_ADDRESS
+from src.regions import RegionMap, navigation_manager_jid
 from .vehicle_simulator import VehicleSimulator
-import json
+from .dead_reckoning import DeadReckoningPolicy, PositionReport
+from src.agents.telemetry_aggregator.telemetry_buffer import TelemetryBuffer
+from src.codec import get_body, set_body
 
 
-class VehicleNavigator(Agent):
+class VehicleNavigator(InstrumentedAgent):
     def __init__(
         self,
         jid: str,
@@ -21,12 +26,107 @@ class VehicleNavigator(Agent):
         vehicle_id: int,
         verify_security: bool = False,
         isEmergency: bool = False,
+        telemetry: Optional[TelemetryBuffer] = None,
+        dead_reckoning: bool = False,
+        regions: Optional[RegionMap] = None,
     ):
         super().__init__(jid, password, verify_security)
         self.simulator = simulator
         self.target_node = target_node
         self.vehicle_id = vehicle_id
         self.isEmergency = isEmergency
+        # lights whose phase changes are pushed to this vehicle
+        self.subscribed_traffic_lights: set[int] = set()
+        # with a buffer, positions are batched by the telemetry aggregator instead of sent one message each
+        self.telemetry = telemetry
+        # receivers extrapolate positions, reports are sent only when their extrapolation would be off
+        self.report_policies: Optional[dict[str, DeadReckoningPolicy]] = (
+            {"manager": DeadReckoningPolicy(), "visualizer": DeadReckoningPolicy()} if dead_reckoning else None
+        )
+        # with sharded navigation managers, the vehicle is served by the one owning its current edge
+        self.regions = regions
+        self.manager: str = self.owning_manager()
+
+    def owning_manager(self) -> str:
+        """
+        JID of the navigation manager owning the current edge (the start node before the vehicle moves)
+        """
+        if self.regions is None:
+            return navigation_manager_jid()
+        edge = self.simulator.vehicle_edge
+        return navigation_manager_jid(
+            self.regions.edge_region(edge) if edge is not None else self.regions.region_of(self.simulator.start_node)
+        )
+
+    async def subscribe_route(self, behav, source: str):
+        msg = Message(self.manager)
+        msg_body = {
+            "target": self.target_node,
+            "vehicle_id": self.vehicle_id,
+            "isEmergency": self.isEmergency,
+            "source": source,
+        }
+        msg.set_metadata("msg_type", "subscribe_route")
+        set_body(msg, msg_body)
+        await behav.send(msg)
+
+    async def unsubscribe_route(self, behav):
+        msg = Message(self.manager)
+        msg.set_metadata("msg_type", "unsubscribe_route")
+        set_body(msg, {"vehicle_id": self.vehicle_id})
+        await behav.send(msg)
+        if self.telemetry is not None:
+            self.telemetry.forget(self.vehicle_id, self.manager)
+
+    async def hand_over(self, behav, manager: str):
+        """
+        Moves the route subscription to the manager of the region the vehicle entered,
+        it plans from the start of the current edge and gets a full position report
+        """
+        logging.info(f"[VEHICLE NAVIGATOR] Vehicle {self.vehicle_id} handed over from {self.manager} to {manager}")
+        await self.unsubscribe_route(behav)
+        self.manager = manager
+        if self.report_policies is not None:
+            self.report_policies["manager"] = DeadReckoningPolicy()
+        await self.subscribe_route(behav, self.simulator.vehicle_edge[0])
+
+    async def update_traffic_light_subscriptions(self, behav, route: list[str]):
+        """
+        Subscribes to lights on the route and unsubscribes from lights no longer on it
+        """
+        wanted = self.simulator.route_traffic_lights(route)
+        for id, msg_type in [
+            *((id, TrafficLightProtocols.SUBSCRIBE_TRAFFIC_LIGHT) for id in wanted - self.subscribed_traffic_lights),
+            *((id, TrafficLightProtocols.UNSUBSCRIBE_TRAFFIC_LIGHT) for id in self.subscribed_traffic_lights - wanted),
+        ]:
+            msg = Message(to=traffic_light_controller_jid(id))
+            msg.set_metadata("msg_type", msg_type.value)
+            set_body(msg, {"id": id})
+            await behav.send(msg)
+            if msg_type == TrafficLightProtocols.UNSUBSCRIBE_TRAFFIC_LIGHT:
+                self.simulator.traffic_light_cache.forget(id)
+        self.subscribed_traffic_lights = wanted
+
+    def position_report(self, consumer: str) -> Optional[PositionReport]:
+        """
+        Current position to report to the consumer, None if it can extrapolate it from the previous report
+        """
+        simulator = self.simulator
+        if self.report_policies is None:
+            return PositionReport(
+                simulator.vehicle_edge,
+                simulator.vehicle_position_in_edge,
+                simulator.vehicle_speed_per_second,
+                simulator.waiting_at_light,
+                time.time(),
+            )
+        return self.report_policies[consumer].report_due(
+            simulator.vehicle_edge,
+            simulator.vehicle_position_in_edge,
+            simulator.vehicle_speed_per_second,
+            simulator.waiting_at_light,
+            simulator.edge_length,
+        )
 
     class UpdateVehiclePosition(PeriodicBehaviour):
         """
@@ -35,61 +135,101 @@ class VehicleNavigator(Agent):
         """
         async def run(self):
             vehicle_edge, vehicle_position_in_edge, status = await self.agent.simulator.step(self)
-            logging.info(f"[VEHICLE NAVIGATOR] Vehicle {self.agent.vehicle_id} is at edge {vehicle_edge} at position {vehicle_position_in_edge} - status: {status}")
+            logging.debug(f"[VEHICLE NAVIGATOR] Vehicle {self.agent.vehicle_id} is at edge {vehicle_edge} at position {vehicle_position_in_edge} - status: {status}")
             if status == "STOP":
+                await self.agent.unsubscribe_route(self)
+                await self.agent.update_traffic_light_subscriptions(self, [])
                 await self.agent.stop()
+            elif vehicle_edge is not None and self.agent.regions is not None:
+                manager = self.agent.owning_manager()
+                if manager != self.agent.manager:
+                    await self.agent.hand_over(self, manager)
 
             if vehicle_edge is not None and vehicle_position_in_edge is not None:
+                report = self.agent.position_report("visualizer")
+                if report is None:
+                    return
                 # Send position update to the visualiation agent
-                logging.info(f"[VEHICLE NAVIGATOR] Sending position update to visualization agent.")
-                position_update_msg = Message(to=f"visualizer@{SERVER_ADDRESS}")
-                position_update_msg.set_metadata("msg_type", "vehicle_position_update_response")
-                position_update_msg.body = json.dumps({
+                position_update = {
                     "vehicle_id": self.agent.vehicle_id,
                     "current_edge": vehicle_edge,
-                    "position_on_edge": vehicle_position_in_edge
-                })
+                    "position_on_edge": vehicle_position_in_edge,
+                    "speed": report.speed,
+                    "waiting": report.waiting,
+                    "reported_at": report.reported_at,
+                }
+                if self.agent.telemetry is not None:
+                    self.agent.telemetry.report("visualizer", self.agent.vehicle_id, position_update)
+                    return
+                logging.debug(f"[VEHICLE NAVIGATOR] Sending position update to visualization agent.")
+                position_update_msg = Message(to=f"visualizer@{SERVER_ADDRESS}")
+                position_update_msg.set_metadata("msg_type", "vehicle_position_update_response")
+                set_body(position_update_msg, position_update)
                 await self.send(position_update_msg)
 
-    # Periodically sends a message to the navigation manager to request a route.
-    # When a response is received, it updates the vehicle's plan with the received route.
-    class RequestRoute(PeriodicBehaviour):
+    # Subscribes once for a route to the target. The navigation manager sends the route
+    # and pushes a new one only when the best path changes, each one replaces the vehicle's plan.
+    # After a hand over routes come from the manager of the new region.
+    class SubscribeRoute(OneShotBehaviour):
         async def run(self):
-            msg = Message(f"navigation_manager@{SERVER_ADDRESS}")
-            msg_body = {
-                "target": self.agent.target_node,
-                "vehicle_id": self.agent.vehicle_id,
-                "isEmergency": self.agent.isEmergency,
-            }
-            msg.body = json.dumps(msg_body)
-            msg.set_metadata("msg_type", "send_route")
-            await self.send(msg)
-            msg = await self.receive(timeout=1)
-            if msg is not None:
-                route: list[str] = json.loads(msg.body)["route"]
+            await self.agent.subscribe_route(self, self.agent.simulator.start_node)
+            while 1:
+                msg = await self.receive(timeout=10)
+                if msg is None:
+                    continue
+                route: list[str] = get_body(msg)["route"]
                 vehicleType = " Emergency" if self.agent.isEmergency else " Normal"
-                logging.info(f"[VEHICLE NAVIGATOR{vehicleType}] Received route: {route} from manager.")
+                logging.debug(f"[VEHICLE NAVIGATOR{vehicleType}] Received route: {route} from manager.")
                 self.agent.simulator.plan = route
+                await self.agent.update_traffic_light_subscriptions(self, route)
+
+    # Keeps the local cache of light states up to date with phase changes pushed by controllers.
+    class ReceiveTrafficLightPhases(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "traffic_light": <RED/GREEN/...>,
+            "id": <traffic_light_id>,
+            "next_change_at": <timestamp>
+        }
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if msg is None:
+                    continue
+                self.agent.simulator.traffic_light_cache.update_from_body(get_body(msg))
 
     # Periodically sends the current vehicle position
-    # to the navigation manager if the vehicle is on an edge.
+    # to the navigation manager if the vehicle is on an edge (with dead reckoning, only if it changed unexpectedly).
     class SendPosition(PeriodicBehaviour):
         async def run(self):
             if self.agent.simulator.vehicle_edge is not None:
-                msg = Message(f"navigation_manager@{SERVER_ADDRESS}")
+                report = self.agent.position_report("manager")
+                if report is None:
+                    return
+                msg = Message(self.agent.manager)
                 msg_body = {
-                    "node1": self.agent.simulator.vehicle_edge[0],
-                    "node2": self.agent.simulator.vehicle_edge[1],
+                    "node1": report.edge[0],
+                    "node2": report.edge[1],
                     "vehicle_id": self.agent.vehicle_id,
                     "isEmergency": self.agent.isEmergency,
+                    "position_on_edge": report.position,
+                    "speed": report.speed,
+                    "waiting": report.waiting,
+                    "reported_at": report.reported_at,
                 }
-                msg.body = json.dumps(msg_body)
+                if self.agent.telemetry is not None:
+                    self.agent.telemetry.report(self.agent.manager, self.agent.vehicle_id, msg_body)
+                    return
                 msg.set_metadata("msg_type", "send_vehicle_position")
+                set_body(msg, msg_body)
                 await self.send(msg)
 
     async def setup(self):
         # add behaviour - Sends the vehicle's position periodically.
-        b1 = self.SendPosition(period=1)
+        # With dead reckoning it checks every step, but sends only when the manager's extrapolation would be off.
+        b1 = self.SendPosition(period=1 if self.report_policies is None else 0.1)
 
         # add behaviour - Updates the vehicle's position periodically
         # being associated with send traffic light on request message.
@@ -97,12 +237,19 @@ class VehicleNavigator(Agent):
         t2 = Template()
         t2.set_metadata("msg_type", TrafficLightProtocols.SEND_TRAFFIC_LIGHT_ON_REQUEST.value)
 
-        # This periodic behavior sends a message to the navigation manager to request a route.
-        # When a response is received, it updates the vehicle's navigation plan.
-        b3 = self.RequestRoute(period=1)
+        # This behaviour subscribes for the route at the navigation manager.
+        # Whenever a route is pushed, it updates the vehicle's navigation plan.
+        b3 = self.SubscribeRoute()
         t3 = Template()
         t3.set_metadata("msg_type", "route_response")
 
+        # This behaviour keeps light states of the lights on the route, so the vehicle
+        # asks a controller only when the cached state has expired.
+        b4 = self.ReceiveTrafficLightPhases()
+        t4 = Template()
+        t4.set_metadata("msg_type", TrafficLightProtocols.TRAFFIC_LIGHT_PHASE_CHANGE.value)
+
         self.add_behaviour(b1)
         self.add_behaviour(b2, t2)
         self.add_behaviour(b3, t3)
+        self.add_behaviour(b4, t4)
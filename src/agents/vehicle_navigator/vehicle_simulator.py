@@ -1,76 +1,163 @@
-import json
+from src.codec import get_body, set_body
 import logging
-import copy
 from spade.message import Message
-from src.config import SERVER_ADDRESS
-from src.agents.traffic_light_controller.messages import TrafficLight
-from typing import Tuple, Union
-import networkx as nx
+from src.agents.traffic_light_controller.messages import TrafficLight, traffic_light_controller_jid
+from typing import Callable, Optional, Tuple, Union
+from src.utils import RoadGraph
+from .traffic_light_cache import TrafficLightStateCache
 
 
 class VehicleSimulator:
     def __init__(
         self,
-        graph: nx.Graph,
+        graph: RoadGraph,
         start_node: str,
         finish_node: str,
     ):
         self.start_node: str = start_node
         self.finish_node: str = finish_node
         self.vehicle_edge: Tuple[str, str] = None  # tuple of nodes
-        self.graph: nx.Graph = graph
-        self.plan: Union[None, list[str]] = None
+        self.graph: RoadGraph = graph
+        # the route is never modified, the vehicle is on the edge (plan[cursor], plan[cursor + 1])
+        self._plan: Union[None, list[str]] = None
+        self.cursor: int = 0
+        # per edge of the plan, precomputed when a route arrives
+        self.segment_lengths: list[float] = []
+        self.segment_lights: list[Optional[int]] = []
         self.vehicle_speed_per_second = 3  # units per second
         self.vehicle_position_in_edge: float = 0
+        self.edge_length: float = 0  # length of the current edge
+        self.waiting_at_light: bool = False
+        # states pushed by controllers of lights on the route, see VehicleNavigator.update_traffic_light_subscriptions
+        self.traffic_light_cache = TrafficLightStateCache()
 
     async def get_traffic_light_state(self, behav, id: int) -> Union[TrafficLight]:
-        msg = Message(to=f"traffic_light_controller_{id}@{SERVER_ADDRESS}")
+        msg = Message(to=traffic_light_controller_jid(id))
         msg.set_metadata("msg_type", "get_traffic_light_request")
+        set_body(msg, {"id": id})
         await behav.send(msg)
         msg = await behav.receive(timeout=0.25)
         if msg is None:
             return None
-        msg_body = json.loads(msg.body)
-        print(msg_body)
+        msg_body = get_body(msg)
+        logging.debug(f"[VEHICLE SIMULATOR] Traffic light state response: {msg_body}")
+        if "id" in msg_body:
+            self.traffic_light_cache.update_from_body(msg_body)
         return TrafficLight[msg_body["traffic_light"]]
 
-    async def check_green_light(self, node1, node2, behav):
-        traffic_light_id: Union[None, int] = self.graph.get_edge_data(node1, node2)["traffic_light_id"]
+    @property
+    def plan(self) -> Union[None, list[str]]:
+        return self._plan
+
+    @plan.setter
+    def plan(self, route: Union[None, list[str]]):
+        """
+        Replaces the route, the cursor is rebased onto the start of the current edge in the new route
+        (new routes start there, see RoutePlanner.vehicle_source)
+        """
+        cursor = route.index(self.vehicle_edge[0]) if route and self.vehicle_edge is not None else 0
+        lengths, lights = [], []
+        for i in range(len(route or ()) - 1):
+            data = self.graph.get_edge_data(route[i], route[i + 1])
+            lengths.append(data["distance"])
+            lights.append(data["traffic_light_id"])
+        self._plan, self.cursor = route, cursor
+        self.segment_lengths, self.segment_lights = lengths, lights
+
+    def traffic_light_id(self, node1, node2) -> Union[None, int]:
+        return self.graph.get_edge_data(node1, node2)["traffic_light_id"]
+
+    def route_traffic_lights(self, route: list[str]) -> set[int]:
+        ids = (self.traffic_light_id(route[i], route[i + 1]) for i in range(len(route) - 1))
+        return {id for id in ids if id is not None}
+
+    @staticmethod
+    def is_passable(traffic_light: Union[None, TrafficLight]) -> bool:
+        return traffic_light != TrafficLight.RED and traffic_light is not None
+
+    async def check_green_light(self, behav):
+        """
+        Whether the light of the next edge of the plan lets the vehicle in
+        """
+        traffic_light_id: Union[None, int] = self.segment_lights[self.cursor + 1]
         if traffic_light_id is None:
             return True
-        curr_traffic_light: Union[None, TrafficLight] = await self.get_traffic_light_state(behav, traffic_light_id)
-        if curr_traffic_light != TrafficLight.RED and curr_traffic_light is not None:
-            return True
-        return False
+        curr_traffic_light: Union[None, TrafficLight] = self.traffic_light_cache.get(traffic_light_id)
+        if curr_traffic_light is None:
+            curr_traffic_light = await self.get_traffic_light_state(behav, traffic_light_id)
+        return self.is_passable(curr_traffic_light)
 
-    async def step(self, behav):
-        plan = copy.deepcopy(self.plan)
+    def advance(self, seconds: float) -> bool:
+        """
+        Moves the vehicle along its current edge, False if there is no plan to follow
+        """
+        plan = self._plan
         if not plan or len(plan) <= 2:
-            return None, None, None
+            return False
         if self.vehicle_edge is None:
             # assert plan[0] == self.start_node
+            self.cursor = 0
             self.vehicle_edge = (plan[0], plan[1])
-        else:
-            idx = plan.index(self.vehicle_edge[0])
-            plan = plan[idx:]
 
-        edge_length = self.graph.get_edge_data(plan[0], plan[1])["distance"]
-        self.vehicle_position_in_edge += behav.period.total_seconds() * self.vehicle_speed_per_second
+        edge_length = self.segment_lengths[self.cursor]
+        self.vehicle_position_in_edge += seconds * self.vehicle_speed_per_second
         self.vehicle_position_in_edge = min(edge_length, self.vehicle_position_in_edge)
-        logging.info(
-            f"[VEHICLE SIMULATOR] Current progress on edge {self.vehicle_edge}: {self.vehicle_position_in_edge}/{edge_length}"
+        self.edge_length = edge_length
+        logging.debug(
+            "[VEHICLE SIMULATOR] Current progress on edge %s: %s/%s",
+            self.vehicle_edge,
+            self.vehicle_position_in_edge,
+            edge_length,
         )
+        return True
 
-        if self.vehicle_position_in_edge >= edge_length:  # time to change edge
-            if self.finish_node == self.vehicle_edge[1]:
-                logging.info(f"[VEHICLE SIMULATOR] Reached finish node {self.finish_node}. Stopping simulation.")
-                return self.vehicle_edge, self.vehicle_position_in_edge, "STOP"
-            if await self.check_green_light(plan[1], plan[2], behav):  # wait for green light
-                logging.info(f"[VEHICLE SIMULATOR] Changing edge from {self.vehicle_edge} to {(plan[1], plan[2])}")
-                self.vehicle_position_in_edge = 0
-                self.vehicle_edge = plan[1], plan[2]
-            else:
-                logging.info(
-                    f"[VEHICLE SIMULATOR] Waiting for green light to change edge from {self.vehicle_edge} to {(plan[1], plan[2])}"
-                )
+    def at_finish(self) -> bool:
+        if self.vehicle_position_in_edge >= self.edge_length and self.finish_node == self.vehicle_edge[1]:
+            logging.info(f"[VEHICLE SIMULATOR] Reached finish node {self.finish_node}. Stopping simulation.")
+            return True
+        return False
+
+    def needs_edge_change(self) -> bool:
+        return self.vehicle_position_in_edge >= self.edge_length
+
+    def change_edge(self, green: bool):
+        plan, cursor = self._plan, self.cursor
+        if green:
+            logging.debug(
+                "[VEHICLE SIMULATOR] Changing edge from %s to (%s, %s)", self.vehicle_edge, plan[cursor + 1], plan[cursor + 2]
+            )
+            self.vehicle_position_in_edge = 0
+            self.vehicle_edge = plan[cursor + 1], plan[cursor + 2]
+            self.cursor = cursor + 1
+            self.waiting_at_light = False
+        else:
+            logging.debug(
+                "[VEHICLE SIMULATOR] Waiting for green light to change edge from %s to (%s, %s)",
+                self.vehicle_edge,
+                plan[cursor + 1],
+                plan[cursor + 2],
+            )
+            self.waiting_at_light = True
+
+    async def step(self, behav):
+        if not self.advance(behav.period.total_seconds()):
+            return None, None, None
+        if self.at_finish():
+            return self.vehicle_edge, self.vehicle_position_in_edge, "STOP"
+        if self.needs_edge_change():  # time to change edge
+            self.change_edge(await self.check_green_light(behav))  # wait for green light
+        return self.vehicle_edge, self.vehicle_position_in_edge, "IN_PROGRESS"
+
+    def step_sync(self, seconds: float, traffic_light_state: Callable[[int], Union[None, TrafficLight]]):
+        """
+        Same as step, but light states are read from the given function instead of asking controllers
+        """
+        if not self.advance(seconds):
+            return None, None, None
+        if self.at_finish():
+            return self.vehicle_edge, self.vehicle_position_in_edge, "STOP"
+        if self.needs_edge_change():
+            traffic_light_id = self.segment_lights[self.cursor + 1]
+            green = traffic_light_id is None or self.is_passable(traffic_light_state(traffic_light_id))
+            self.change_edge(green)
         return self.vehicle_edge, self.vehicle_position_in_edge, "IN_PROGRESS"
@@ -0,0 +1,149 @@
+import json
+import queue
+import struct
+import threading
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+import numpy as np
+
+from src.agents.road_condition_reporter.road_condition_delta import CONDITION_MULTIPLIERS
+from src.agents.traffic_light_controller.messages import TrafficLight
+from src.utils import RoadGraph
+from .renderer import FleetSnapshot
+
+MAGIC = b"TRJ1"
+LIGHT_STATES = list(TrafficLight)
+CONDITIONS = list(CONDITION_MULTIPLIERS)
+
+VEHICLE_DTYPE = np.dtype([("vehicle_id", "<u4"), ("edge", "<u4"), ("reverse", "u1"), ("fraction", "<f4")])
+LIGHT_DTYPE = np.dtype([("id", "<u4"), ("state", "u1")])
+CONDITION_DTYPE = np.dtype([("edge", "<u4"), ("condition", "u1")])
+FRAME_HEADER = struct.Struct("<dIII")  # time, vehicles, lights, conditions
+
+# (time, vehicles, light id -> state, edge id -> condition)
+Frame = Tuple[float, FleetSnapshot, dict[int, TrafficLight], dict[int, str]]
+
+
+class TrajectoryWriter:
+    """
+    Compact binary trajectory file: a JSON header with the road graph (edges are referenced by their index)
+    followed by length-prefixed frames of fixed-size records of vehicles, light states and edge conditions.
+    Conditions other than NONE are stored, light states only for lights whose state is known.
+    """
+
+    def __init__(self, path: str, graph: RoadGraph):
+        self.file: BinaryIO = open(path, "wb")
+        edges = list(graph.edges(data=True))
+        self.edge_index: dict[tuple[str, str], tuple[int, bool]] = {}
+        self.edge_index_by_id: dict[int, int] = {}
+        for i, (u, v, data) in enumerate(edges):
+            self.edge_index[(u, v)] = (i, False)
+            self.edge_index[(v, u)] = (i, True)
+            self.edge_index_by_id[data["id"]] = i
+        header = json.dumps(
+            {
+                "nodes": list(graph.nodes),
+                "edges": [[u, v, data["id"], data.get("traffic_light_id")] for u, v, data in edges],
+            }
+        ).encode()
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def write_frame(
+        self,
+        time: float,
+        vehicles: FleetSnapshot,
+        traffic_lights: dict[int, TrafficLight],
+        conditions: dict[int, str],
+    ):
+        vehicle_records = np.zeros(len(vehicles), dtype=VEHICLE_DTYPE)
+        for record, (vehicle_id, (edge, fraction)) in zip(vehicle_records, vehicles.items()):
+            index, reverse = self.edge_index[tuple(edge)]
+            record["vehicle_id"], record["edge"], record["reverse"], record["fraction"] = vehicle_id, index, reverse, fraction
+        light_records = np.array(
+            [(id_, LIGHT_STATES.index(TrafficLight(state))) for id_, state in traffic_lights.items() if state is not None],
+            dtype=LIGHT_DTYPE,
+        )
+        condition_records = np.array(
+            [
+                (self.edge_index_by_id[edge_id], CONDITIONS.index(condition))
+                for edge_id, condition in conditions.items()
+                if condition != "NONE" and edge_id in self.edge_index_by_id
+            ],
+            dtype=CONDITION_DTYPE,
+        )
+        payload = (
+            FRAME_HEADER.pack(time, len(vehicle_records), len(light_records), len(condition_records))
+            + vehicle_records.tobytes()
+            + light_records.tobytes()
+            + condition_records.tobytes()
+        )
+        self.file.write(struct.pack("<I", len(payload)) + payload)
+
+    def close(self):
+        self.file.close()
+
+
+class BackgroundRecorder:
+    """
+    Writes frames from a background thread, so encoding and disk writes never block the agent.
+    Frames are only copied when recorded.
+    """
+
+    def __init__(self, writer: TrajectoryWriter):
+        self.writer = writer
+        self.frames: "queue.Queue[Optional[Frame]]" = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                self.writer.close()
+                return
+            self.writer.write_frame(*frame)
+
+    def record(self, time: float, vehicles: FleetSnapshot, traffic_lights: dict, conditions: dict):
+        self.frames.put((time, dict(vehicles), dict(traffic_lights), dict(conditions)))
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+
+
+def read_trajectory(path: str) -> Tuple[dict, Iterator[Frame]]:
+    """
+    Returns the header ({"nodes": [...], "edges": [[node1, node2, id, traffic_light_id], ...]}) and an iterator of frames
+    """
+    file = open(path, "rb")
+    if file.read(4) != MAGIC:
+        file.close()
+        raise ValueError(f"{path} is not a trajectory file")
+    (length,) = struct.unpack("<I", file.read(4))
+    header = json.loads(file.read(length))
+    edges = header["edges"]
+
+    def frames() -> Iterator[Frame]:
+        with file:
+            while True:
+                prefix = file.read(4)
+                if len(prefix) < 4:
+                    return
+                (length,) = struct.unpack("<I", prefix)
+                payload = file.read(length)
+                time, nv, nl, nc = FRAME_HEADER.unpack_from(payload)
+                offset = FRAME_HEADER.size
+                vehicle_records = np.frombuffer(payload, VEHICLE_DTYPE, nv, offset)
+                offset += nv * VEHICLE_DTYPE.itemsize
+                light_records = np.frombuffer(payload, LIGHT_DTYPE, nl, offset)
+                offset += nl * LIGHT_DTYPE.itemsize
+                condition_records = np.frombuffer(payload, CONDITION_DTYPE, nc, offset)
+                vehicles = {}
+                for vehicle_id, edge, reverse, fraction in vehicle_records.tolist():
+                    u, v = edges[edge][:2]
+                    vehicles[vehicle_id] = ((v, u) if reverse else (u, v), fraction)
+                traffic_lights = {id_: LIGHT_STATES[state] for id_, state in light_records.tolist()}
+                conditions = {edges[edge][2]: CONDITIONS[condition] for edge, condition in condition_records.tolist()}
+                yield time, vehicles, traffic_lights, conditions
+
+    return header, frames()
@@ -0,0 +1,128 @@
+import queue
+from typing import Optional, Tuple
+
+import matplotlib.pyplot as plt
+import networkx as nx
+
+# vehicle id -> ((node1, node2), fraction of the edge already driven)
+FleetSnapshot = dict[int, Tuple[Tuple[str, str], float]]
+
+LIGHT_COLORS = {"GREEN": "green", "RED": "red", "YELLOW": "orange", "RED_YELLOW": "orange"}
+CONDITION_WIDTHS = {"NONE": 1, "LOW": 2, "MEDIUM": 3, "HIGH": 4.5, "CRITICAL": 6}
+
+
+class FleetRenderer:
+    """
+    Draws the road layer once and redraws only vehicle markers on top of it (blitting).
+    The layout is computed by the caller, so every frame (and every renderer) uses the same node positions.
+    Without blitting vehicles are ordinary artists, for rendering whole frames to files.
+    """
+
+    def __init__(
+        self,
+        graph: nx.Graph,
+        layout: dict[str, Tuple[float, float]],
+        ax: Optional[plt.Axes] = None,
+        blit: bool = True,
+    ):
+        self.layout = layout
+        self.blit = blit
+        if ax is None:
+            self.fig, self.ax = plt.subplots()
+        else:
+            self.fig, self.ax = ax.figure, ax
+        self.edges = list(graph.edges(data=True))
+        self.edge_lines = nx.draw_networkx_edges(graph, layout, edgelist=[(u, v) for u, v, _ in self.edges], ax=self.ax)
+        nx.draw_networkx_nodes(graph, layout, ax=self.ax, node_size=500, node_color="lightblue")
+        nx.draw_networkx_labels(graph, layout, ax=self.ax, font_size=10, font_weight="bold")
+        self.ax.set_axis_off()
+        (self.markers,) = self.ax.plot([], [], "ro", animated=blit)
+        self.labels: list[plt.Text] = []
+        self.background = None
+        # the road layer has to be captured again whenever the whole figure is redrawn (e.g. window resize)
+        self.fig.canvas.mpl_connect("draw_event", self._capture_background)
+
+    def _capture_background(self, event=None):
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+
+    def vehicle_xy(self, edge: Tuple[str, str], fraction: float) -> Tuple[float, float]:
+        (x1, y1), (x2, y2) = self.layout[edge[0]], self.layout[edge[1]]
+        return x1 + fraction * (x2 - x1), y1 + fraction * (y2 - y1)
+
+    def set_vehicles(self, snapshot: FleetSnapshot):
+        """
+        Updates vehicle artists without drawing them
+        """
+        points = [(vehicle_id, self.vehicle_xy(edge, fraction)) for vehicle_id, (edge, fraction) in snapshot.items()]
+        self.markers.set_data([xy[0] for _, xy in points], [xy[1] for _, xy in points])
+        while len(self.labels) < len(points):
+            self.labels.append(self.ax.text(0, 0, "", fontsize=12, ha="right", animated=self.blit))
+        for label, (vehicle_id, (x, y)) in zip(self.labels, points):
+            label.set_position((x, y))
+            label.set_text(f"{vehicle_id}")
+            label.set_visible(True)
+        for label in self.labels[len(points):]:
+            label.set_visible(False)
+
+    def set_road_state(self, traffic_lights: dict[int, str], conditions: dict[int, str]):
+        """
+        Colors edges by the state of their traffic light and widens them by road condition
+        """
+        colors, widths = [], []
+        for _, _, data in self.edges:
+            state = traffic_lights.get(data.get("traffic_light_id"))
+            colors.append(LIGHT_COLORS.get(state, "gray"))
+            widths.append(CONDITION_WIDTHS[conditions.get(data["id"], "NONE")])
+        self.edge_lines.set_color(colors)
+        self.edge_lines.set_linewidth(widths)
+
+    def draw_vehicles(self, snapshot: FleetSnapshot):
+        canvas = self.fig.canvas
+        if self.background is None:
+            canvas.draw()
+        self.set_vehicles(snapshot)
+        canvas.restore_region(self.background)
+        self.ax.draw_artist(self.markers)
+        for label in self.labels:
+            self.ax.draw_artist(label)
+        canvas.blit(self.ax.bbox)
+        canvas.flush_events()
+
+
+def latest_snapshot(snapshots) -> Optional[FleetSnapshot]:
+    """
+    Drains the queue and returns the newest snapshot, None if there is none, older ones are stale
+    """
+    snapshot = None
+    while True:
+        try:
+            snapshot = snapshots.get_nowait()
+        except queue.Empty:
+            return snapshot
+
+
+def publish_snapshot(snapshots, snapshot: FleetSnapshot):
+    """
+    Puts the snapshot into a single slot queue, replacing the one the renderer has not taken yet
+    """
+    while True:
+        try:
+            snapshots.put_nowait(snapshot)
+            return
+        except queue.Full:
+            latest_snapshot(snapshots)
+
+
+def run_renderer(graph: nx.Graph, layout: dict[str, Tuple[float, float]], snapshots, fps: float):
+    """
+    Render loop of the visualizer process, draws the newest snapshot at a fixed frame rate until the window is closed
+    """
+    plt.ion()
+    renderer = FleetRenderer(graph, layout)
+    plt.show(block=False)
+    while plt.fignum_exists(renderer.fig.number):
+        snapshot = latest_snapshot(snapshots)
+        if snapshot is not None:
+            renderer.draw_vehicles(snapshot)
+        # handles window events and sleeps until the next frame
+        renderer.fig.canvas.start_event_loop(1 / fps)
@@ -1,69 +1,260 @@
 import logging
-from typing import Tuple
+import multiprocessing
+import time
+from typing import Optional
 
 logging.getLogger().setLevel(logging.INFO)
-from src.agents.traffic_light_controller.messages import TrafficLightProtocols
-import json
+from src.agents.road_condition_reporter.road_condition_protocols import RoadConditionProtocols
+from src.agents.road_condition_reporter.road_condition_delta import RoadConditionResync
+from src.agents.traffic_light_controller.messages import (
+    TrafficLight,
+    TrafficLightProtocols,
+    traffic_light_controller_jid,
+)
+from src.config import SERVER_ADDRESS
+from src.codec import get_body, set_body
 import networkx as nx
-import matplotlib.pyplot as plt
-from spade.agent import Agent
-from spade.behaviour import OneShotBehaviour
+from src.metrics import InstrumentedAgent
+from spade.behaviour import OneShotBehaviour, PeriodicBehaviour
 from spade.message import Message
 from spade.template import Template
-import threading
-
-class VehiclePosition:
-    def __init__(self, current_edge: Tuple[str, str], position_on_edge: float):
-        self.current_edge = current_edge
-        self.position_on_edge = position_on_edge
-        self.pos = nx.spring_layout(self.graph)
-        self.fig, self.ax = plt.subplots()
-        plt.ion()
-
-class VisualizerAgent(Agent):
-    def __init__(self, jid, password, graph, verify_security=False):
+from src.agents.vehicle_navigator.dead_reckoning import PositionPredictor
+from .recording import BackgroundRecorder, TrajectoryWriter
+from .renderer import FleetSnapshot, publish_snapshot, run_renderer
+
+class VisualizerAgent(InstrumentedAgent):
+    """
+    Keeps the latest position of every vehicle, a separate process renders them at a fixed frame rate.
+    Position messages only update the state, so a slow window never backs up the mailbox.
+    Positions are extrapolated along the edge between reports, vehicles may report only when they deviate.
+
+    With a recording path no window is opened, instead every frame together with light states and road conditions
+    is written to a trajectory file in the background (render it later with render_recording.py).
+    """
+
+    def __init__(self, jid, password, graph, verify_security=False, fps: float = 10, recording: Optional[str] = None):
         super().__init__(jid, password, verify_security)
         self.graph = graph
-        self.vehicle_positions = {}
+        self.vehicle_positions = PositionPredictor(graph)
+        self.fps = fps
+        self.changed = False
+        self.recorder: Optional[BackgroundRecorder] = None
+        if recording is not None:
+            self.recorder = BackgroundRecorder(TrajectoryWriter(recording, graph))
+            self.traffic_light_states: dict[int, TrafficLight] = {}
+            self.road_conditions: dict[int, str] = {}  # edge id -> condition
+            self.road_condition_seq: Optional[int] = None
+            # at most one snapshot requested at a time, deltas arriving meanwhile are replayed after it
+            self.road_condition_resync = RoadConditionResync()
+            self.started_at = time.time()
+            return
+        # computed once, the renderer draws the road layer only when it starts
+        self.pos = {node: tuple(xy) for node, xy in nx.spring_layout(graph, seed=0).items()}
+        # single slot, a snapshot not taken by the renderer is replaced by a newer one
+        context = multiprocessing.get_context("spawn")
+        self.snapshots = context.Queue(maxsize=1)
+        self.renderer = context.Process(target=run_renderer, args=(graph, self.pos, self.snapshots, fps), daemon=True)
+
+    def snapshot(self) -> FleetSnapshot:
+        """
+        Extrapolated positions as fractions of the edge (vehicles report the driven distance)
+        """
+        now = time.time()
+        snapshot = {}
+        for vehicle_id in self.vehicle_positions.reports:
+            edge, position_on_edge = self.vehicle_positions.predict(vehicle_id, now)
+            distance = self.graph.get_edge_data(*edge)["distance"]
+            snapshot[vehicle_id] = (edge, min(1.0, position_on_edge / distance) if distance else 1.0)
+        return snapshot
 
     class UpdateVisualization(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "vehicle_id": 0,
+            "current_edge": ['A', 'B'],
+            "position_on_edge": 1.5,
+            "speed": 3,
+            "waiting": True/False (stopped at a light),
+            "reported_at": <timestamp> (time the position was taken)
+        }
+        or, from the telemetry aggregator, positions of many vehicles applied in one go
+        {
+            "positions": [<position>, ...]
+        }
+        """
         async def run(self):
             while 1:
                 msg = await self.receive(timeout=1)
                 if not msg:
                     continue
-                logging.info(f"[VISUALIZER] Received message: {msg}")
-                msg_json = json.loads(msg.body)
-                vehicle_id = msg_json["vehicle_id"]
-                current_edge = msg_json.get("current_edge")
-                position_on_edge = msg_json["position_on_edge"]
-                if current_edge is not None and position_on_edge is not None:
-                    logging.info(f"[VISUALIZER] Received position update for vehicle {vehicle_id} at edge {current_edge} at position {position_on_edge}")
-                    current_edge = tuple(current_edge)  # Convert to tuple
-                    position_on_edge = position_on_edge
-                    self.agent.vehicle_positions[vehicle_id] = VehiclePosition(current_edge, position_on_edge)
-                    self.agent.update_visualization()
-
-    def update_visualization(self):
-        self.ax.clear()
-        nx.draw(self.graph, self.pos, ax=self.ax, with_labels=True, node_size=500, node_color="lightblue", font_size=10, font_weight="bold")
-        
-        # Draw vehicles
-        for vehicle_id, vehicle_position in self.vehicle_positions.items():
-            node1, node2 = vehicle_position.current_edge
-            x1, y1 = self.pos[node1]
-            x2, y2 = self.pos[node2]
-            x = x1 + vehicle_position.position_on_edge * (x2 - x1)
-            y = y1 + vehicle_position.position_on_edge * (y2 - y1)
-            logging.info(f"[VISUALIZER] Drawing vehicle {vehicle_id} at position ({x}, {y})")
-            self.ax.plot(x, y, 'ro')  # Draw vehicle as a red dot
-            self.ax.text(x, y, f'{vehicle_id}', fontsize=12, ha='right')
-
-        plt.draw()
-        plt.pause(1)  # Update every second
+                msg_json = get_body(msg)
+                for position in msg_json.get("positions", [msg_json]):
+                    self.update_position(position)
+
+        def update_position(self, msg_json: dict):
+            vehicle_id = msg_json["vehicle_id"]
+            current_edge = msg_json["current_edge"]
+            position_on_edge = msg_json["position_on_edge"]
+            logging.debug(f"[VISUALIZER] Received position update for vehicle {vehicle_id} at edge {current_edge} at position {position_on_edge}")
+            self.agent.vehicle_positions.update(
+                vehicle_id,
+                tuple(current_edge),
+                position_on_edge,
+                msg_json["speed"],
+                msg_json["waiting"],
+                msg_json["reported_at"],
+            )
+            self.agent.changed = True
+
+    # Hands the latest positions to the renderer once per frame, updates received in between are coalesced.
+    class PublishSnapshot(PeriodicBehaviour):
+        async def run(self):
+            # extrapolated positions change without messages while vehicles drive
+            if not self.agent.changed and not self.agent.vehicle_positions.moving():
+                return
+            self.agent.changed = False
+            publish_snapshot(self.agent.snapshots, self.agent.snapshot())
+
+    # Records a frame on every tick, even without position updates, so light and condition changes are captured.
+    class RecordFrame(PeriodicBehaviour):
+        async def run(self):
+            self.agent.recorder.record(
+                time.time() - self.agent.started_at,
+                self.agent.snapshot(),
+                self.agent.traffic_light_states,
+                self.agent.road_conditions,
+            )
+
+    def apply_road_condition_delta(self, seq: int, patches: list) -> bool:
+        """
+        Applies the next delta, skips stale ones; False on a gap in sequence numbers (a snapshot is needed)
+        """
+        last_seq = self.road_condition_seq
+        if last_seq is not None and seq <= last_seq:
+            return True
+        if last_seq is None or seq != last_seq + 1:
+            return False
+        for edge_id, condition, _ in patches:
+            self.road_conditions[edge_id] = condition
+        self.road_condition_seq = seq
+        return True
+
+    async def request_road_condition_resync(self, behav, reporter: str):
+        """
+        Asks the reporter for a snapshot, unless one is already on its way
+        """
+        if not self.road_condition_resync.request():
+            return
+        last_seq = self.road_condition_seq
+        logging.info(f"[VISUALIZER] Road condition gap after seq {last_seq}, requesting snapshot")
+        resync = Message(to=reporter)
+        resync.set_metadata("msg_type", RoadConditionProtocols.REQUEST_ROAD_CONDITION_RESYNC.value)
+        set_body(resync, {"last_seq": last_seq})
+        await behav.send(resync)
+
+    class SubscribeTrafficLights(OneShotBehaviour):
+        async def run(self):
+            traffic_light_ids = {
+                data["traffic_light_id"] for _, _, data in self.agent.graph.edges(data=True)
+                if data.get("traffic_light_id") is not None
+            }
+            for id in traffic_light_ids:
+                msg = Message(to=traffic_light_controller_jid(id))
+                msg.set_metadata("msg_type", TrafficLightProtocols.SUBSCRIBE_TRAFFIC_LIGHT.value)
+                set_body(msg, {"id": id})
+                await self.send(msg)
+            await self.agent.request_road_condition_resync(self, f"road_condition_reporter@{SERVER_ADDRESS}")
+
+    class ReceiveTrafficLightPhases(OneShotBehaviour):
+        """
+        Expected message
+        {
+            "traffic_light": <RED/GREEN/...>,
+            "id": <traffic_light_id>,
+            "next_change_at": <timestamp>
+        }
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=10)
+                if not msg:
+                    continue
+                msg_json = get_body(msg)
+                self.agent.traffic_light_states[msg_json["id"]] = TrafficLight(msg_json["traffic_light"])
+
+    class ReceiveRoadConditions(OneShotBehaviour):
+        """
+        Expected messages, a snapshot
+        {
+            "seq": 1,
+            "updated_graph": <node_link_data>
+        }
+        or a delta
+        {
+            "seq": 2,
+            "patches": [[<edge_id>, <condition>, <cost_factor>], ...]
+        }
+        A gap in sequence numbers triggers a snapshot resync, deltas arriving while it is awaited are replayed after it.
+        """
+        async def run(self):
+            while 1:
+                msg = await self.receive(timeout=20)
+                if not msg:
+                    continue
+                msg_json = get_body(msg)
+                seq = msg_json.get("seq", 0)
+                resync = self.agent.road_condition_resync
+                if "updated_graph" in msg_json:
+                    graph = nx.readwrite.json_graph.node_link_graph(msg_json["updated_graph"])
+                    self.agent.road_conditions = {
+                        data["id"]: data.get("condition", "NONE") for _, _, data in graph.edges(data=True)
+                    }
+                    self.agent.road_condition_seq = seq
+                    for seq, patches in resync.snapshot_received():
+                        if not self.agent.apply_road_condition_delta(seq, patches):
+                            await self.agent.request_road_condition_resync(self, str(msg.sender))
+                            break
+                    continue
+                if resync.resync_pending or not self.agent.apply_road_condition_delta(seq, msg_json["patches"]):
+                    resync.buffer(seq, msg_json["patches"])
+                    await self.agent.request_road_condition_resync(self, str(msg.sender))
 
     async def setup(self):
         b1 = self.UpdateVisualization()
         t1 = Template()
         t1.set_metadata("msg_type", "vehicle_position_update_response")
-        self.add_behaviour(b1, t1)
\ No newline at end of file
+        t1_batch = Template()
+        t1_batch.set_metadata("msg_type", "vehicle_position_update_batch")
+        self.add_behaviour(b1, t1 | t1_batch)
+
+        if self.recorder is None:
+            self.renderer.start()
+            b2 = self.PublishSnapshot(period=1 / self.fps)
+            self.add_behaviour(b2)
+            return
+
+        b2 = self.RecordFrame(period=1 / self.fps)
+        self.add_behaviour(b2)
+
+        b3 = self.SubscribeTrafficLights()
+        self.add_behaviour(b3)
+
+        b4 = self.ReceiveTrafficLightPhases()
+        t4 = Template()
+        t4.set_metadata("msg_type", TrafficLightProtocols.TRAFFIC_LIGHT_PHASE_CHANGE.value)
+        self.add_behaviour(b4, t4)
+
+        # snapshots (replies to resync requests) and deltas the reporter copies to observers
+        b5 = self.ReceiveRoadConditions()
+        t5 = Template()
+        t5.set_metadata("msg_type", RoadConditionProtocols.REQUEST_ROAD_CONDITION.value)
+        t5_delta = Template()
+        t5_delta.set_metadata("msg_type", RoadConditionProtocols.ROAD_CONDITION_DELTA.value)
+        self.add_behaviour(b5, t5 | t5_delta)
+
+    async def stop(self):
+        await super().stop()
+        if self.recorder is not None:
+            # flushes frames still queued
+            self.recorder.close()
@@ -0,0 +1,115 @@
+import json
+import random
+from typing import Optional
+
+from src.agents.traffic_light_controller.messages import TrafficLight
+
+CITY_LAYOUTS = ("grid", "planar")
+
+
+class _DisjointSets:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int) -> bool:
+        rx, ry = self.find(x), self.find(y)
+        if rx == ry:
+            return False
+        self.parent[rx] = ry
+        return True
+
+
+def generate_city(
+    nodes: int,
+    layout: str = "grid",
+    light_ratio: float = 0.5,
+    block: float = 30,
+    seed: Optional[int] = None,
+) -> tuple[dict, dict]:
+    """
+    Returns (graph, traffic lights) in the format of data/graph.json and data/traffic_lights.json.
+
+    grid - streets of a rows x cols grid, roughly square, block long.
+    planar - jittered grid points connected by a random spanning tree plus most of the remaining
+    grid streets and some diagonals (at most one per block, so the map stays planar), distances are euclidean.
+    Edges get a light with probability light_ratio, every light controls a single edge.
+    """
+    if layout not in CITY_LAYOUTS:
+        raise ValueError(f"Unknown layout {layout}, expected one of {CITY_LAYOUTS}")
+    rng = random.Random(seed)
+    cols = max(1, round(nodes ** 0.5))
+    rows = max(1, -(-nodes // cols))
+    names = [f"N{i}" for i in range(nodes)]
+    jitter = 0.35 * block if layout == "planar" else 0.0
+    positions = [
+        ((i % cols) * block + rng.uniform(-jitter, jitter), (i // cols) * block + rng.uniform(-jitter, jitter))
+        for i in range(nodes)
+    ]
+
+    candidates = []
+    for i in range(nodes):
+        r, c = divmod(i, cols)
+        if c + 1 < cols and i + 1 < nodes:
+            candidates.append((i, i + 1))
+        if i + cols < nodes:
+            candidates.append((i, i + cols))
+        if layout == "planar" and c + 1 < cols and i + cols + 1 < nodes and rng.random() < 0.3:
+            candidates.append((i, i + cols + 1) if rng.random() < 0.5 else (i + 1, i + cols))
+
+    if layout == "grid":
+        edges = candidates
+    else:
+        # a random spanning tree keeps the city connected, other streets are kept at random
+        rng.shuffle(candidates)
+        sets = _DisjointSets(nodes)
+        edges = [(u, v) for u, v in candidates if sets.union(u, v) or rng.random() < 0.8]
+
+    graph_edges, lights = [], []
+    for edge_id, (u, v) in enumerate(edges, start=1):
+        (x1, y1), (x2, y2) = positions[u], positions[v]
+        distance = max(1, round(((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5))
+        traffic_light_id = None
+        if rng.random() < light_ratio:
+            traffic_light_id = len(lights) + 1
+            red_time, green_time = rng.randint(4, 12), rng.randint(4, 12)
+            lights.append(
+                {
+                    "id": traffic_light_id,
+                    "default": rng.choice(list(TrafficLight)).value,
+                    "red_time": red_time,
+                    "yellow_time": 1,
+                    "green_time": green_time,
+                    "red_yellow_time": 2,
+                }
+            )
+        graph_edges.append(
+            {
+                "id": edge_id,
+                "node1": names[u],
+                "node2": names[v],
+                "distance": distance,
+                "cost": rng.randint(1, 5),
+                "traffic_light_id": traffic_light_id,
+            }
+        )
+
+    graph = {
+        "nodes": names,
+        "start_node": names[0],
+        "finish_node": names[-1],
+        "edges": graph_edges,
+    }
+    return graph, {"lights": lights}
+
+
+def write_city(graph: dict, traffic_lights: dict, graph_path: str, lights_path: str):
+    with open(graph_path, "w") as file:
+        json.dump(graph, file)
+    with open(lights_path, "w") as file:
+        json.dump(traffic_lights, file)
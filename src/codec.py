@@ -0,0 +1,368 @@
+import base64
+import json
+import struct
+import zlib
+from operator import itemgetter
+import typing
+from abc import ABC, abstractmethod
+from typing import Any, Iterable
+
+# binary bodies are base64 text (XMPP bodies are text) after this prefix, JSON bodies start with "{"
+BINARY_PREFIX = "~"
+CODECS = ("json", "binary")
+
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+
+
+class Field(ABC):
+    """
+    Fixed-layout encoding of one value, little-endian, lengths as uint32 prefixes
+    """
+
+    # struct format of fixed-width fields, Records pack runs of them with one precompiled struct
+    fmt: typing.Optional[str] = None
+
+    @abstractmethod
+    def pack(self, value: Any, out: bytearray, codec: "BinaryCodec"):
+        pass
+
+    @abstractmethod
+    def unpack(self, data: bytes, offset: int, codec: "BinaryCodec") -> tuple[Any, int]:
+        pass
+
+
+class FixedField(Field):
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.struct = struct.Struct("<" + fmt)
+
+    def to_raw(self, value: Any, codec: "BinaryCodec") -> Any:
+        return value
+
+    def from_raw(self, raw: Any, codec: "BinaryCodec") -> Any:
+        return raw
+
+    def pack(self, value, out, codec):
+        out += self.struct.pack(self.to_raw(value, codec))
+
+    def unpack(self, data, offset, codec):
+        return self.from_raw(self.struct.unpack_from(data, offset)[0], codec), offset + self.struct.size
+
+
+class Scalar(FixedField):
+    pass
+
+
+class Choice(FixedField):
+    """
+    One of a few known strings (or str enum members), sent as its index
+    """
+
+    def __init__(self, values: Iterable):
+        super().__init__("B")
+        self.values = [getattr(value, "value", value) for value in values]
+        self.index = {value: i for i, value in enumerate(self.values)}
+
+    def to_raw(self, value, codec):
+        return self.index[getattr(value, "value", value)]
+
+    def from_raw(self, raw, codec):
+        return self.values[raw]
+
+
+class Node(FixedField):
+    """
+    Node name as its index in the codec's node table
+    """
+
+    def __init__(self):
+        super().__init__("I")
+
+    def to_raw(self, value, codec):
+        return codec.intern(value)
+
+    def from_raw(self, raw, codec):
+        return codec.nodes[raw]
+
+
+class Str(Field):
+    def pack(self, value, out, codec):
+        encoded = value.encode()
+        out += _U32.pack(len(encoded))
+        out += encoded
+
+    def unpack(self, data, offset, codec):
+        (length,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        return bytes(data[offset:offset + length]).decode(), offset + length
+
+
+class Nodes(Field):
+    """
+    Route (list of node names) packed with one struct call
+    """
+
+    def pack(self, value, out, codec):
+        if len(value) < 2:
+            indexes = [codec.intern(node) for node in value]
+        else:
+            try:
+                indexes = itemgetter(*value)(codec.node_index)
+            except KeyError:
+                indexes = [codec.intern(node) for node in value]  # raises for the unknown node
+        out += struct.pack(f"<I{len(value)}I", len(value), *indexes)
+
+    def unpack(self, data, offset, codec):
+        (length,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        indexes = struct.unpack_from(f"<{length}I", data, offset)
+        nodes = list(itemgetter(*indexes)(codec.nodes)) if length > 1 else [codec.nodes[index] for index in indexes]
+        return nodes, offset + 4 * length
+
+
+class Optional(Field):
+    def __init__(self, item: Field):
+        self.item = item
+
+    def pack(self, value, out, codec):
+        if value is None:
+            out += _U8.pack(0)
+        else:
+            out += _U8.pack(1)
+            self.item.pack(value, out, codec)
+
+    def unpack(self, data, offset, codec):
+        if not data[offset]:
+            return None, offset + 1
+        return self.item.unpack(data, offset + 1, codec)
+
+
+class List(Field):
+    def __init__(self, item: Field):
+        self.item = item
+
+    def pack(self, value, out, codec):
+        out += _U32.pack(len(value))
+        for item in value:
+            self.item.pack(item, out, codec)
+
+    def unpack(self, data, offset, codec):
+        (length,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        items = []
+        for _ in range(length):
+            item, offset = self.item.unpack(data, offset, codec)
+            items.append(item)
+        return items, offset
+
+
+def _segments(fields: list[tuple[Any, Field]]) -> list[tuple[typing.Optional[struct.Struct], list[tuple[Any, Field]]]]:
+    """
+    Groups consecutive fixed-width fields, each group is packed with one struct (None for other fields)
+    """
+    segments = []
+    for key, field in fields:
+        if field.fmt is not None and segments and segments[-1][0]:
+            segments[-1][1].append((key, field))
+        else:
+            segments.append((field.fmt is not None, [(key, field)]))
+    return [
+        (struct.Struct("<" + "".join(field.fmt for _, field in group)) if fixed else None, group)
+        for fixed, group in segments
+    ]
+
+
+class Tuple(Field):
+    """
+    Fixed number of values of different types, decoded as a list (like JSON arrays)
+    """
+
+    def __init__(self, *items: Field):
+        self.items = items
+        self.segments = _segments(list(enumerate(items)))
+
+    def pack(self, value, out, codec):
+        for packer, group in self.segments:
+            if packer is not None:
+                out += packer.pack(*[field.to_raw(value[i], codec) for i, field in group])
+            else:
+                for i, field in group:
+                    field.pack(value[i], out, codec)
+
+    def unpack(self, data, offset, codec):
+        values = []
+        for packer, group in self.segments:
+            if packer is not None:
+                raws = packer.unpack_from(data, offset)
+                offset += packer.size
+                values.extend(field.from_raw(raw, codec) for (_, field), raw in zip(group, raws))
+            else:
+                for _, field in group:
+                    value, offset = field.unpack(data, offset, codec)
+                    values.append(value)
+        return values, offset
+
+
+class Map(Field):
+    """
+    Dict with string keys, other keys are converted like json.dumps does (vehicle ids become strings)
+    """
+
+    def __init__(self, value: Field):
+        self.value = value
+
+    def pack(self, value, out, codec):
+        out += _U32.pack(len(value))
+        for key, item in value.items():
+            STR.pack(str(key), out, codec)
+            self.value.pack(item, out, codec)
+
+    def unpack(self, data, offset, codec):
+        (length,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        items = {}
+        for _ in range(length):
+            key, offset = STR.unpack(data, offset, codec)
+            items[key], offset = self.value.unpack(data, offset, codec)
+        return items, offset
+
+
+class Json(Field):
+    """
+    Free-form value (e.g. a whole graph), compressed JSON for rare messages not worth a fixed layout
+    """
+
+    def pack(self, value, out, codec):
+        compressed = zlib.compress(json.dumps(value).encode())
+        out += _U32.pack(len(compressed))
+        out += compressed
+
+    def unpack(self, data, offset, codec):
+        (length,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        return json.loads(zlib.decompress(data[offset:offset + length])), offset + length
+
+
+class Record(Field):
+    """
+    Dict with fixed keys in a fixed order. Optional keys missing in the body are sent as None
+    and left out when decoding, so receivers can keep using body.get(key, default).
+    """
+
+    def __init__(self, **fields: Field):
+        self.fields = list(fields.items())
+        self.segments = _segments(self.fields)
+
+    def pack(self, value, out, codec):
+        for packer, group in self.segments:
+            if packer is not None:
+                out += packer.pack(*[field.to_raw(value[name], codec) for name, field in group])
+            else:
+                for name, field in group:
+                    field.pack(value.get(name), out, codec)
+
+    def unpack(self, data, offset, codec):
+        body = {}
+        for packer, group in self.segments:
+            if packer is not None:
+                raws = packer.unpack_from(data, offset)
+                offset += packer.size
+                for (name, field), raw in zip(group, raws):
+                    body[name] = field.from_raw(raw, codec)
+                continue
+            for name, field in group:
+                value, offset = field.unpack(data, offset, codec)
+                if value is not None or not isinstance(field, Optional):
+                    body[name] = value
+        return body, offset
+
+
+INT = Scalar("i")
+FLOAT = Scalar("d")
+FLOAT32 = Scalar("f")
+BOOL = Scalar("?")
+STR = Str()
+NODE = Node()
+NODES = Nodes()
+JSON = Json()
+
+# msg_type -> layout of the body, filled by src/protocol_schemas.py
+SCHEMAS: dict[str, Record] = {}
+
+
+def register_schema(msg_type: str, schema: Record):
+    SCHEMAS[getattr(msg_type, "value", msg_type)] = schema
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, msg_type: str, body: dict) -> str:
+        return json.dumps(body)
+
+    def decode(self, msg_type: str, text: str) -> dict:
+        return json.loads(text) if text else {}
+
+
+class BinaryCodec(JsonCodec):
+    """
+    Bodies of registered message types in their fixed layout with node names interned,
+    anything else as JSON. Every agent of a deployment must build the node table from the same graph.
+    """
+
+    name = "binary"
+
+    def __init__(self, nodes: Iterable[str], schemas: dict[str, Record] = SCHEMAS):
+        self.nodes: list[str] = sorted(nodes)
+        self.node_index: dict[str, int] = {node: i for i, node in enumerate(self.nodes)}
+        self.schemas = schemas
+
+    def intern(self, node: str) -> int:
+        index = self.node_index.get(node)
+        if index is None:
+            raise ValueError(f"Node {node} is not in the node table, all agents must use the same graph")
+        return index
+
+    def encode(self, msg_type: str, body: dict) -> str:
+        schema = self.schemas.get(msg_type)
+        if schema is None:
+            return super().encode(msg_type, body)
+        out = bytearray()
+        schema.pack(body, out, self)
+        return BINARY_PREFIX + base64.b64encode(out).decode()
+
+    def decode(self, msg_type: str, text: str) -> dict:
+        if not text or not text.startswith(BINARY_PREFIX):
+            return super().decode(msg_type, text)
+        data = base64.b64decode(text[len(BINARY_PREFIX):])
+        return self.schemas[msg_type].unpack(data, 0, self)[0]
+
+
+_codec: JsonCodec = JsonCodec()
+
+
+def configure_codec(name: str, nodes: Iterable[str] = ()) -> JsonCodec:
+    """
+    Selects the codec used by set_body and get_body for all agents of this process
+    """
+    global _codec
+    if name == "binary":
+        from src import protocol_schemas  # noqa: F401, registers the schemas of all agent protocols
+        _codec = BinaryCodec(nodes)
+    elif name == "json":
+        _codec = JsonCodec()
+    else:
+        raise ValueError(f"Unknown message codec {name}, expected one of {CODECS}")
+    return _codec
+
+
+def set_body(msg, body: dict):
+    """
+    Encodes body for the msg_type set in the message metadata (set it first)
+    """
+    msg.body = _codec.encode(msg.get_metadata("msg_type"), body)
+
+
+def get_body(msg) -> dict:
+    return _codec.decode(msg.get_metadata("msg_type"), msg.body)
@@ -0,0 +1,285 @@
+import heapq
+from typing import Callable, Iterable, Optional, Tuple
+
+import networkx
+import numpy as np
+
+NO_TRAFFIC_LIGHT = -1
+
+
+class CompactGraph:
+    """
+    Undirected road graph stored as CSR adjacency over interned node ids.
+    Per-edge data lives in NumPy arrays indexed by edge slot (0..m-1):
+    distance, cost, traffic_light_id (NO_TRAFFIC_LIGHT when missing) and edge id.
+    Rarely used attributes (condition, cost_factor, ...) are kept in a sparse dict.
+
+    Exposes the subset of the networkx API used by the agents
+    (nodes, has_edge, get_edge_data, edges(data=True)), so it can be used in place of networkx.Graph.
+    """
+
+    def __init__(
+        self,
+        node_names: list[str],
+        edge_nodes: np.ndarray,
+        distance: np.ndarray,
+        cost: np.ndarray,
+        traffic_light_id: np.ndarray,
+        edge_id: np.ndarray,
+    ):
+        self.node_names: list[str] = list(node_names)
+        self.node_index: dict[str, int] = {name: i for i, name in enumerate(self.node_names)}
+        self.edge_nodes: np.ndarray = np.asarray(edge_nodes, dtype=np.int32).reshape(-1, 2)
+        self.distance: np.ndarray = np.asarray(distance, dtype=np.float64)
+        self.cost: np.ndarray = np.asarray(cost, dtype=np.float64)
+        self.traffic_light_id: np.ndarray = np.asarray(traffic_light_id, dtype=np.int64)
+        self.edge_id: np.ndarray = np.asarray(edge_id, dtype=np.int64)
+        self.extra: dict[int, dict] = {}
+        self.start_node: Optional[str] = None
+        self.finish_node: Optional[str] = None
+        self.last_settled: int = 0  # nodes settled by the last shortest path query
+        self._slot_by_edge_id: dict[int, int] = {int(e): slot for slot, e in enumerate(self.edge_id.tolist())}
+        self._arc_keys: Optional[np.ndarray] = None
+        self._adjacency_lists: Optional[Tuple[list[int], list[int], list[int]]] = None
+        self._build_adjacency()
+
+    def _build_adjacency(self):
+        n = len(self.node_names)
+        m = len(self.edge_nodes)
+        tails = np.concatenate([self.edge_nodes[:, 0], self.edge_nodes[:, 1]])
+        heads = np.concatenate([self.edge_nodes[:, 1], self.edge_nodes[:, 0]])
+        slots = np.concatenate([np.arange(m, dtype=np.int32), np.arange(m, dtype=np.int32)])
+        # sorted by tail, then head, so a row can be binary searched for an edge
+        order = np.lexsort((heads, tails))
+        self.adj_node: np.ndarray = heads[order].astype(np.int32)
+        self.adj_edge: np.ndarray = slots[order].astype(np.int32)
+        self.indptr: np.ndarray = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=n), out=self.indptr[1:])
+
+    def adjacency_lists(self) -> Tuple[list[int], list[int], list[int]]:
+        """
+        indptr, adj_node and adj_edge as Python lists for the searches, built once (the topology never changes)
+        """
+        if self._adjacency_lists is None:
+            self._adjacency_lists = self.indptr.tolist(), self.adj_node.tolist(), self.adj_edge.tolist()
+        return self._adjacency_lists
+
+    @classmethod
+    def from_networkx(cls, graph: networkx.Graph) -> "CompactGraph":
+        node_names = list(graph.nodes)
+        index = {name: i for i, name in enumerate(node_names)}
+        edge_nodes, distance, cost, traffic_light_id, edge_id, extra = [], [], [], [], [], {}
+        for slot, (u, v, data) in enumerate(graph.edges(data=True)):
+            edge_nodes.append((index[u], index[v]))
+            distance.append(data["distance"])
+            cost.append(data["cost"])
+            light = data.get("traffic_light_id")
+            traffic_light_id.append(NO_TRAFFIC_LIGHT if light is None else light)
+            edge_id.append(data["id"])
+            rest = {k: val for k, val in data.items() if k not in ("distance", "cost", "traffic_light_id", "id")}
+            if rest:
+                extra[slot] = rest
+        compact = cls(node_names, np.array(edge_nodes, dtype=np.int32), distance, cost, traffic_light_id, edge_id)
+        compact.extra = extra
+        compact.start_node = getattr(graph, "start_node", None)
+        compact.finish_node = getattr(graph, "finish_node", None)
+        return compact
+
+    def copy(self) -> "CompactGraph":
+        compact = CompactGraph(
+            self.node_names, self.edge_nodes, self.distance.copy(), self.cost.copy(), self.traffic_light_id.copy(), self.edge_id
+        )
+        compact.extra = {slot: dict(attrs) for slot, attrs in self.extra.items()}
+        compact._adjacency_lists = self._adjacency_lists  # same topology, the lists are only read
+        compact.start_node = self.start_node
+        compact.finish_node = self.finish_node
+        return compact
+
+    def to_networkx(self) -> networkx.Graph:
+        g = networkx.Graph()
+        g.add_nodes_from(self.node_names)
+        for u, v, data in self.edges(data=True):
+            g.add_edge(u, v, **data)
+        g.start_node = self.start_node
+        g.finish_node = self.finish_node
+        return g
+
+    @property
+    def nodes(self) -> list[str]:
+        return self.node_names
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_names)
+
+    def number_of_edges(self) -> int:
+        return len(self.edge_nodes)
+
+    def edge_slot(self, u: str, v: str) -> Optional[int]:
+        """
+        returns edge slot of the edge u-v or None
+        """
+        ui = self.node_index.get(u)
+        vi = self.node_index.get(v)
+        if ui is None or vi is None:
+            return None
+        return self.edge_slot_by_index(ui, vi)
+
+    def edge_slot_by_index(self, ui: int, vi: int) -> Optional[int]:
+        start, end = self.indptr[ui], self.indptr[ui + 1]
+        k = start + int(np.searchsorted(self.adj_node[start:end], vi))
+        if k < end and self.adj_node[k] == vi:
+            return int(self.adj_edge[k])
+        return None
+
+    def edge_slots(self, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """
+        Vectorized edge_slot_by_index, -1 where there is no edge
+        """
+        n = len(self.node_names)
+        if self._arc_keys is None:
+            # CSR rows are sorted by tail, then head, so the keys are sorted
+            tails = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+            self._arc_keys = tails * n + self.adj_node
+        keys = np.asarray(u, dtype=np.int64) * n + np.asarray(v, dtype=np.int64)
+        k = np.minimum(np.searchsorted(self._arc_keys, keys), len(self._arc_keys) - 1)
+        return np.where(self._arc_keys[k] == keys, self.adj_edge[k], -1)
+
+    def edge_slot_by_id(self, edge_id: int) -> Optional[int]:
+        return self._slot_by_edge_id.get(edge_id)
+
+    def has_edge(self, u: str, v: str) -> bool:
+        return self.edge_slot(u, v) is not None
+
+    def edge_data(self, slot: int) -> dict:
+        light = int(self.traffic_light_id[slot])
+        data = {
+            "traffic_light_id": None if light == NO_TRAFFIC_LIGHT else light,
+            "distance": float(self.distance[slot]),
+            "cost": float(self.cost[slot]),
+            "id": int(self.edge_id[slot]),
+        }
+        data.update(self.extra.get(slot, {}))
+        return data
+
+    def get_edge_data(self, u: str, v: str, default=None) -> Optional[dict]:
+        """
+        Same contract as networkx.Graph.get_edge_data, but the returned dict is a copy:
+        use update_edge to change attributes.
+        """
+        slot = self.edge_slot(u, v)
+        if slot is None:
+            return default
+        return self.edge_data(slot)
+
+    def update_edge(self, u: str, v: str, **attrs):
+        slot = self.edge_slot(u, v)
+        if slot is None:
+            raise KeyError(f"Edge {u}-{v} not in graph")
+        for key, value in attrs.items():
+            if key == "cost":
+                self.cost[slot] = value
+            elif key == "distance":
+                self.distance[slot] = value
+            elif key == "traffic_light_id":
+                self.traffic_light_id[slot] = NO_TRAFFIC_LIGHT if value is None else value
+            elif key == "id":
+                raise KeyError("Edge id can not be changed")
+            else:
+                self.extra.setdefault(slot, {})[key] = value
+
+    def edges(self, data: bool = False) -> Iterable:
+        for slot, (ui, vi) in enumerate(self.edge_nodes.tolist()):
+            u, v = self.node_names[ui], self.node_names[vi]
+            if data:
+                yield u, v, self.edge_data(slot)
+            else:
+                yield u, v
+
+    def weights(self, weight: str) -> np.ndarray:
+        if weight == "cost":
+            return self.cost
+        if weight == "distance":
+            return self.distance
+        raise KeyError(f"Unknown weight {weight}")
+
+    def shortest_path_indices(
+        self,
+        source: int,
+        target: int,
+        weights: np.ndarray,
+        heuristic: Optional[Callable[[int], float]] = None,
+    ) -> Tuple[list[int], float]:
+        """
+        Dijkstra (A* when heuristic is given, it must be admissible) over the CSR arrays.
+        Returns path as node indices and its length.
+        """
+        # plain lists, slicing NumPy arrays for every settled node is slower than the networkx search
+        indptr, adj_node, adj_edge = self.adjacency_lists()
+        w = weights.tolist()
+        inf = float("inf")
+        dist = [inf] * len(self.node_names)
+        dist[source] = 0.0
+        prev: dict[int, int] = {}
+        settled = 0
+        heap: list[Tuple[float, float, int]] = [(heuristic(source) if heuristic else 0.0, 0.0, source)]
+        while heap:
+            _, du, u = heapq.heappop(heap)
+            if du > dist[u]:
+                continue
+            settled += 1
+            if u == target:
+                break
+            for i in range(indptr[u], indptr[u + 1]):
+                v = adj_node[i]
+                dv = du + w[adj_edge[i]]
+                if dv < dist[v]:
+                    dist[v] = dv
+                    prev[v] = u
+                    heapq.heappush(heap, (dv + heuristic(v) if heuristic else dv, dv, v))
+        self.last_settled = settled
+        if dist[target] == inf:
+            raise networkx.NetworkXNoPath(
+                f"No path between {self.node_names[source]} and {self.node_names[target]}."
+            )
+        path = [target]
+        while path[-1] != source:
+            path.append(prev[path[-1]])
+        path.reverse()
+        return path, dist[target]
+
+    def single_source_distances(self, source: int, weights: np.ndarray) -> np.ndarray:
+        """
+        Dijkstra from the source to all nodes, inf for unreachable ones
+        """
+        # plain lists, indexing NumPy arrays element by element is slow
+        indptr, adj_node, adj_edge = self.adjacency_lists()
+        w = weights.tolist()
+        dist = [float("inf")] * len(self.node_names)
+        dist[source] = 0.0
+        heap: list[Tuple[float, int]] = [(0.0, source)]
+        while heap:
+            du, u = heapq.heappop(heap)
+            if du > dist[u]:
+                continue
+            for i in range(indptr[u], indptr[u + 1]):
+                v = adj_node[i]
+                dv = du + w[adj_edge[i]]
+                if dv < dist[v]:
+                    dist[v] = dv
+                    heapq.heappush(heap, (dv, v))
+        return np.asarray(dist)
+
+    def shortest_path(
+        self,
+        source: str,
+        target: str,
+        weight: str = "cost",
+        heuristic: Optional[Callable[[int], float]] = None,
+    ) -> list[str]:
+        for node in (source, target):
+            if node not in self.node_index:
+                raise networkx.NodeNotFound(f"Node {node} not in graph")
+        path, _ = self.shortest_path_indices(
+            self.node_index[source], self.node_index[target], self.weights(weight), heuristic
+        )
+        return [self.node_names[i] for i in path]
@@ -1,2 +1,33 @@
 SERVER_ADDRESS = "server_hello"
 PASSWORD = "a"
+COMPACT_GRAPH = False  # route on the array-backed CompactGraph instead of networkx.Graph
+# 0 - one TrafficLightControllerAgent per light, otherwise lights are grouped by id into
+# districts of this size, each served by one TrafficLightBankControllerAgent
+LIGHTS_PER_CONTROLLER = 0
+# landmarks of the ALT router used for routing on the CompactGraph, 0 - plain Dijkstra
+ROUTING_LANDMARKS = 8
+# path of a trajectory file, the visualizer records frames there instead of opening a window (None - live window)
+VISUALIZER_RECORDING = None
+# "json" - plain JSON bodies readable by any agent or tool,
+# "binary" - registered message types in a fixed layout with interned node names (src/protocol_schemas.py),
+# every agent of the deployment must use the same codec
+MESSAGE_CODEC = "json"
+# vehicles report positions to an in-process buffer, the telemetry aggregator sends one batch per consumer and tick
+TELEMETRY_BATCHING = False
+# vehicles report positions only on edge changes, stops at lights and deviations, receivers extrapolate in between
+DEAD_RECKONING = False
+# 0 or 1 - one navigation manager for the whole map, otherwise the map is partitioned into this many regions,
+# each served by its own navigation manager (vehicles talk to the one owning their current edge)
+NAVIGATION_REGIONS = 0
+# worker processes computing routes for each navigation manager (cost changes are broadcast to them),
+# 0 - routes are computed in the manager's event loop
+ROUTE_WORKERS = 0
+# agents started or stopped at the same time by the launcher, and retries of a failed attempt
+LAUNCH_CONCURRENCY = 64
+LAUNCH_RETRIES = 3
+# agents record message counts, queueing and handling times and mailbox depths (src/metrics.py)
+INSTRUMENTATION = False
+# metrics are appended to this file (e.g. "metrics.jsonl") as JSON lines every METRICS_EXPORT_PERIOD seconds
+# while INSTRUMENTATION is on (None - not exported)
+METRICS_FILE = None
+METRICS_EXPORT_PERIOD = 10.0
@@ -0,0 +1,134 @@
+import copy
+import heapq
+from typing import Callable
+
+import networkx
+import numpy as np
+
+from src.compact_graph import CompactGraph
+
+
+class LandmarkRouter:
+    """
+    ALT routing (A*, landmarks, triangle inequality) on a CompactGraph.
+    Distances from a few far apart landmarks are precomputed, |d(L, t) - d(L, v)| maximized over the landmarks
+    is a lower bound of the distance from v to the target t and steers A* towards the target.
+
+    The tables are refreshed incrementally from the graph weights before every query: cost decreases are
+    propagated from the changed edges, cost increases keep the tables valid lower bounds and are only counted,
+    the tables are rebuilt once too many edges got more expensive (the heuristic weakens, but stays exact).
+    """
+
+    def __init__(self, graph: CompactGraph, num_landmarks: int = 8, weight: str = "cost", rebuild_ratio: float = 0.1):
+        self.graph = graph
+        self.num_landmarks = num_landmarks
+        self.weight = weight
+        self.rebuild_ratio = rebuild_ratio
+        self.landmarks: list[int] = []
+        self.tables: np.ndarray = np.zeros((0, graph.number_of_nodes()))  # landmarks x nodes
+        self.increased: int = 0  # edges that got more expensive since the last build
+        self.build()
+
+    def build(self):
+        """
+        Picks landmarks by farthest point selection and computes their distance tables
+        """
+        graph = self.graph
+        self._weights = graph.weights(self.weight).copy()
+        self.increased = 0
+        self.landmarks, rows = [], []
+        n = graph.number_of_nodes()
+        if n == 0:
+            self.tables = np.zeros((0, 0))
+            return
+        # distance to the nearest landmark so far, starting from an arbitrary node that is not a landmark
+        nearest = graph.single_source_distances(0, self._weights)
+        for _ in range(min(self.num_landmarks, n)):
+            reachable = np.where(np.isfinite(nearest), nearest, -1.0)
+            landmark = int(np.argmax(reachable))
+            if landmark in self.landmarks:
+                break
+            row = graph.single_source_distances(landmark, self._weights)
+            self.landmarks.append(landmark)
+            rows.append(row)
+            nearest = np.minimum(nearest, row) if self.landmarks[1:] else row
+        self.tables = np.vstack(rows)
+
+    def same_topology(self, graph: CompactGraph) -> bool:
+        return graph.node_names == self.graph.node_names and np.array_equal(graph.edge_nodes, self.graph.edge_nodes)
+
+    def for_graph(self, graph: CompactGraph) -> "LandmarkRouter":
+        """
+        Router for a graph with the same nodes and edges (e.g. a copy with other costs),
+        the tables are copied and refreshed from the cost differences on the first query
+        """
+        if not self.same_topology(graph):
+            return LandmarkRouter(graph, self.num_landmarks, self.weight, self.rebuild_ratio)
+        router = copy.copy(self)
+        router.graph = graph
+        router.tables = self.tables.copy()
+        router._weights = self._weights.copy()
+        return router
+
+    def refresh(self):
+        weights = self.graph.weights(self.weight)
+        changed = np.flatnonzero(weights != self._weights)
+        if len(changed) == 0:
+            return
+        decreased = changed[weights[changed] < self._weights[changed]]
+        self.increased += len(changed) - len(decreased)
+        self._weights = weights.copy()
+        if self.increased > self.rebuild_ratio * len(weights):
+            self.build()
+        elif len(decreased):
+            self._propagate_decreases(decreased)
+
+    def _propagate_decreases(self, slots: np.ndarray):
+        """
+        Restores d(L, v) <= d(L, u) + w(u, v) on every edge after the given edges got cheaper,
+        a Dijkstra from the improved endpoints that stops where distances do not improve
+        """
+        graph = self.graph
+        indptr, adj_node, adj_edge = graph.indptr.tolist(), graph.adj_node.tolist(), graph.adj_edge.tolist()
+        w = self._weights.tolist()
+        ends = graph.edge_nodes[slots].tolist()
+        for row in range(len(self.landmarks)):
+            dist = self.tables[row].tolist()
+            heap = []
+            for slot, (u, v) in zip(slots.tolist(), ends):
+                for a, b in ((u, v), (v, u)):
+                    if dist[a] + w[slot] < dist[b]:
+                        dist[b] = dist[a] + w[slot]
+                        heapq.heappush(heap, (dist[b], b))
+            if not heap:
+                continue
+            while heap:
+                du, u = heapq.heappop(heap)
+                if du > dist[u]:
+                    continue
+                for i in range(indptr[u], indptr[u + 1]):
+                    v = adj_node[i]
+                    dv = du + w[adj_edge[i]]
+                    if dv < dist[v]:
+                        dist[v] = dv
+                        heapq.heappush(heap, (dv, v))
+            self.tables[row] = dist
+
+    def heuristic(self, target: int) -> Callable[[int], float]:
+        to_target = self.tables[:, target]
+        with np.errstate(invalid="ignore"):
+            bounds = np.abs(self.tables - to_target[:, None]).max(axis=0, initial=0.0)
+        # nodes unreachable from a landmark just like the target give no bound
+        bounds = np.nan_to_num(bounds, nan=0.0, posinf=np.inf)
+        return bounds.tolist().__getitem__
+
+    def shortest_path(self, source: str, target: str) -> list[str]:
+        graph = self.graph
+        for node in (source, target):
+            if node not in graph.node_index:
+                raise networkx.NodeNotFound(f"Node {node} not in graph")
+        self.refresh()
+        path, _ = graph.shortest_path_indices(
+            graph.node_index[source], graph.node_index[target], self._weights, self.heuristic(graph.node_index[target])
+        )
+        return [graph.node_names[i] for i in path]
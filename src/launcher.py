@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+from spade.agent import Agent
+
+from src.config import LAUNCH_CONCURRENCY, LAUNCH_RETRIES
+
+
+class AgentLauncher:
+    """
+    Starts and stops agents concurrently instead of one at a time. At most `concurrency` agents
+    talk to the XMPP server at once, failed attempts are retried with exponential backoff.
+
+    Agents are started in phases (start) through SPADE's start with auto_register, each phase waits for
+    the previous one, e.g. controllers before the managers asking them for states. Agents are passed as factories:
+    a failed start may have run setup already, so a retry starts a fresh instance instead of the same one again.
+    stop_all stops the phases in reverse order. Durations of every phase are kept in timings.
+    """
+
+    def __init__(self, concurrency: int = LAUNCH_CONCURRENCY, retries: int = LAUNCH_RETRIES, retry_delay: float = 0.5):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.phases: list[tuple[str, list[Agent]]] = []  # started phases in order
+        self.timings: dict[str, float] = {}  # phase -> seconds
+
+    async def _retry(self, action: str, name: str, attempt: int, error: Exception):
+        """
+        Waits before the next attempt, re-raises the error after the last one
+        """
+        if attempt == self.retries:
+            logging.error(f"[LAUNCHER] Failed to {action} {name} after {attempt + 1} attempts: {error!r}")
+            raise error
+        delay = self.retry_delay * 2 ** attempt
+        logging.warning(f"[LAUNCHER] Failed to {action} {name} ({error!r}), retrying in {delay:.1f} s")
+        await asyncio.sleep(delay)
+
+    async def _run(self, phase: str, action: str, items: list, call: Callable[[Any], Awaitable[Any]]) -> list:
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def run(item):
+            async with slots:
+                return await call(item)
+
+        started_at = time.perf_counter()
+        results = await asyncio.gather(*(run(item) for item in items))
+        self.timings[phase] = time.perf_counter() - started_at
+        logging.info(f"[LAUNCHER] {phase}: {action} {len(items)} agents in {self.timings[phase]:.2f} s")
+        return results
+
+    async def _start(self, factory: Callable[[], Agent]) -> Agent:
+        for attempt in range(self.retries + 1):
+            agent = factory()
+            try:
+                await agent.start(auto_register=True)
+                return agent
+            except Exception as error:
+                await self._discard(agent)
+                await self._retry("start", str(agent.jid), attempt, error)
+
+    @staticmethod
+    async def _discard(agent: Agent):
+        """
+        Kills behaviours and the connection of an agent whose start failed, it is never started again
+        """
+        try:
+            await agent.stop()
+            # stop disconnects only agents that got alive
+            client = getattr(agent, "client", None)
+            if client is not None and client.running:
+                client.stop()
+        except Exception as error:
+            logging.debug(f"[LAUNCHER] Cleanup of {agent.jid} after a failed start: {error!r}")
+
+    async def _stop(self, agent: Agent):
+        for attempt in range(self.retries + 1):
+            try:
+                return await agent.stop()
+            except Exception as error:
+                await self._retry("stop", str(agent.jid), attempt, error)
+
+    async def start(self, phase: str, factories: Iterable[Callable[[], Agent]]) -> list[Agent]:
+        """
+        Creates and starts the agents of a phase (registering their accounts), returns the started agents
+        in the order of the factories
+        """
+        agents = await self._run(phase, "start", list(factories), self._start)
+        self.phases.append((phase, agents))
+        return agents
+
+    async def stop_all(self):
+        """
+        Stops agents still alive, the last started phase first
+        """
+        for phase, agents in reversed(self.phases):
+            alive = [agent for agent in agents if agent.is_alive()]
+            await self._run(f"stop {phase}", "stop", alive, self._stop)
+        self.phases = []
+
+    def report(self) -> str:
+        return ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in self.timings.items())
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from spade.agent import Agent
+from spade.behaviour import OneShotBehaviour
+from spade.message import Message
+
+from src.config import INSTRUMENTATION
+
+# upper bounds of histogram buckets: seconds (10 us .. ~20 s, doubling) and mailbox depths
+DURATION_BUCKETS: list[float] = [1e-5 * 2 ** i for i in range(22)]
+DEPTH_BUCKETS: list[float] = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+class Histogram:
+    """
+    Fixed buckets, observing a value is a bisect and an increment. Quantiles are estimated as the upper bound
+    of the bucket they fall in (the maximum for the overflow bucket).
+    """
+
+    def __init__(self, bounds: list[float] = DURATION_BUCKETS):
+        self.bounds = bounds
+        self.counts: list[int] = [0] * (len(bounds) + 1)  # the last bucket takes values above every bound
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": [[bound, count] for bound, count in zip(self.bounds, self.counts) if count],
+            "overflow": self.counts[-1],
+        }
+
+
+class Metrics:
+    """
+    Counters and histograms of one process, keyed by "<agent class>.<name>" so vehicles of the same kind add up
+    instead of creating a series each.
+    """
+
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.started_at: float = time.time()
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float, bounds: list[float] = DURATION_BUCKETS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(bounds)
+        histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started_at,
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {name: self.histograms[name].to_dict() for name in sorted(self.histograms)},
+        }
+
+    def summary(self) -> str:
+        """
+        One line for the log: message totals and the behaviour with the slowest handling
+        """
+        received = sum(count for name, count in self.counters.items() if ".in." in name)
+        sent = sum(count for name, count in self.counters.items() if ".out." in name)
+        handling = {name: h for name, h in self.histograms.items() if name.endswith(".handle") and h.count}
+        line = f"{received} messages in, {sent} out"
+        if handling:
+            name, slowest = max(handling.items(), key=lambda item: item[1].quantile(0.99))
+            line += f", slowest handling {name[:-len('.handle')]} p99 {slowest.quantile(0.99) * 1000:.1f} ms"
+        return line
+
+
+# metrics of all agents in this process
+METRICS = Metrics()
+
+
+def msg_type(msg: Message) -> str:
+    return msg.get_metadata("msg_type") or "untyped"
+
+
+class InstrumentedAgent(Agent):
+    """
+    Agent recording into METRICS (INSTRUMENTATION in config), behaviours need no changes:
+        <agent>.in.<msg_type> / <agent>.out.<msg_type>  messages dispatched to / sent by the agent
+        <agent>.<behaviour>.queued   seconds from the arrival of a message to the behaviour receiving it
+        <agent>.<behaviour>.handle   seconds from receiving a message to the next receive (or the end of run)
+        <agent>.<behaviour>.run      seconds of a run of a periodic or cyclic behaviour
+        <agent>.<behaviour>.mailbox  messages waiting in the behaviour's queue when it receives
+    """
+
+    metrics: Optional[Metrics] = METRICS if INSTRUMENTATION else None
+
+    def dispatch(self, msg: Message):
+        if self.metrics is not None:
+            msg.received_at = time.perf_counter()
+            self.metrics.count(f"{type(self).__name__}.in.{msg_type(msg)}")
+        return super().dispatch(msg)
+
+    def add_behaviour(self, behaviour, template=None):
+        if self.metrics is not None:
+            self._instrument(behaviour)
+        super().add_behaviour(behaviour, template)
+
+    def _instrument(self, behaviour):
+        metrics = self.metrics
+        agent = type(self).__name__
+        prefix = f"{agent}.{type(behaviour).__name__}"
+        run, receive, send = behaviour.run, behaviour.receive, behaviour.send
+        handling_since: list[Optional[float]] = [None]  # when the message being handled was received
+
+        def handled():
+            if handling_since[0] is not None:
+                metrics.observe(f"{prefix}.handle", time.perf_counter() - handling_since[0])
+                handling_since[0] = None
+
+        async def timed_run():
+            started_at = time.perf_counter()
+            try:
+                await run()
+            finally:
+                handled()
+                # a one-shot behaviour usually loops for the agent's lifetime, its messages are timed by handle
+                if not isinstance(behaviour, OneShotBehaviour):
+                    metrics.observe(f"{prefix}.run", time.perf_counter() - started_at)
+
+        async def timed_receive(timeout: Optional[float] = None) -> Optional[Message]:
+            handled()
+            metrics.observe(f"{prefix}.mailbox", behaviour.mailbox_size(), DEPTH_BUCKETS)
+            msg = await receive(timeout)
+            if msg is not None:
+                handling_since[0] = time.perf_counter()
+                received_at = getattr(msg, "received_at", None)
+                if received_at is not None:
+                    metrics.observe(f"{prefix}.queued", handling_since[0] - received_at)
+            return msg
+
+        async def counted_send(msg: Message):
+            metrics.count(f"{agent}.out.{msg_type(msg)}")
+            await send(msg)
+
+        behaviour.run, behaviour.receive, behaviour.send = timed_run, timed_receive, counted_send
+
+
+class MetricsExporter:
+    """
+    Appends a snapshot of the metrics as a JSON line to path every period seconds (and once more on stop),
+    logging a one line summary instead of per-message logs.
+    """
+
+    def __init__(self, path: str, period: float, metrics: Metrics = METRICS):
+        self.path = path
+        self.period = period
+        self.metrics = metrics
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def export(self):
+        with open(self.path, "a") as file:
+            file.write(json.dumps(self.metrics.snapshot()) + "\n")
+        logging.info(f"[METRICS] {self.metrics.summary()}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.period)
+            self.export()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.export()
@@ -0,0 +1,93 @@
+from src.agents.road_condition_reporter.road_condition_delta import CONDITION_MULTIPLIERS
+from src.agents.road_condition_reporter.road_condition_protocols import RoadConditionProtocols
+from src.agents.traffic_light_controller.messages import TrafficLight, TrafficLightProtocols
+from src.codec import (
+    BOOL,
+    FLOAT,
+    FLOAT32,
+    INT,
+    JSON,
+    NODE,
+    NODES,
+    STR,
+    Choice,
+    List,
+    Map,
+    Optional,
+    Record,
+    Tuple,
+    register_schema,
+)
+
+# Layouts of message bodies sent by the agents, see the "Expected message" docstrings of the receiving behaviours.
+# Message types without a body (sync requests) and unregistered ones are sent as JSON.
+
+LIGHT = Choice(TrafficLight)
+CONDITION = Choice(CONDITION_MULTIPLIERS)
+VEHICLE_ID = INT
+
+# single light (controllers) or a batch of lights (bank controllers) under the same message types
+TRAFFIC_LIGHT_STATE = Record(
+    traffic_light=Optional(LIGHT),
+    id=Optional(INT),
+    next_change_at=Optional(FLOAT),
+    lights=Optional(List(Record(id=INT, traffic_light=LIGHT, next_change_at=Optional(FLOAT)))),
+)
+TRAFFIC_LIGHT_ID = Record(id=INT)
+ALERT = Record(edgeId=INT, startNode=NODE, endNode=NODE, alertType=STR)
+
+for msg_type in (
+    TrafficLightProtocols.SEND_TRAFFIC_LIGHT,
+    TrafficLightProtocols.SEND_TRAFFIC_LIGHT_ON_REQUEST,
+    TrafficLightProtocols.TRAFFIC_LIGHT_PHASE_CHANGE,
+):
+    register_schema(msg_type, TRAFFIC_LIGHT_STATE)
+for msg_type in (
+    TrafficLightProtocols.SUBSCRIBE_TRAFFIC_LIGHT,
+    TrafficLightProtocols.UNSUBSCRIBE_TRAFFIC_LIGHT,
+    "get_traffic_light_request",
+):
+    register_schema(msg_type, TRAFFIC_LIGHT_ID)
+register_schema("set_traffic_light", Record(traffic_light=LIGHT, id=INT, duration=Optional(FLOAT)))
+
+register_schema(RoadConditionProtocols.REQUEST_ROAD_CONDITION, Record(seq=INT, updated_graph=JSON))
+register_schema(RoadConditionProtocols.ROAD_CONDITION_DELTA, Record(seq=INT, patches=List(Tuple(INT, CONDITION, FLOAT))))
+register_schema(RoadConditionProtocols.REQUEST_ROAD_CONDITION_RESYNC, Record(last_seq=Optional(INT)))
+
+# every field of a position is required (vehicles always send all of them), Record.pack fails on a missing one
+VEHICLE_POSITION = Record(
+    node1=NODE,
+    node2=NODE,
+    vehicle_id=VEHICLE_ID,
+    isEmergency=BOOL,
+    position_on_edge=FLOAT32,
+    speed=FLOAT32,
+    waiting=BOOL,
+    reported_at=FLOAT,
+)
+VISUALIZED_POSITION = Record(
+    vehicle_id=VEHICLE_ID,
+    current_edge=Tuple(NODE, NODE),
+    position_on_edge=FLOAT32,
+    speed=FLOAT32,
+    waiting=BOOL,
+    reported_at=FLOAT,
+)
+register_schema("send_vehicle_position", VEHICLE_POSITION)
+register_schema("vehicle_position_update_response", VISUALIZED_POSITION)
+# batches of the telemetry aggregator
+register_schema("send_vehicle_position_batch", Record(positions=List(VEHICLE_POSITION)))
+register_schema("vehicle_position_update_batch", Record(positions=List(VISUALIZED_POSITION)))
+register_schema("send_route", Record(target=NODE, vehicle_id=VEHICLE_ID, isEmergency=BOOL))
+register_schema(
+    "subscribe_route", Record(target=NODE, vehicle_id=VEHICLE_ID, isEmergency=BOOL, source=Optional(NODE))
+)
+register_schema("unsubscribe_route", Record(vehicle_id=VEHICLE_ID))
+register_schema("route_response", Record(route=NODES))
+# emergency routes raising costs, shared between navigation manager shards
+register_schema("emergency_route_costs", Record(vehicle_id=VEHICLE_ID, route=NODES))
+
+register_schema("emergency_route_update", Record(version=INT, updated=Map(NODES), removed=List(VEHICLE_ID)))
+register_schema("emergency_route_response", Record(version=INT, routes=Map(NODES)))
+register_schema("emergency_alerts_response", Record(version=INT, added=List(ALERT), removed=List(INT)))
+register_schema("emergency_alerts_snapshot", Record(version=INT, alerts=List(ALERT)))
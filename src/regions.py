@@ -0,0 +1,305 @@
+import heapq
+import itertools
+from collections import deque
+from typing import Optional
+
+import networkx
+
+from src.compact_graph import CompactGraph
+from src.config import SERVER_ADDRESS
+from src.utils import RoadGraph
+
+
+def navigation_manager_jid(region: Optional[int] = None) -> str:
+    """
+    JID of the navigation manager serving the region, the single manager of an unsharded deployment for None
+    """
+    if region is None:
+        return f"navigation_manager@{SERVER_ADDRESS}"
+    return f"navigation_manager_{region}@{SERVER_ADDRESS}"
+
+
+def _adjacency(graph: RoadGraph) -> dict[str, list[str]]:
+    adjacency: dict[str, list[str]] = {node: [] for node in graph.nodes}
+    for u, v in graph.edges():
+        adjacency[u].append(v)
+        adjacency[v].append(u)
+    return adjacency
+
+
+def _hops(adjacency: dict[str, list[str]], sources: list[str]) -> dict[str, tuple[int, str]]:
+    """
+    Multi-source BFS, node -> (hops to the nearest source, that source) for reachable nodes
+    """
+    reached = {source: (0, source) for source in sources}
+    queue = deque(sources)
+    while queue:
+        u = queue.popleft()
+        hops, source = reached[u]
+        for v in adjacency[u]:
+            if v not in reached:
+                reached[v] = (hops + 1, source)
+                queue.append(v)
+    return reached
+
+
+def partition_graph(graph: RoadGraph, regions: int) -> dict[str, int]:
+    """
+    Splits nodes into connected regions of similar size: seeds are picked by farthest point selection
+    (in hops, unreachable nodes first) and every node joins the region of the nearest seed.
+    Deterministic for a given graph, so every process computes the same partition.
+    """
+    adjacency = _adjacency(graph)
+    nodes = sorted(adjacency)
+    if not nodes:
+        return {}
+    seeds = [nodes[0]]
+    while len(seeds) < min(regions, len(nodes)):
+        reached = _hops(adjacency, seeds)
+        farthest = max(nodes, key=lambda node: reached.get(node, (float("inf"),))[0])
+        if farthest in seeds:
+            break
+        seeds.append(farthest)
+    region_of_seed = {seed: i for i, seed in enumerate(seeds)}
+    reached = _hops(adjacency, seeds)
+    # components without a seed (more components than regions) go to the first region
+    return {node: region_of_seed[reached[node][1]] if node in reached else 0 for node in nodes}
+
+
+class RegionMap:
+    """
+    Partition of the road graph into regions, each served by its own navigation manager.
+    A directed edge (the way a vehicle drives it) is owned by the region of the node it leaves,
+    boundary nodes are those with a neighbour in another region.
+    """
+
+    def __init__(self, graph: RoadGraph, region_of_node: dict[str, int]):
+        self.region_of_node = region_of_node
+        self.regions: int = max(region_of_node.values(), default=-1) + 1
+        self.nodes: list[list[str]] = [[] for _ in range(self.regions)]
+        for node in sorted(region_of_node):
+            self.nodes[region_of_node[node]].append(node)
+        self.boundary: list[list[str]] = [[] for _ in range(self.regions)]
+        boundary = set()
+        for u, v in graph.edges():
+            if region_of_node[u] != region_of_node[v]:
+                boundary.update((u, v))
+        for node in sorted(boundary):
+            self.boundary[region_of_node[node]].append(node)
+        # traffic light id -> regions owning an edge with the light
+        self.light_regions: dict[int, set[int]] = {}
+        for u, v, data in graph.edges(data=True):
+            id_ = data.get("traffic_light_id")
+            if id_ is not None:
+                self.light_regions.setdefault(id_, set()).update((region_of_node[u], region_of_node[v]))
+
+    @classmethod
+    def partition(cls, graph: RoadGraph, regions: int) -> "RegionMap":
+        return cls(graph, partition_graph(graph, regions))
+
+    def region_of(self, node: str) -> int:
+        return self.region_of_node[node]
+
+    def edge_region(self, edge: tuple[str, str]) -> int:
+        return self.region_of_node[edge[0]]
+
+    def manager_jids(self) -> list[str]:
+        return [navigation_manager_jid(region) for region in range(self.regions)]
+
+    def light_manager_jids(self, traffic_light_id: int) -> list[str]:
+        """
+        JIDs of managers owning an edge with the light, they get its states
+        """
+        return [navigation_manager_jid(region) for region in sorted(self.light_regions.get(traffic_light_id, ()))]
+
+
+class BoundaryRouter:
+    """
+    Routing over a RegionMap by stitching per-region paths. For every boundary node the in-region shortest path
+    tree is precomputed, so a boundary node knows its costs to the other boundary nodes of its region
+    (and to every node of it). A route is a Dijkstra over the overlay of boundary nodes, connected by these
+    boundary-to-boundary costs and by the edges crossing regions; the source and target join the overlay
+    through the trees of the boundary nodes of their regions. Overlay hops are expanded into the stored paths.
+
+    Results are exact shortest paths. After a cost change (refresh) only trees of regions with changed
+    in-region edges are rebuilt, costs of crossing edges are read on every query.
+    """
+
+    def __init__(self, graph: RoadGraph, regions: RegionMap, weight: str = "cost"):
+        self.graph = graph
+        self.regions = regions
+        self.weight = weight
+        region_of = regions.region_of_node
+        self.edges: list[tuple[str, str]] = list(graph.edges())
+        # node -> [(neighbour, edge index)], in-region and crossing neighbours apart
+        self.inner: dict[str, list[tuple[str, int]]] = {node: [] for node in region_of}
+        self.crossing: dict[str, list[tuple[str, int]]] = {node: [] for node in region_of}
+        self.edge_regions: list[Optional[int]] = []
+        for i, (u, v) in enumerate(self.edges):
+            same = region_of[u] == region_of[v]
+            adjacency = self.inner if same else self.crossing
+            adjacency[u].append((v, i))
+            adjacency[v].append((u, i))
+            self.edge_regions.append(region_of[u] if same else None)
+        self.weights: list[float] = self._read_weights()
+        # region -> boundary node -> (costs, predecessors) of its in-region shortest path tree
+        self.trees: list[dict[str, tuple[dict[str, float], dict[str, str]]]] = [
+            {} for _ in range(regions.regions)
+        ]
+        self.shortcuts: dict[str, list[tuple[str, float]]] = {}
+        for region in range(regions.regions):
+            self._build(region)
+        self.version: Optional[int] = None  # graph version the trees were refreshed for
+
+    def _read_weights(self) -> list[float]:
+        if isinstance(self.graph, CompactGraph):
+            return self.graph.weights(self.weight).tolist()
+        return [data[self.weight] for _, _, data in self.graph.edges(data=True)]
+
+    def _tree(self, source: str, target: Optional[str] = None) -> tuple[dict[str, float], dict[str, str]]:
+        """
+        In-region Dijkstra from source, stops early once the target is settled
+        """
+        inner, weights = self.inner, self.weights
+        dist = {source: 0.0}
+        prev: dict[str, str] = {}
+        heap = [(0.0, source)]
+        while heap:
+            du, u = heapq.heappop(heap)
+            if du > dist[u]:
+                continue
+            if u == target:
+                break
+            for v, i in inner[u]:
+                dv = du + weights[i]
+                if dv < dist.get(v, float("inf")):
+                    dist[v] = dv
+                    prev[v] = u
+                    heapq.heappush(heap, (dv, v))
+        return dist, prev
+
+    def _build(self, region: int):
+        boundary = self.regions.boundary[region]
+        self.trees[region] = {node: self._tree(node) for node in boundary}
+        # boundary-to-boundary costs of the region as overlay edges
+        for node, (costs, _) in self.trees[region].items():
+            self.shortcuts[node] = [(other, costs[other]) for other in boundary if other != node and other in costs]
+
+    def same_topology(self, graph: RoadGraph) -> bool:
+        return list(graph.edges()) == self.edges
+
+    def for_graph(self, graph: RoadGraph) -> "BoundaryRouter":
+        """
+        Router for a graph with the same edges (e.g. a copy with other costs), only changed regions are rebuilt
+        """
+        if not self.same_topology(graph):
+            return BoundaryRouter(graph, self.regions, self.weight)
+        router = BoundaryRouter.__new__(BoundaryRouter)
+        router.__dict__.update(self.__dict__)
+        router.graph = graph
+        router.trees = list(self.trees)
+        router.shortcuts = dict(self.shortcuts)
+        router.version = None
+        return router
+
+    def refresh(self, version: Optional[int] = None) -> int:
+        """
+        Rebuilds trees of regions whose in-region costs changed, returns their number.
+        With a version (of the graph costs), costs are compared only when it differs from the last refresh.
+        """
+        if version is not None and version == self.version:
+            return 0
+        self.version = version
+        weights = self._read_weights()
+        dirty = {
+            self.edge_regions[i]
+            for i, (old, new) in enumerate(zip(self.weights, weights))
+            if old != new and self.edge_regions[i] is not None
+        }
+        self.weights = weights
+        for region in dirty:
+            self._build(region)
+        return len(dirty)
+
+    @staticmethod
+    def _walk(prev: dict[str, str], node: str, root: str) -> list[str]:
+        """
+        Path from node back to the root of a shortest path tree
+        """
+        path = [node]
+        while path[-1] != root:
+            path.append(prev[path[-1]])
+        return path
+
+    def shortest_path(self, source: str, target: str) -> list[str]:
+        region_of = self.regions.region_of_node
+        for node in (source, target):
+            if node not in region_of:
+                raise networkx.NodeNotFound(f"Node {node} not in graph")
+        source_region, target_region = region_of[source], region_of[target]
+        source_trees, target_trees = self.trees[source_region], self.trees[target_region]
+        # overlay labels: boundary node (or the target) -> cost, and how it was reached
+        dist: dict[Optional[str], float] = {}
+        via: dict[Optional[str], tuple] = {}
+        heap: list[tuple[float, int, Optional[str]]] = []
+        counter = itertools.count()
+
+        def relax(node: Optional[str], cost: float, how: tuple):
+            if cost < dist.get(node, float("inf")):
+                dist[node] = cost
+                via[node] = how
+                heapq.heappush(heap, (cost, next(counter), node))
+
+        # the target is settled only as the overlay node None, so a boundary target is still expanded
+        if source_region == target_region:
+            direct, prev = self._tree(source, target)
+            if target in direct:
+                relax(None, direct[target], ("direct", prev))
+        for node, (costs, _) in source_trees.items():
+            if source in costs:
+                relax(node, costs[source], ("source",))
+        settled = set()
+        while heap:
+            cost, _, node = heapq.heappop(heap)
+            if node in settled or cost > dist[node]:
+                continue
+            settled.add(node)
+            if node is None:
+                break
+            if region_of[node] == target_region:
+                costs = target_trees[node][0]
+                if target in costs:
+                    relax(None, cost + costs[target], ("target", node))
+            for other, shortcut in self.shortcuts[node]:
+                relax(other, cost + shortcut, ("inner", node))
+            for other, i in self.crossing[node]:
+                relax(other, cost + self.weights[i], ("crossing", node))
+        if None not in settled:
+            raise networkx.NetworkXNoPath(f"No path between {source} and {target}.")
+        return self._expand(source, target, via, source_region, target_region)
+
+    def _expand(
+        self, source: str, target: str, via: dict[Optional[str], tuple], source_region: int, target_region: int
+    ) -> list[str]:
+        how = via[None]
+        if how[0] == "direct":
+            return list(reversed(self._walk(how[1], target, source)))
+        # backwards from the target, every piece is appended in reverse order
+        node = how[1]
+        path = self._walk(self.trees[target_region][node][1], target, node)
+        while True:
+            how = via[node]
+            if how[0] == "source":
+                # the tree of the first boundary node leads from the source to it
+                path.pop()
+                path.extend(reversed(self._walk(self.trees[source_region][node][1], source, node)))
+                break
+            previous = how[1]
+            if how[0] == "inner":
+                path.pop()
+                path.extend(self._walk(self.trees[self.regions.region_of(node)][previous][1], node, previous))
+            else:
+                path.append(previous)
+            node = previous
+        path.reverse()
+        return path
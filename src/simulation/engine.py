@@ -0,0 +1,310 @@
+import heapq
+import itertools
+import logging
+import math
+from typing import Callable, Optional
+
+import numpy as np
+
+from src.agents.navigation_manager.route_planner import RoutePlanner
+from src.agents.traffic_light_controller.messages import TrafficLight
+from src.agents.traffic_light_controller.phase_scheduler import PhaseScheduler
+from src.agents.traffic_light_controller.physical_traffic_light import PhysicalTrafficLight
+from src.agents.traffic_light_controller.traffic_light_bank import TrafficLightBank
+from src.agents.vehicle_navigator.vehicle_simulator import VehicleSimulator
+from src.compact_graph import CompactGraph
+from src.utils import RoadGraph
+from .fleet import FleetSimulator, passable_mask
+
+
+class VirtualClock:
+    def __init__(self, start: float = 0.0):
+        self.now: float = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SimulatedVehicle:
+    def __init__(self, vehicle_id: int, simulator: VehicleSimulator, target_node: str, isEmergency: bool):
+        self.vehicle_id = vehicle_id
+        self.simulator = simulator
+        self.target_node = target_node
+        self.isEmergency = isEmergency
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.waited: float = 0  # seconds spent waiting for green light
+        self.fleet_index: Optional[int] = None  # index in the FleetSimulator once it joined
+
+
+class HeadlessSimulation:
+    """
+    Discrete-event simulation of vehicles, traffic lights and the navigation manager's routing logic
+    in virtual time, without XMPP. Uses the same periods as the agents
+    (vehicle step every 0.1 s, position report every 1 s), but messages are delivered instantly.
+    Road condition updates are not simulated.
+
+    With fleet=True (graph must be a CompactGraph) vehicles are not stepped one by one: a FleetSimulator advances
+    all of them with one vectorized tick every VEHICLE_STEP_PERIOD. Vehicles join the fleet on the first tick after
+    they start, ticks run on a common grid instead of each vehicle's own start time.
+    """
+
+    VEHICLE_STEP_PERIOD = 0.1  # VehicleNavigator.UpdateVehiclePosition
+    POSITION_REPORT_PERIOD = 1  # VehicleNavigator.SendPosition
+
+    def __init__(
+        self,
+        graph: RoadGraph,
+        traffic_lights: dict[int, PhysicalTrafficLight],
+        record_trajectories: bool = True,
+        green_wave: bool = True,
+        fleet: bool = False,
+    ):
+        self.clock = VirtualClock()
+        self.planner = RoutePlanner(
+            graph, {id_: ptl.simulator for id_, ptl in traffic_lights.items()} if green_wave else None
+        )
+        self.lights = TrafficLightBank(traffic_lights, PhaseScheduler(clock=self.clock))
+        self.lights.start()
+        self.vehicles: dict[int, SimulatedVehicle] = {}
+        self.record_trajectories = record_trajectories
+        # (time, vehicle id, edge, position on edge, status)
+        self.trajectories: list[tuple[float, int, tuple[str, str], float, str]] = []
+        self._events: list[tuple[float, int, Callable[[], None]]] = []
+        self._counter = itertools.count()
+        self.fleet: Optional[FleetSimulator] = None
+        if fleet:
+            if not isinstance(graph, CompactGraph):
+                raise TypeError("The fleet simulation needs a CompactGraph")
+            self.fleet = FleetSimulator(graph)
+        self.fleet_vehicles: list[SimulatedVehicle] = []  # by fleet index
+        # started vehicles with their routes, joining the fleet on the next tick
+        self._fleet_pending: dict[int, tuple[SimulatedVehicle, list[str]]] = {}
+        self._fleet_ticking = False
+
+    @property
+    def now(self) -> float:
+        return self.clock.now
+
+    def schedule_at(self, at: float, callback: Callable[[], None]):
+        heapq.heappush(self._events, (at, next(self._counter), callback))
+
+    def add_vehicle(
+        self, vehicle_id: int, simulator: VehicleSimulator, target_node: str, isEmergency: bool = False, start_at: float = 0.0
+    ) -> SimulatedVehicle:
+        vehicle = SimulatedVehicle(vehicle_id, simulator, target_node, isEmergency)
+        self.vehicles[vehicle_id] = vehicle
+        self.schedule_at(start_at, lambda: self._start_vehicle(vehicle))
+        return vehicle
+
+    def _start_vehicle(self, vehicle: SimulatedVehicle):
+        vehicle.started_at = self.now
+        route, costs_changed = self.planner.subscribe(
+            vehicle.vehicle_id, vehicle.target_node, vehicle.isEmergency, vehicle.simulator.start_node
+        )
+        if self.fleet is not None:
+            self._join_fleet(vehicle, route)
+            if costs_changed:
+                self._push_route_updates()
+            # after the tick the vehicle joins in, as the first report follows the first step below
+            self.schedule_at(self.now, lambda: self._report_position(vehicle, 0))
+            return
+        vehicle.simulator.plan = route
+        if costs_changed:
+            self._push_route_updates()
+        self._step_vehicle(vehicle, 0)
+        self._report_position(vehicle, 0)
+
+    def _push_route_updates(self):
+        if self.fleet is None:
+            for vehicleId, route in self.planner.changed_routes():
+                self.vehicles[vehicleId].simulator.plan = route
+            return
+        indices, routes = [], []
+        for vehicleId, route in self.planner.changed_routes():
+            vehicle = self.vehicles[vehicleId]
+            if vehicle.fleet_index is None:
+                self._fleet_pending[vehicleId] = (vehicle, route)
+            else:
+                indices.append(vehicle.fleet_index)
+                routes.append(route)
+        self.fleet.set_routes(indices, routes)
+
+    def _join_fleet(self, vehicle: SimulatedVehicle, route: list[str]):
+        self._fleet_pending[vehicle.vehicle_id] = (vehicle, route)
+        if not self._fleet_ticking:
+            self._fleet_ticking = True
+            started_at = self.now
+            self.schedule_at(started_at, lambda: self._tick_fleet(started_at, 0))
+
+    def _tick_fleet(self, started_at: float, k: int):
+        fleet = self.fleet
+        if self._fleet_pending:
+            joining = list(self._fleet_pending.values())
+            self._fleet_pending = {}
+            indices = fleet.add_vehicles([route for _, route in joining])
+            for (vehicle, _), index in zip(joining, indices.tolist()):
+                vehicle.fleet_index = index
+                self.fleet_vehicles.append(vehicle)
+        ticked = fleet.active.copy()
+        lights = self.lights
+        finished = fleet.tick(
+            self.VEHICLE_STEP_PERIOD,
+            passable_mask({id_: lights.get_traffic_light(id_) for id_ in lights.physical_traffic_lights}),
+        )
+        if self.record_trajectories:
+            stopped = set(finished.tolist())
+            for index in np.flatnonzero(ticked).tolist():
+                self.trajectories.append((
+                    self.now,
+                    self.fleet_vehicles[index].vehicle_id,
+                    fleet.vehicle_edge(index),
+                    float(fleet.position[index]),
+                    "STOP" if index in stopped else "IN_PROGRESS",
+                ))
+        for index in finished.tolist():
+            vehicle = self.fleet_vehicles[index]
+            vehicle.finished_at = self.now
+            self.planner.unsubscribe(vehicle.vehicle_id)
+        if not fleet.active.any() and not self._fleet_pending:
+            self._fleet_ticking = False
+            return
+        # absolute times, so the periods do not drift
+        self.schedule_at(started_at + (k + 1) * self.VEHICLE_STEP_PERIOD, lambda: self._tick_fleet(started_at, k + 1))
+
+    def vehicle_position(self, vehicle: SimulatedVehicle) -> tuple[Optional[tuple[str, str]], float]:
+        """
+        Current edge (None before the first step) and position on it
+        """
+        if self.fleet is None:
+            return vehicle.simulator.vehicle_edge, vehicle.simulator.vehicle_position_in_edge
+        if vehicle.fleet_index is None:
+            return None, 0.0
+        return self.fleet.vehicle_edge(vehicle.fleet_index), float(self.fleet.position[vehicle.fleet_index])
+
+    def waited(self, vehicle: SimulatedVehicle) -> float:
+        if self.fleet is None or vehicle.fleet_index is None:
+            return vehicle.waited
+        return float(self.fleet.waited[vehicle.fleet_index])
+
+    def route(self, vehicle: SimulatedVehicle) -> Optional[list[str]]:
+        if self.fleet is None or vehicle.fleet_index is None:
+            return vehicle.simulator.plan
+        return self.fleet.route(vehicle.fleet_index)
+
+    def _step_vehicle(self, vehicle: SimulatedVehicle, k: int):
+        simulator = vehicle.simulator
+        edge, position, status = simulator.step_sync(self.VEHICLE_STEP_PERIOD, self.lights.get_traffic_light)
+        if edge is not None and self.record_trajectories:
+            self.trajectories.append((self.now, vehicle.vehicle_id, edge, position, status))
+        if simulator.waiting_at_light and status == "IN_PROGRESS":
+            vehicle.waited += self.VEHICLE_STEP_PERIOD
+        if status == "STOP":
+            vehicle.finished_at = self.now
+            self.planner.unsubscribe(vehicle.vehicle_id)
+            return
+        # absolute times, so the periods do not drift
+        self.schedule_at(vehicle.started_at + (k + 1) * self.VEHICLE_STEP_PERIOD, lambda: self._step_vehicle(vehicle, k + 1))
+
+    def _report_position(self, vehicle: SimulatedVehicle, k: int):
+        if vehicle.finished_at is not None:
+            return
+        edge, position = self.vehicle_position(vehicle)
+        if edge is not None:
+            if vehicle.isEmergency and self.planner.green_wave is not None:
+                self._plan_green_wave(vehicle, edge, position)
+            elif vehicle.isEmergency:
+                for id_ in self.planner.lights_to_preempt(vehicle.vehicle_id, edge, self.now):
+                    self.lights.set_by_manager(id_, TrafficLight.GREEN)
+            self.planner.update_vehicle_position(vehicle.vehicle_id, edge)
+        self.schedule_at(
+            vehicle.started_at + (k + 1) * self.POSITION_REPORT_PERIOD, lambda: self._report_position(vehicle, k + 1)
+        )
+
+    def _plan_green_wave(self, vehicle: SimulatedVehicle, edge: tuple[str, str], position: float):
+        green_wave = self.planner.green_wave
+        # the manager learns states and next changes from periodic reports, here they are read directly
+        for id_ in self.lights.physical_traffic_lights:
+            green_wave.observe(id_, self.lights.get_traffic_light(id_), self.lights.scheduler.deadline(id_), self.now)
+        simulator = vehicle.simulator
+        changes = self.planner.plan_green_wave(
+            vehicle.vehicle_id, edge, position, simulator.vehicle_speed_per_second, self.now
+        )
+        for id_, window in changes:
+            if window is not None:
+                self.schedule_at(
+                    window[0], lambda id_=id_, window=window: self._send_green(vehicle.vehicle_id, id_, window)
+                )
+
+    def _send_green(self, vehicle_id: int, id_: int, window: tuple[float, float]):
+        green_wave = self.planner.green_wave
+        # replaced or cancelled windows are skipped
+        if green_wave.planned(vehicle_id, id_) != window:
+            return
+        green_wave.mark_sent(vehicle_id, id_, window)
+        # overlapping windows of other vehicles on the light are not cut short
+        self.lights.set_by_manager(id_, TrafficLight.GREEN, green_wave.green_until(id_, self.now) - self.now)
+
+    def record_frames(self, recorder, period: float = VEHICLE_STEP_PERIOD, start_at: float = 0.0):
+        """
+        Hands a frame (time, vehicle positions, light states, road conditions) to recorder.record every period
+        until all vehicles finished, e.g. a BackgroundRecorder writing a trajectory file
+        """
+        def capture(k: int):
+            vehicles = {}
+            for vehicle_id, vehicle in self.vehicles.items():
+                edge, position = self.vehicle_position(vehicle)
+                if edge is None or vehicle.finished_at is not None:
+                    continue
+                distance = vehicle.simulator.graph.get_edge_data(*edge)["distance"]
+                fraction = min(1.0, position / distance) if distance else 1.0
+                vehicles[vehicle_id] = (edge, fraction)
+            lights = {id_: self.lights.get_traffic_light(id_) for id_ in self.lights.physical_traffic_lights}
+            # road conditions are not simulated
+            recorder.record(self.now, vehicles, lights, {})
+            if all(v.finished_at is not None for v in self.vehicles.values()):
+                return
+            self.schedule_at(start_at + (k + 1) * period, lambda: capture(k + 1))
+
+        self.schedule_at(start_at, lambda: capture(0))
+
+    def run(self, until: float) -> dict:
+        """
+        Processes events up to the given virtual time, returns summary
+        """
+        scheduler = self.lights.scheduler
+        while True:
+            next_event = self._events[0][0] if self._events else math.inf
+            next_light = scheduler.next_deadline()
+            next_light = math.inf if next_light is None else next_light
+            at = min(next_event, next_light)
+            if at > until or at == math.inf:
+                self.clock.now = max(self.clock.now, min(until, at))
+                break
+            self.clock.now = at
+            if next_light <= next_event:
+                for id_, event in scheduler.pop_due(at):
+                    self.lights.handle_event(id_, event)
+            else:
+                _, _, callback = heapq.heappop(self._events)
+                callback()
+            if all(v.finished_at is not None for v in self.vehicles.values()) and not self._events:
+                break
+        logging.info(f"[SIMULATION] Simulated {self.now:.1f} s")
+        return self.summary()
+
+    def summary(self) -> dict:
+        return {
+            "time": self.now,
+            "vehicles": {
+                vehicle_id: {
+                    "isEmergency": v.isEmergency,
+                    "route": self.planner.route_subscriptions.get(vehicle_id, {}).get("route", self.route(v)),
+                    "finished_at": v.finished_at,
+                    "travel_time": None if v.finished_at is None else v.finished_at - v.started_at,
+                    "waited": round(self.waited(v), 3),
+                }
+                for vehicle_id, v in self.vehicles.items()
+            },
+            "route_cache": self.planner.route_cache.stats(),
+        }
@@ -0,0 +1,164 @@
+from typing import Iterable, Optional
+
+import numpy as np
+
+from src.agents.traffic_light_controller.messages import TrafficLight
+from src.compact_graph import CompactGraph
+
+
+def passable_mask(traffic_lights: dict[int, Optional[TrafficLight]], size: Optional[int] = None) -> np.ndarray:
+    """
+    Boolean array indexed by traffic light id, True where the light lets vehicles in
+    (anything but RED, same rule as VehicleSimulator). Unknown lights are not passable.
+    """
+    if size is None:
+        size = max(traffic_lights, default=-1) + 1
+    mask = np.zeros(size, dtype=bool)
+    for id_, light in traffic_lights.items():
+        if 0 <= id_ < size:
+            mask[id_] = light is not None and light != TrafficLight.RED
+    return mask
+
+
+class FleetSimulator:
+    """
+    Kinematics of a whole fleet in NumPy arrays, advanced with one vectorized tick.
+    Follows VehicleSimulator rules: vehicles move at constant speed along the edges of their route,
+    stop at the end of an edge until the light of the next edge is passable and finish at the end of the route.
+
+    Routes are stored concatenated (as edge slots of the CompactGraph and as node indices),
+    each vehicle keeps a cursor into its route.
+    """
+
+    def __init__(self, graph: CompactGraph, speed: float = 3):
+        self.graph = graph
+        self.default_speed = speed
+        self.route_edges = np.zeros(0, dtype=np.int32)  # edge slots of all routes
+        self.route_nodes = np.zeros(0, dtype=np.int32)  # node indices of all routes
+        self.edge_offset = np.zeros(0, dtype=np.int64)  # start of the vehicle's route in route_edges
+        self.node_offset = np.zeros(0, dtype=np.int64)  # start of the vehicle's route in route_nodes
+        self.route_len = np.zeros(0, dtype=np.int64)  # edges in the vehicle's route
+        self.cursor = np.zeros(0, dtype=np.int64)  # index of the current edge within the route
+        self.position = np.zeros(0, dtype=np.float64)  # position on the current edge
+        self.speed = np.zeros(0, dtype=np.float64)
+        self.active = np.zeros(0, dtype=bool)
+        self.waiting = np.zeros(0, dtype=bool)  # stopped at the end of an edge by a light
+        self.waited = np.zeros(0, dtype=np.float64)  # seconds spent waiting for green light
+
+    def __len__(self) -> int:
+        return len(self.cursor)
+
+    def add_vehicles(self, routes: Iterable[list[str]], speed: Optional[float] = None) -> np.ndarray:
+        """
+        Adds vehicles following the given routes (node names, at least one edge each),
+        returns their indices. Add vehicles in batches, arrays are reallocated on every call.
+        """
+        edge_offset, node_offset, lengths = self._append_routes(routes)
+        count = len(lengths)
+        first = len(self)
+
+        self.edge_offset = np.concatenate([self.edge_offset, edge_offset])
+        self.node_offset = np.concatenate([self.node_offset, node_offset])
+        self.route_len = np.concatenate([self.route_len, lengths])
+        self.cursor = np.concatenate([self.cursor, np.zeros(count, dtype=np.int64)])
+        self.position = np.concatenate([self.position, np.zeros(count)])
+        self.speed = np.concatenate([self.speed, np.full(count, self.default_speed if speed is None else speed, dtype=np.float64)])
+        self.active = np.concatenate([self.active, np.ones(count, dtype=bool)])
+        self.waiting = np.concatenate([self.waiting, np.zeros(count, dtype=bool)])
+        self.waited = np.concatenate([self.waited, np.zeros(count)])
+        return np.arange(first, first + count)
+
+    def set_routes(self, indices: Iterable[int], routes: Iterable[list[str]]):
+        """
+        Replaces routes of the given vehicles, like VehicleSimulator.plan the cursor is rebased onto the start node
+        of the current edge in the new route (new routes start there, see RoutePlanner.vehicle_source).
+        Replaced routes stay unused in the route arrays.
+        """
+        indices = np.asarray(list(indices), dtype=np.int64)
+        routes = list(routes)
+        if not len(indices):
+            return
+        start = self.route_nodes[self.node_offset[indices] + self.cursor[indices]]
+        names = self.graph.node_names
+        cursor = [route.index(names[node]) for route, node in zip(routes, start.tolist())]
+        edge_offset, node_offset, lengths = self._append_routes(routes)
+        self.edge_offset[indices] = edge_offset
+        self.node_offset[indices] = node_offset
+        self.route_len[indices] = lengths
+        self.cursor[indices] = cursor
+
+    def _append_routes(self, routes: Iterable[list[str]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Appends routes to the route arrays, returns their edge offsets, node offsets and lengths in edges
+        """
+        graph = self.graph
+        nodes, lengths = [], []
+        for route in routes:
+            if len(route) < 2:
+                raise ValueError(f"Route {route} has no edges")
+            nodes.extend(graph.node_index[node] for node in route)
+            lengths.append(len(route) - 1)
+        nodes = np.asarray(nodes, dtype=np.int32)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        # consecutive node pairs that belong to the same route
+        is_edge = np.ones(max(len(nodes) - 1, 0), dtype=bool)
+        is_edge[np.cumsum(lengths + 1)[:-1] - 1] = False
+        edges = graph.edge_slots(nodes[:-1][is_edge], nodes[1:][is_edge])
+        if (edges < 0).any():
+            raise ValueError("Route uses an edge that is not in the graph")
+
+        edge_offset = len(self.route_edges) + np.cumsum(lengths) - lengths
+        node_offset = len(self.route_nodes) + np.cumsum(lengths + 1) - (lengths + 1)
+        self.route_edges = np.concatenate([self.route_edges, edges.astype(np.int32)])
+        self.route_nodes = np.concatenate([self.route_nodes, nodes])
+        return edge_offset, node_offset, lengths
+
+    def route(self, index: int) -> list[str]:
+        start = self.node_offset[index]
+        return [self.graph.node_names[node] for node in self.route_nodes[start:start + self.route_len[index] + 1].tolist()]
+
+    def vehicle_edge(self, index: int) -> tuple[str, str]:
+        """
+        Current edge of the vehicle as node names, in driving direction
+        """
+        start = self.node_offset[index] + self.cursor[index]
+        return self.graph.node_names[self.route_nodes[start]], self.graph.node_names[self.route_nodes[start + 1]]
+
+    def current_edges(self) -> np.ndarray:
+        return self.route_edges[self.edge_offset + self.cursor]
+
+    def current_nodes(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (from node, to node) indices of the current edge of every vehicle, in driving direction
+        """
+        start = self.node_offset + self.cursor
+        return self.route_nodes[start], self.route_nodes[start + 1]
+
+    def tick(self, seconds: float, passable: np.ndarray) -> np.ndarray:
+        """
+        Advances all active vehicles, passable is indexed by traffic light id (see passable_mask).
+        Returns indices of vehicles that finished their route in this tick.
+        """
+        active = self.active
+        edge = self.current_edges()
+        length = self.graph.distance[edge]
+        self.position = np.where(active, np.minimum(self.position + self.speed * seconds, length), self.position)
+
+        at_end = active & (self.position >= length)
+        last = self.cursor >= self.route_len - 1
+        finished = at_end & last
+        wants_next = at_end & ~last
+
+        next_edge = self.route_edges[self.edge_offset + np.minimum(self.cursor + 1, self.route_len - 1)]
+        light = self.graph.traffic_light_id[next_edge]
+        known = (light >= 0) & (light < len(passable))
+        green = light < 0
+        green[known] = passable[light[known]]
+
+        moves = wants_next & green
+        self.cursor[moves] += 1
+        self.position[moves] = 0
+        self.waiting = wants_next & ~green
+        self.waited[self.waiting] += seconds
+        self.active = active & ~finished
+        return np.flatnonzero(finished)
@@ -5,7 +5,10 @@ from src.agents.traffic_light_controller.physical_traffic_light import (
     TrafficLightSimulator,
     TrafficLight,
 )
-from typing import Dict
+from src.compact_graph import CompactGraph
+from typing import Dict, Union
+
+RoadGraph = Union[networkx.Graph, CompactGraph]
 
 
 def load_graph(path: str) -> networkx.Graph:
@@ -21,6 +24,23 @@ def load_graph(path: str) -> networkx.Graph:
     return g
 
 
+def load_compact_graph(path: str) -> CompactGraph:
+    return CompactGraph.from_networkx(load_graph(path))
+
+
+def shortest_path(graph: RoadGraph, source: str, target: str, weight: str = "cost") -> list[str]:
+    if isinstance(graph, CompactGraph):
+        return graph.shortest_path(source, target, weight=weight)
+    return networkx.shortest_path(graph, source=source, target=target, weight=weight)
+
+
+def update_edge(graph: RoadGraph, u: str, v: str, **attrs):
+    if isinstance(graph, CompactGraph):
+        graph.update_edge(u, v, **attrs)
+    else:
+        graph[u][v].update(attrs)
+
+
 def load_lights(path: str) -> Dict[int, PhysicalTrafficLight]:
     """
     returns mapping id -> physical traffic light object